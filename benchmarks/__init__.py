@@ -0,0 +1,7 @@
+"""
+Benchmarks of flexlate-dev on synthetic templates, using pytest-benchmark.
+
+Run them with ``just benchmark``, which saves the results as JSON in .benchmarks.
+Compare against earlier saved results with ``just benchmark --benchmark-compare``.
+The size of the synthetic templates is set with the --synthetic-* options.
+"""
@@ -0,0 +1,4 @@
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).parent
+GENERATED_FILES_DIR = BENCHMARKS_DIR / "generated"
@@ -0,0 +1,96 @@
+import shutil
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+from flexlate import template_path
+from git import Repo
+
+from benchmarks.config import GENERATED_FILES_DIR
+from benchmarks.synthetic import (
+    SyntheticTemplateSpec,
+    TemplateKind,
+    generate_synthetic_template,
+)
+from flexlate_dev.gitutils import stage_and_commit_all
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("synthetic templates")
+    defaults = SyntheticTemplateSpec(kind=TemplateKind.COPIER)
+    group.addoption(
+        "--synthetic-files",
+        type=int,
+        default=defaults.num_files,
+        help="Number of files in each synthetic template",
+    )
+    group.addoption(
+        "--synthetic-depth",
+        type=int,
+        default=defaults.depth,
+        help="Maximum directory depth of the files in each synthetic template",
+    )
+    group.addoption(
+        "--synthetic-file-size",
+        type=int,
+        default=defaults.file_size,
+        help="Approximate size in bytes of each file in the synthetic templates",
+    )
+    group.addoption(
+        "--synthetic-templated-ratio",
+        type=float,
+        default=defaults.templated_ratio,
+        help="Share of the files in the synthetic templates that are templated",
+    )
+
+
+@pytest.fixture(scope="function", autouse=True)
+def before_each(monkeypatch):
+    # Set git committer for generated repos, same as the tests
+    monkeypatch.setenv("GIT_AUTHOR_NAME", "flexlate-dev-git")
+    monkeypatch.setenv("GIT_COMMITTER_NAME", "flexlate-dev-git")
+    monkeypatch.setenv("GIT_AUTHOR_EMAIL", "flexlate-dev-git@nickderobertis.com")
+    monkeypatch.setenv("GIT_COMMITTER_EMAIL", "flexlate-dev-git@nickderobertis.com")
+    monkeypatch.setattr(template_path, "CLONED_REPO_FOLDER", GENERATED_FILES_DIR)
+    if GENERATED_FILES_DIR.exists():
+        shutil.rmtree(GENERATED_FILES_DIR)
+    GENERATED_FILES_DIR.mkdir()
+    yield
+    shutil.rmtree(GENERATED_FILES_DIR)
+
+
+@pytest.fixture(params=list(TemplateKind), ids=lambda kind: kind.value)
+def synthetic_spec(request) -> SyntheticTemplateSpec:
+    return _create_spec_from_options(request.config, request.param)
+
+
+@pytest.fixture
+def copier_spec(request) -> SyntheticTemplateSpec:
+    return _create_spec_from_options(request.config, TemplateKind.COPIER)
+
+
+@pytest.fixture
+def synthetic_template_path(
+    synthetic_spec: SyntheticTemplateSpec,
+) -> Iterator[Path]:
+    yield generate_synthetic_template(synthetic_spec, GENERATED_FILES_DIR / "template")
+
+
+@pytest.fixture
+def copier_template_repo(copier_spec: SyntheticTemplateSpec) -> Iterator[Repo]:
+    path = generate_synthetic_template(copier_spec, GENERATED_FILES_DIR / "template")
+    repo = Repo.init(path)
+    stage_and_commit_all(repo, "Initial commit")
+    yield repo
+
+
+def _create_spec_from_options(
+    config: pytest.Config, kind: TemplateKind
+) -> SyntheticTemplateSpec:
+    return SyntheticTemplateSpec(
+        kind=kind,
+        num_files=config.option.synthetic_files,
+        depth=config.option.synthetic_depth,
+        file_size=config.option.synthetic_file_size,
+        templated_ratio=config.option.synthetic_templated_ratio,
+    )
@@ -0,0 +1,127 @@
+"""
+Generates synthetic copier and cookiecutter templates of a configurable size to
+benchmark against.
+"""
+import json
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from typing import Final
+
+# Folder name of the generated project for both kinds of template
+PROJECT_FOLDER_NAME: Final[str] = "project"
+VARIABLE_NAME: Final[str] = "q1"
+VARIABLE_VALUE: Final[str] = "a1"
+COPIER_TEMPLATES_SUFFIX: Final[str] = ".jinja"
+FILLER_LINE: Final[str] = "The quick brown fox jumps over the lazy dog.\n"
+
+
+class TemplateKind(str, Enum):
+    COPIER = "copier"
+    COOKIECUTTER = "cookiecutter"
+
+
+@dataclass(frozen=True)
+class SyntheticTemplateSpec:
+    """
+    :param num_files: Number of files in the template, excluding its configuration
+    :param depth: Maximum number of directories a file is nested in
+    :param file_size: Approximate size of each file in bytes
+    :param templated_ratio: Share of the files that contain template variables
+    """
+
+    kind: TemplateKind
+    num_files: int = 200
+    depth: int = 3
+    file_size: int = 2048
+    templated_ratio: float = 0.25
+
+    def is_templated(self, index: int) -> bool:
+        # Spreads the templated files evenly through the template
+        return int((index + 1) * self.templated_ratio) > int(
+            index * self.templated_ratio
+        )
+
+    def relative_output_path(self, index: int) -> Path:
+        level = index % (self.depth + 1)
+        directories = [f"dir{i}_{index % 3}" for i in range(level)]
+        return Path(*directories, f"file{index}.txt")
+
+    def template_file_path(self, template_path: Path, index: int) -> Path:
+        """
+        Path to the file in the template that renders the file with the index
+        """
+        relative_path = self.relative_output_path(index)
+        if self.kind == TemplateKind.COOKIECUTTER:
+            return (
+                template_path / f"{{{{ cookiecutter.project_name }}}}" / relative_path
+            )
+        if self.is_templated(index):
+            relative_path = relative_path.with_name(
+                relative_path.name + COPIER_TEMPLATES_SUFFIX
+            )
+        return template_path / relative_path
+
+    def project_file_path(self, project_path: Path, index: int) -> Path:
+        return project_path / self.relative_output_path(index)
+
+    def variable(self, name: str = VARIABLE_NAME) -> str:
+        """
+        Template expression that renders the variable
+        """
+        if self.kind == TemplateKind.COOKIECUTTER:
+            return f"{{{{ cookiecutter.{name} }}}}"
+        return f"{{{{ {name} }}}}"
+
+
+def generate_synthetic_template(spec: SyntheticTemplateSpec, path: Path) -> Path:
+    """
+    Writes a template matching the spec into the path.
+
+    :return: The path to the template
+    """
+    path.mkdir(parents=True)
+    if spec.kind == TemplateKind.COPIER:
+        _write_copier_config(path)
+    else:
+        _write_cookiecutter_config(path)
+    for index in range(spec.num_files):
+        file_path = spec.template_file_path(path, index)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_text(_file_content(spec, index))
+    return path
+
+
+def _file_content(spec: SyntheticTemplateSpec, index: int) -> str:
+    header = f"File {index}\n"
+    if spec.is_templated(index):
+        header += f"Rendered {spec.variable()}\n"
+    num_filler_lines = max(0, spec.file_size - len(header)) // len(FILLER_LINE)
+    return header + FILLER_LINE * num_filler_lines
+
+
+def _write_copier_config(path: Path):
+    # Same jinja syntax as cookiecutter rather than the older copier defaults
+    (path / "copier.yml").write_text(
+        f"_templates_suffix: {COPIER_TEMPLATES_SUFFIX}\n"
+        "_envops:\n"
+        '  block_end_string: "%}"\n'
+        '  block_start_string: "{%"\n'
+        '  comment_end_string: "#}"\n'
+        '  comment_start_string: "{#"\n'
+        "  keep_trailing_newline: true\n"
+        '  variable_end_string: "}}"\n'
+        '  variable_start_string: "{{"\n'
+        f"{VARIABLE_NAME}: {VARIABLE_VALUE}\n"
+    )
+    # Same as the test templates, Flexlate fills in the answers
+    (path / f"{{{{ _copier_conf.answers_file }}}}{COPIER_TEMPLATES_SUFFIX}").touch()
+
+
+def _write_cookiecutter_config(path: Path):
+    (path / "cookiecutter.json").write_text(
+        json.dumps(
+            {"project_name": PROJECT_FOLDER_NAME, VARIABLE_NAME: VARIABLE_VALUE},
+            indent=2,
+        )
+    )
@@ -0,0 +1,17 @@
+import subprocess
+import sys
+
+from benchmarks.config import BENCHMARKS_DIR
+
+
+def _run_cli_import():
+    subprocess.run(
+        [sys.executable, "-c", "import flexlate_dev.cli"],
+        cwd=BENCHMARKS_DIR.parent,
+        check=True,
+    )
+
+
+def test_cli_import(benchmark):
+    # In a fresh interpreter, as every CLI invocation pays for it
+    benchmark.pedantic(_run_cli_import, rounds=5)
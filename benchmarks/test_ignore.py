@@ -0,0 +1,43 @@
+from typing import Callable, List
+
+import pytest
+from pathspec import PathSpec
+
+from flexlate_dev.ignore import GitIgnoreMatcher
+
+PATTERNS: List[str] = [
+    "*.pyc",
+    "node_modules/",
+    "build",
+    "/dist/",
+    "docs/**/*.md",
+    "!docs/keep/*.md",
+    *(f"generated{i}/" for i in range(50)),
+]
+# A bulk operation touching the same files many times
+PATHS: List[str] = [f"src/module{i % 200}/file{i % 1000}.py" for i in range(20_000)]
+
+
+def _create_matcher() -> Callable[[str], bool]:
+    matcher = GitIgnoreMatcher(PATTERNS)
+    return lambda path: matcher(path, is_dir=False)
+
+
+def _create_pathspec_matcher() -> Callable[[str], bool]:
+    return PathSpec.from_lines("gitwildmatch", PATTERNS).match_file
+
+
+@pytest.mark.parametrize(
+    "create_matcher",
+    [_create_matcher, _create_pathspec_matcher],
+    ids=["matcher", "pathspec"],
+)
+def test_match_repeated_events(
+    benchmark, create_matcher: Callable[[], Callable[[str], bool]]
+):
+    def match_all():
+        # New matcher each round so that its cache starts empty
+        match = create_matcher()
+        return [match(path) for path in PATHS]
+
+    benchmark.pedantic(match_all, rounds=5)
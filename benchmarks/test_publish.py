@@ -0,0 +1,89 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from benchmarks.config import GENERATED_FILES_DIR
+from benchmarks.synthetic import PROJECT_FOLDER_NAME, SyntheticTemplateSpec
+from flexlate_dev.config import FlexlateDevConfig, UserDataConfiguration
+from flexlate_dev.publish import publish_all_templates, publish_template
+from flexlate_dev.user_runner import UserRootRunConfiguration, UserRunConfiguration
+
+OUT_ROOT = GENERATED_FILES_DIR / "out"
+CONFIG_PATH = GENERATED_FILES_DIR / "flexlate-dev.yaml"
+NUM_RUN_CONFIGS = 4
+
+
+def _clear_output():
+    if OUT_ROOT.exists():
+        shutil.rmtree(OUT_ROOT)
+    OUT_ROOT.mkdir()
+
+
+def test_cold_init(
+    benchmark, synthetic_spec: SyntheticTemplateSpec, synthetic_template_path: Path
+):
+    _create_config_with_run_configs(0)
+    benchmark.pedantic(
+        publish_template,
+        args=(synthetic_template_path, OUT_ROOT),
+        kwargs=dict(config_path=CONFIG_PATH, no_input=True),
+        setup=_clear_output,
+        rounds=5,
+    )
+    project_path = OUT_ROOT / PROJECT_FOLDER_NAME
+    assert synthetic_spec.project_file_path(project_path, 0).exists()
+
+
+def test_warm_no_op_update(
+    benchmark, synthetic_spec: SyntheticTemplateSpec, synthetic_template_path: Path
+):
+    _create_config_with_run_configs(0)
+    # Save the folder name so that later publishes update the project
+    publish_template(
+        synthetic_template_path,
+        OUT_ROOT,
+        config_path=CONFIG_PATH,
+        no_input=True,
+        save=True,
+    )
+    benchmark.pedantic(
+        publish_template,
+        args=(synthetic_template_path, OUT_ROOT),
+        kwargs=dict(config_path=CONFIG_PATH, no_input=True),
+        rounds=5,
+    )
+
+
+@pytest.mark.parametrize("jobs", [1, NUM_RUN_CONFIGS])
+def test_publish_all(
+    benchmark,
+    synthetic_spec: SyntheticTemplateSpec,
+    synthetic_template_path: Path,
+    jobs: int,
+):
+    _create_config_with_run_configs(NUM_RUN_CONFIGS)
+    benchmark.pedantic(
+        publish_all_templates,
+        args=(synthetic_template_path, OUT_ROOT),
+        kwargs=dict(config_path=CONFIG_PATH, no_input=True, jobs=jobs),
+        setup=_clear_output,
+        rounds=3,
+    )
+    for i in range(NUM_RUN_CONFIGS):
+        assert synthetic_spec.project_file_path(OUT_ROOT / f"out-{i}", 0).exists()
+
+
+def _create_config_with_run_configs(num_run_configs: int):
+    config = FlexlateDevConfig.load_or_create(CONFIG_PATH)
+    # Replace the default commands, which publish to GitHub
+    config.run_configs["default"] = UserRootRunConfiguration(
+        publish=UserRunConfiguration()
+    )
+    for i in range(num_run_configs):
+        name = str(i)
+        config.run_configs[name] = UserRootRunConfiguration(
+            publish=UserRunConfiguration(data_name=name)
+        )
+        config.data[name] = UserDataConfiguration(folder_name=f"out-{i}")
+    config.save()
@@ -0,0 +1,127 @@
+import itertools
+from pathlib import Path
+from typing import Callable, Final
+
+from git import Repo
+
+from benchmarks.config import GENERATED_FILES_DIR
+from benchmarks.synthetic import (
+    PROJECT_FOLDER_NAME,
+    VARIABLE_VALUE,
+    SyntheticTemplateSpec,
+)
+from flexlate_dev.config import FlexlateDevConfig
+from flexlate_dev.gitutils import stage_and_commit_all
+from flexlate_dev.server.main import ServerContext, run_server
+from tests.waitutils import wait_until_returns_true
+
+OUT_ROOT = GENERATED_FILES_DIR / "out"
+PROJECT_PATH = OUT_ROOT / PROJECT_FOLDER_NAME
+COMMITS_PER_BACK_SYNC: Final[int] = 10
+TIMEOUT_SECONDS: Final[int] = 60
+# Short so that the wait adds little to the measured time
+POLL_INTERVAL_SECONDS: Final[float] = 0.005
+
+
+def test_change_to_output_latency(
+    benchmark, synthetic_spec: SyntheticTemplateSpec, synthetic_template_path: Path
+):
+    # Templated, so that it needs a full update
+    index = next(
+        i for i in range(synthetic_spec.num_files) if synthetic_spec.is_templated(i)
+    )
+    template_file = synthetic_spec.template_file_path(synthetic_template_path, index)
+    project_file = synthetic_spec.project_file_path(PROJECT_PATH, index)
+    changes = itertools.count()
+
+    with run_server(
+        FlexlateDevConfig(), None, synthetic_template_path, OUT_ROOT, no_input=True
+    ) as context:
+        _wait_until_returns_true(project_file.exists, "Project was not created")
+
+        def change_and_wait_for_output():
+            change = next(changes)
+            template_file.write_text(f"change {change} {synthetic_spec.variable()}")
+            expect_content = f"change {change} {VARIABLE_VALUE}"
+            _wait_until_returns_true(
+                lambda: _read_text_if_exists(project_file) == expect_content,
+                f"{project_file} was not updated",
+            )
+
+        benchmark.pedantic(
+            change_and_wait_for_output,
+            setup=lambda: _wait_until_idle(context),
+            rounds=5,
+        )
+
+
+def test_back_sync_throughput(
+    benchmark, copier_spec: SyntheticTemplateSpec, copier_template_repo: Repo
+):
+    template_path = Path(copier_template_repo.working_dir)
+    indices = [
+        i for i in range(copier_spec.num_files) if not copier_spec.is_templated(i)
+    ][:COMMITS_PER_BACK_SYNC]
+    rounds = itertools.count()
+
+    with run_server(
+        FlexlateDevConfig(),
+        None,
+        template_path,
+        OUT_ROOT,
+        no_input=True,
+        back_sync=True,
+    ) as context:
+        _wait_until_returns_true(
+            copier_spec.project_file_path(PROJECT_PATH, indices[0]).exists,
+            "Project was not created",
+        )
+        project_repo = Repo(PROJECT_PATH)
+
+        def commit_and_wait_for_back_sync():
+            round_number = next(rounds)
+            expect_commits = _count_commits(copier_template_repo) + len(indices)
+            for index in indices:
+                project_file = copier_spec.project_file_path(PROJECT_PATH, index)
+                project_file.write_text(f"back sync {round_number}\n")
+                stage_and_commit_all(
+                    project_repo, f"Change file {index} in round {round_number}"
+                )
+            _wait_until_returns_true(
+                lambda: _count_commits(copier_template_repo) >= expect_commits,
+                "Commits were not back synced",
+            )
+
+        benchmark.pedantic(
+            commit_and_wait_for_back_sync,
+            setup=lambda: _wait_until_idle(context),
+            rounds=3,
+        )
+    if benchmark.stats is not None:
+        benchmark.extra_info["commits_per_second"] = (
+            len(indices) / benchmark.stats.stats.mean
+        )
+
+
+def _wait_until_idle(context: ServerContext):
+    _wait_until_returns_true(
+        lambda: context.sync_manager.is_idle and not context.is_back_syncing,
+        "Server did not finish syncing",
+    )
+
+
+def _wait_until_returns_true(func: Callable[[], bool], message: str):
+    wait_until_returns_true(
+        func, message, timeout=TIMEOUT_SECONDS, poll_interval=POLL_INTERVAL_SECONDS
+    )
+
+
+def _read_text_if_exists(path: Path) -> str:
+    try:
+        return path.read_text()
+    except FileNotFoundError:
+        return ""
+
+
+def _count_commits(repo: Repo) -> int:
+    return int(repo.git.rev_list("--count", "HEAD"))
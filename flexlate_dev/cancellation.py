@@ -0,0 +1,102 @@
+import asyncio
+import contextlib
+import os
+import signal
+import subprocess
+import threading
+from typing import Iterator, Optional, Set, Union
+
+from flexlate_dev.exc import CancelledException
+from flexlate_dev.logger import log
+
+Process = Union[subprocess.Popen, asyncio.subprocess.Process]
+
+
+class CancellationToken:
+    """
+    Lets another thread cancel a running operation. The operation checks the token at
+    safe points and any subprocesses it tracks are killed as soon as it is cancelled.
+    """
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._processes: Set[Process] = set()
+        self._linked_tokens: Set["CancellationToken"] = set()
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled.set()
+            processes = list(self._processes)
+            linked_tokens = list(self._linked_tokens)
+        for process in processes:
+            kill_process_group(process)
+        for token in linked_tokens:
+            token.cancel()
+
+    def raise_if_cancelled(self):
+        if self.is_cancelled:
+            raise CancelledException("Operation was cancelled")
+
+    @contextlib.contextmanager
+    def track_process(self, process: Process) -> Iterator[None]:
+        """
+        Kills the process if the token is cancelled while inside the context. The process
+        should have been started with start_new_session=True so that its children are killed too.
+        """
+        with self._lock:
+            self._processes.add(process)
+            already_cancelled = self.is_cancelled
+        if already_cancelled:
+            kill_process_group(process)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._processes.discard(process)
+
+    @contextlib.contextmanager
+    def link(self, token: "CancellationToken") -> Iterator[None]:
+        """
+        Cancels the other token if this token is cancelled while inside the context
+        """
+        with self._lock:
+            self._linked_tokens.add(token)
+            already_cancelled = self.is_cancelled
+        if already_cancelled:
+            token.cancel()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._linked_tokens.discard(token)
+
+
+def raise_if_cancelled(cancellation_token: Optional[CancellationToken]):
+    if cancellation_token is not None:
+        cancellation_token.raise_if_cancelled()
+
+
+def kill_process_group(process: Process):
+    """
+    Terminates the process and its children, the process must have been started
+    with start_new_session=True
+    """
+    if _has_exited(process):
+        return
+    log.debug(f"Killing process group {process.pid}")
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+
+
+def _has_exited(process: Process) -> bool:
+    if isinstance(process, subprocess.Popen):
+        return process.poll() is not None
+    # Exit of asyncio processes is tracked by their event loop
+    return process.returncode is not None
@@ -1,16 +1,24 @@
 from pathlib import Path
-from typing import List, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
 import typer
-from flexlate.get_version import get_flexlate_version
 
-from flexlate_dev import get_version
-from flexlate_dev.cli_validators import parse_data_from_str
-from flexlate_dev.publish import publish_all_templates, publish_template
-from flexlate_dev.server.main import serve_template
-from flexlate_dev.styles import INFO_STYLE, print_styled
+from flexlate_dev.exc import PublishFailedException
+from flexlate_dev.server.defaults import DEFAULT_QUIET_PERIOD_SECONDS
+from flexlate_dev.styles import ALERT_STYLE, INFO_STYLE, print_styled
+
+if TYPE_CHECKING:
+    from flexlate_dev.daemon import DaemonCommand
+
+# Command implementations are imported within each command, as importing flexlate,
+# git, watchdog and jinja is slow and would otherwise delay every CLI invocation,
+# even dfxt --help
 
 cli = typer.Typer()
+daemon_cli = typer.Typer(
+    help="Run a long-lived daemon that keeps flexlate-dev loaded to publish faster"
+)
+cli.add_typer(daemon_cli, name="daemon")
 
 TEMPLATE_PATH_DOC = "Location of template, can be a local path or URL"
 NO_INPUT_DOC = "Whether to proceed without any input from the user"
@@ -25,6 +33,10 @@ DATA_DOC = (
     'Must be a dictionary, e.g. --data \'{"foo": "bar"}\''
 )
 FOLDER_NAME_DOC = "The name of the folder to create for the project"
+SKIP_UNCHANGED_DOC = (
+    "Skip publishing a run configuration when the template, configuration and "
+    "versions have not changed since it was last published"
+)
 
 TEMPLATE_PATH_OPTION = typer.Option(
     Path("."),
@@ -46,7 +58,25 @@ DATA_OPTION = typer.Option(None, "--data", "-d", show_default=False, help=DATA_D
 FOLDER_NAME_OPTION = typer.Option(
     None, "--folder-name", "-f", show_default=False, help=FOLDER_NAME_DOC
 )
+SKIP_UNCHANGED_OPTION = typer.Option(
+    False, "--skip-unchanged", "-u", show_default=False, help=SKIP_UNCHANGED_DOC
+)
+DAEMON_DOC = (
+    "Publish through the daemon started with dfxt daemon start rather than in this "
+    "process. Uses the socket in FLEXLATE_DEV_DAEMON_SOCKET if set"
+)
+SOCKET_PATH_DOC = (
+    "Location of the daemon socket, defaults to FLEXLATE_DEV_DAEMON_SOCKET if set, "
+    "otherwise ~/.flexlate-dev/daemon.sock"
+)
+
 RUN_CONFIG_ARGUMENT = typer.Argument(None, help=RUN_CONFIG_NAME_DOC)
+DAEMON_OPTION = typer.Option(
+    False, "--daemon", "-D", show_default=False, help=DAEMON_DOC
+)
+SOCKET_PATH_OPTION = typer.Option(
+    None, "--socket", show_default=False, help=SOCKET_PATH_DOC
+)
 
 
 @cli.callback(invoke_without_command=True)
@@ -61,7 +91,12 @@ def pre_execute(
 ):
     # Support printing version and then existing with dfxt --version
     if version:
-        version_number = get_version.get_flexlate_dev_version()
+        from flexlate_dev.get_version import (
+            get_flexlate_dev_version,
+            get_flexlate_version,
+        )
+
+        version_number = get_flexlate_dev_version()
         flexlate_version = get_flexlate_version()
         message = "\n".join(
             [
@@ -75,7 +110,13 @@ def pre_execute(
 
 @cli.command(name="serve")
 def serve(
-    run_config: Optional[str] = RUN_CONFIG_ARGUMENT,
+    run_configs: Optional[List[str]] = typer.Argument(
+        None,
+        help="The names of the run configurations to use. Multiple run "
+        "configurations are served from one watcher, each to a folder named after it, "
+        "and are rebuilt one after another",
+        show_default=False,
+    ),
     out_path: Optional[Path] = typer.Option(
         None,
         "--out",
@@ -98,18 +139,57 @@ def serve(
     save: bool = SAVE_OPTION,
     data: Optional[str] = DATA_OPTION,
     folder_name: Optional[str] = FOLDER_NAME_OPTION,
+    quiet_period: float = typer.Option(
+        DEFAULT_QUIET_PERIOD_SECONDS,
+        "--quiet-period",
+        "-q",
+        help="Seconds to wait after the last detected change before rebuilding, "
+        "so that a burst of changes results in a single rebuild",
+    ),
+    incremental: bool = typer.Option(
+        False,
+        "--incremental",
+        show_default=False,
+        help="Copy changed non-templated files directly into the project instead of "
+        "running a full update. Falls back to a full update for templated files and "
+        "template configuration changes.",
+    ),
+    trace_path: Optional[Path] = typer.Option(
+        None,
+        "--trace",
+        show_default=False,
+        help="Save timings of each build phase over the whole session to this file "
+        "as Chrome trace events, viewable in chrome://tracing or Perfetto",
+    ),
+    serve_all: bool = typer.Option(
+        False,
+        "--all",
+        show_default=False,
+        help="Serve all run configurations in the config file. Only includes the "
+        "default run configuration when no others are defined",
+    ),
+    staged: bool = typer.Option(
+        False,
+        "--staged",
+        show_default=False,
+        help="Run each update in a shadow clone next to the project and bring it into "
+        "the project in one fast-forward, so that dev servers and other tools watching "
+        "the project see a single change per update",
+    ),
 ):
     """
     Run a development server with auto-reloading to see rendered output of a template
     """
+    from flexlate_dev.cli_validators import parse_data_from_str
+    from flexlate_dev.server.main import serve_template
+
     if data is not None:
         parsed_data = parse_data_from_str(data)
     else:
         parsed_data = None
     serve_template(
-        run_config,
-        template_path,
-        out_path,
+        template_path=template_path,
+        out_path=out_path,
         back_sync=back_sync,
         no_input=no_input,
         auto_commit=not no_auto_commit,
@@ -117,6 +197,12 @@ def serve(
         save=save,
         data=parsed_data,
         folder_name=folder_name,
+        quiet_period_seconds=quiet_period,
+        incremental=incremental,
+        trace_path=trace_path,
+        run_config_names=run_configs,
+        serve_all=serve_all,
+        staged=staged,
     )
 
 
@@ -133,20 +219,32 @@ def publish(
     save: bool = SAVE_OPTION,
     data: Optional[str] = DATA_OPTION,
     folder_name: Optional[str] = FOLDER_NAME_OPTION,
+    skip_unchanged: bool = SKIP_UNCHANGED_OPTION,
+    daemon: bool = DAEMON_OPTION,
 ):
     """
     Sync rendered output of a template
     """
-    publish_template(
-        template_path,
-        out_path,
+    publish_kwargs = dict(
+        template_path=template_path,
+        out_root=out_path,
         run_config_name=run_config,
         config_path=config_path,
         save=save,
         no_input=no_input,
         data=data,
         folder_name=folder_name,
+        skip_unchanged=skip_unchanged,
     )
+    if daemon:
+        from flexlate_dev.daemon import DaemonCommand
+
+        _publish_in_daemon(DaemonCommand.PUBLISH, publish_kwargs)
+        return
+
+    from flexlate_dev.publish import publish_template
+
+    publish_template(**publish_kwargs)
 
 
 @cli.command(name="publish-all")
@@ -176,21 +274,119 @@ def publish_all(
     no_input: bool = NO_INPUT_OPTION,
     save: bool = SAVE_OPTION,
     data: Optional[str] = DATA_OPTION,
+    jobs: int = typer.Option(
+        1,
+        "--jobs",
+        "-j",
+        min=1,
+        help="Number of run configurations to publish in parallel. "
+        "Requires --no-input when greater than 1",
+    ),
+    skip_unchanged: bool = SKIP_UNCHANGED_OPTION,
+    daemon: bool = DAEMON_OPTION,
 ):
     """
     Sync rendered output of a template for all run configurations in the config file
     """
-    publish_all_templates(
-        template_path,
-        out_path,
+    publish_kwargs = dict(
+        template_path=template_path,
+        out_root=out_path,
         config_path=config_path,
         save=save,
         no_input=no_input,
         always_include_default=always_include_default,
         exclude=exclude,
         data=data,
+        jobs=jobs,
+        skip_unchanged=skip_unchanged,
+    )
+    if daemon:
+        from flexlate_dev.daemon import DaemonCommand
+
+        _publish_in_daemon(DaemonCommand.PUBLISH_ALL, publish_kwargs)
+        return
+
+    from flexlate_dev.publish import publish_all_templates
+
+    try:
+        publish_all_templates(**publish_kwargs)
+    except PublishFailedException as e:
+        print_styled(str(e), ALERT_STYLE)
+        raise typer.Exit(code=1)
+
+
+@daemon_cli.command(name="start")
+def daemon_start(socket_path: Optional[Path] = SOCKET_PATH_OPTION):
+    """
+    Start the daemon in the foreground, stop it with dfxt daemon stop or Ctrl-C
+    """
+    from flexlate_dev.daemon import DaemonServer, get_default_socket_path
+
+    socket_path = socket_path or get_default_socket_path()
+    server = DaemonServer(socket_path)
+    print_styled(f"Daemon listening on {socket_path}", INFO_STYLE)
+    try:
+        server.serve_until_stopped()
+    except KeyboardInterrupt:
+        pass
+    print_styled("Daemon stopped", INFO_STYLE)
+
+
+@daemon_cli.command(name="status")
+def daemon_status(socket_path: Optional[Path] = SOCKET_PATH_OPTION):
+    """
+    Show whether the daemon is running and what it is doing
+    """
+    from flexlate_dev.daemon import DaemonCommand
+
+    result = _send_daemon_request(DaemonCommand.STATUS, socket_path)
+    status = result["status"]
+    print_styled(
+        "\n".join(
+            [
+                f"Daemon running with pid {status['pid']} "
+                f"for {status['uptime_seconds']:.0f}s",
+                f"Requests handled: {status['requests_handled']}",
+                f"Publishes running: {status['active_publishes']}",
+                f"Cached configs: {status['cached_configs']}",
+            ]
+        ),
+        INFO_STYLE,
     )
 
 
+@daemon_cli.command(name="stop")
+def daemon_stop(socket_path: Optional[Path] = SOCKET_PATH_OPTION):
+    """
+    Stop the daemon once any running publish finishes
+    """
+    from flexlate_dev.daemon import DaemonCommand
+
+    _send_daemon_request(DaemonCommand.STOP, socket_path)
+    print_styled("Daemon stopping", INFO_STYLE)
+
+
+def _publish_in_daemon(command: "DaemonCommand", publish_kwargs: Dict[str, Any]):
+    result = _send_daemon_request(command, None, publish_kwargs)
+    if result["exit_code"] != 0:
+        print_styled(result["error"], ALERT_STYLE)
+        raise typer.Exit(code=result["exit_code"])
+
+
+def _send_daemon_request(
+    command: "DaemonCommand",
+    socket_path: Optional[Path],
+    publish_kwargs: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    from flexlate_dev.daemon import send_request
+    from flexlate_dev.exc import DaemonNotRunningException
+
+    try:
+        return send_request(command, socket_path, publish_kwargs)
+    except DaemonNotRunningException as e:
+        print_styled(str(e), ALERT_STYLE)
+        raise typer.Exit(code=1)
+
+
 if __name__ == "__main__":
     cli()
@@ -0,0 +1,162 @@
+"""
+Caches the outputs of commands that declare their inputs, so that a command such as
+npm install can be skipped and its outputs restored when its inputs are unchanged.
+"""
+import hashlib
+import json
+import os
+import secrets
+import shutil
+from pathlib import Path
+from typing import Final, List, Optional
+
+from flexlate_dev.dirutils import get_state_folder, hash_file
+from flexlate_dev.user_command import UserCommand
+
+COMMAND_CACHE_FOLDER_NAME: Final[str] = "command-cache"
+CACHED_OUTPUTS_FOLDER_NAME: Final[str] = "outputs"
+CACHED_PATHS_FILE_NAME: Final[str] = "paths.json"
+# Entries kept for each command, enough for a few projects in the same output root
+# with different inputs. Outputs such as node_modules are large, so keep it low
+MAX_ENTRIES_PER_COMMAND: Final[int] = 3
+
+
+def get_command_cache_folder(out_root: Path) -> Path:
+    return get_state_folder(out_root) / COMMAND_CACHE_FOLDER_NAME
+
+
+def get_command_cache_entry_folder(
+    cache_folder: Path, command: UserCommand, cwd: Path
+) -> Optional[Path]:
+    """
+    Determines the folder for the cache entry of the command from a hash of the command
+    and the content of the files matching its inputs. The entries of a command are
+    kept together so that old ones can be evicted. Call before running the command,
+    as it may change its own inputs.
+
+    :return: The folder, or None if the command doesn't declare inputs and so can't
+        be cached
+    """
+    if command.inputs is None:
+        return None
+    payload = dict(run=command.run, inputs=command.inputs, outputs=command.outputs)
+    command_hash = hashlib.blake2b(json.dumps(payload, sort_keys=True).encode("utf-8"))
+    inputs_hash = hashlib.blake2b()
+    for path in _match_files(cwd, command.inputs):
+        inputs_hash.update(str(path.relative_to(cwd)).encode("utf-8"))
+        inputs_hash.update(hash_file(path))
+    return cache_folder / command_hash.hexdigest() / inputs_hash.hexdigest()
+
+
+def restore_cached_outputs(entry_folder: Path, cwd: Path) -> bool:
+    """
+    Copies the outputs saved in the entry into the directory, replacing any existing
+    outputs.
+
+    :return: Whether the entry exists. If not, the outputs may be partially
+        replaced, which is fine as the command is then run to produce them
+    """
+    try:
+        relative_paths: List[str] = json.loads(
+            (entry_folder / CACHED_PATHS_FILE_NAME).read_text()
+        )
+        for relative_path in relative_paths:
+            _replace_path(
+                entry_folder / CACHED_OUTPUTS_FOLDER_NAME / relative_path,
+                cwd / relative_path,
+            )
+        # Mark as recently used so that it is evicted last
+        os.utime(entry_folder)
+    except FileNotFoundError:
+        # Not cached, or evicted while restoring by another command
+        return False
+    return True
+
+
+def save_cached_outputs(entry_folder: Path, cwd: Path, outputs: Optional[List[str]]):
+    """
+    Saves the files and directories matching the outputs in the entry. Nothing is
+    saved if none match, so that the command runs again next time.
+    """
+    if entry_folder.exists():
+        return
+    output_paths = _match_top_level_paths(cwd, outputs or [])
+    if not output_paths:
+        # Restoring nothing would skip the command without any of its effects
+        return
+    # Build the entry next to its final location and move it into place at the end,
+    # so that an interrupted save never leaves a partial entry to restore
+    temp_folder = (
+        entry_folder.parent / f".{entry_folder.name}.{secrets.token_hex(4)}.tmp"
+    )
+    temp_outputs_folder = temp_folder / CACHED_OUTPUTS_FOLDER_NAME
+    temp_outputs_folder.mkdir(parents=True)
+    try:
+        relative_paths: List[str] = []
+        for path in output_paths:
+            relative_path = path.relative_to(cwd)
+            _replace_path(path, temp_outputs_folder / relative_path)
+            relative_paths.append(str(relative_path))
+        (temp_folder / CACHED_PATHS_FILE_NAME).write_text(json.dumps(relative_paths))
+        os.replace(temp_folder, entry_folder)
+    except OSError:
+        # Another command saved the same entry first
+        if not entry_folder.exists():
+            raise
+    finally:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+    _evict_old_entries(entry_folder.parent)
+
+
+def _evict_old_entries(command_folder: Path):
+    """
+    Removes all but the most recently used entries of the command.
+    """
+    entries = sorted(
+        (
+            path
+            for path in command_folder.iterdir()
+            if not path.name.startswith(".") and path.is_dir()
+        ),
+        key=lambda path: path.stat().st_mtime_ns,
+        reverse=True,
+    )
+    for entry in entries[MAX_ENTRIES_PER_COMMAND:]:
+        # Renamed first so that it can't be restored while partially removed
+        removed_folder = (
+            command_folder / f".{entry.name}.{secrets.token_hex(4)}.removed"
+        )
+        try:
+            os.replace(entry, removed_folder)
+        except FileNotFoundError:
+            # Already evicted by another command
+            continue
+        shutil.rmtree(removed_folder, ignore_errors=True)
+
+
+def _match_files(cwd: Path, patterns: List[str]) -> List[Path]:
+    paths = {path for pattern in patterns for path in cwd.glob(pattern)}
+    return sorted(path for path in paths if path.is_file())
+
+
+def _match_top_level_paths(cwd: Path, patterns: List[str]) -> List[Path]:
+    # Directories are copied whole, so skip matches inside already matched directories
+    paths = sorted({path for pattern in patterns for path in cwd.glob(pattern)})
+    top_level: List[Path] = []
+    for path in paths:
+        if top_level and top_level[-1] in path.parents:
+            continue
+        top_level.append(path)
+    return top_level
+
+
+def _replace_path(source: Path, destination: Path):
+    if destination.is_dir() and not destination.is_symlink():
+        shutil.rmtree(destination)
+    elif destination.exists() or destination.is_symlink():
+        destination.unlink()
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    if source.is_dir() and not source.is_symlink():
+        shutil.copytree(source, destination, symlinks=True)
+    else:
+        shutil.copy2(source, destination, follow_symlinks=False)
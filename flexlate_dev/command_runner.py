@@ -1,29 +1,243 @@
-from typing import Sequence, Union
+import contextlib
+import contextvars
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Final, Iterator, List, Optional, Sequence, Set, Union
 
-from flexlate_dev.ext_subprocess import (
-    run_command_in_background_stream_output,
-    run_command_stream_output,
+from rich.markup import escape
+
+from flexlate_dev.cancellation import CancellationToken, raise_if_cancelled
+from flexlate_dev.command_cache import (
+    get_command_cache_entry_folder,
+    restore_cached_outputs,
+    save_cached_outputs,
 )
-from flexlate_dev.styles import INFO_STYLE, print_styled
+from flexlate_dev.exc import CommandDependencyException, CommandFailedException
+from flexlate_dev.ext_subprocess import run_command_stream_output
+from flexlate_dev.process_supervisor import process_supervisor
+from flexlate_dev.styles import ALERT_STYLE, INFO_STYLE, print_styled
 from flexlate_dev.user_command import UserCommand
 
 Runnable = Union[UserCommand, str]
 
+DEFAULT_MAX_PARALLEL_COMMANDS: Final[int] = os.cpu_count() or 1
+
+
+def run_command_or_command_strs(
+    cmds: Sequence[Runnable],
+    cancellation_token: Optional[CancellationToken] = None,
+    max_parallel_commands: int = DEFAULT_MAX_PARALLEL_COMMANDS,
+    cwd: Optional[Path] = None,
+    cache_folder: Optional[Path] = None,
+):
+    """
+    Runs the commands one after another, or as a graph if any of them depend on others.
+    A command with check set that exits with a non-zero code raises
+    CommandFailedException, as does a command that times out.
+
+    When running as a graph, each command starts as soon as the commands in its
+    depends_on have finished, so commands without depends_on start right away.
+    Output is prefixed with the command name. If a command fails, the running
+    commands are cancelled, no more are started and CommandFailedException is raised.
+
+    :param max_parallel_commands: Maximum number of commands to run at once as a graph
+    :param cwd: Directory to run the commands in, defaults to the current directory
+    :param cache_folder: Folder to cache the outputs of commands that declare inputs in.
+        When not passed, commands always run
+    """
+    commands = [
+        UserCommand.from_string(cmd) if isinstance(cmd, str) else cmd for cmd in cmds
+    ]
+    if any(command.depends_on for command in commands):
+        _run_commands_as_graph(
+            commands, cancellation_token, max_parallel_commands, cwd, cache_folder
+        )
+        return
 
-def run_command_or_command_strs(cmds: Sequence[Runnable]):
-    for cmd in cmds:
-        if isinstance(cmd, str):
-            command = UserCommand.from_string(cmd)
-        else:
-            command = cmd
-        run_command(command)
+    for command in commands:
+        raise_if_cancelled(cancellation_token)
+        run_command(
+            command,
+            cancellation_token=cancellation_token,
+            cwd=cwd,
+            cache_folder=cache_folder,
+        )
+    raise_if_cancelled(cancellation_token)
 
 
-def run_command(cmd: UserCommand):
-    print_styled(f"Running command: {cmd.display_name}", INFO_STYLE)
+def run_command(
+    cmd: UserCommand,
+    cancellation_token: Optional[CancellationToken] = None,
+    output_prefix: str = "",
+    cwd: Optional[Path] = None,
+    cache_folder: Optional[Path] = None,
+):
+    """
+    Runs the command, or starts it in the background. If the command declares inputs
+    and they match a cached run, the command is skipped and its outputs are restored.
+
+    :raises CommandFailedException: If the command has check set and exits with a
+        non-zero code, or does not finish within its timeout
+    """
+    print_styled(
+        f"{escape(output_prefix)}Running command: {cmd.display_name}", INFO_STYLE
+    )
     if cmd.run is None:
         raise ValueError(f"Cannot run command {cmd} as run=None")
     if cmd.background:
-        run_command_in_background_stream_output(cmd.run)
-    else:
-        run_command_stream_output(cmd.run)
+        process_supervisor.start(cmd, cwd)
+        return
+    directory = cwd or Path.cwd()
+    cache_entry_folder: Optional[Path] = None
+    if cache_folder is not None:
+        cache_entry_folder = get_command_cache_entry_folder(
+            cache_folder, cmd, directory
+        )
+    if cache_entry_folder is not None and restore_cached_outputs(
+        cache_entry_folder, directory
+    ):
+        print_styled(
+            f"{escape(output_prefix)}Inputs of {cmd.display_name} are unchanged, "
+            f"restored its outputs from the cache",
+            INFO_STYLE,
+        )
+        return
+    exit_code = run_command_stream_output(
+        cmd.run,
+        cancellation_token=cancellation_token,
+        output_prefix=output_prefix,
+        timeout=cmd.timeout,
+        cwd=cwd,
+    )
+    # Cancelling kills the command, which is not a failure of the command
+    raise_if_cancelled(cancellation_token)
+    if exit_code != 0:
+        message = f"Command {cmd.display_name} failed with exit code {exit_code}"
+        if cmd.check:
+            raise CommandFailedException(message)
+        print_styled(f"{escape(output_prefix)}{message}", ALERT_STYLE)
+        return
+    if cache_entry_folder is not None:
+        save_cached_outputs(cache_entry_folder, directory, cmd.outputs)
+
+
+def _run_commands_as_graph(
+    commands: List[UserCommand],
+    cancellation_token: Optional[CancellationToken],
+    max_parallel_commands: int,
+    cwd: Optional[Path],
+    cache_folder: Optional[Path],
+):
+    dependencies = _get_dependencies(commands)
+    pending: Set[int] = set(range(len(commands)))
+    finished: Set[int] = set()
+    error: Optional[BaseException] = None
+    with _create_graph_token(cancellation_token) as graph_token, ThreadPoolExecutor(
+        max_workers=max_parallel_commands
+    ) as executor:
+        running: Dict[Future, int] = {}
+        while pending or running:
+            if error is None:
+                ready = [i for i in sorted(pending) if dependencies[i] <= finished]
+                for i in ready:
+                    pending.remove(i)
+                    # In a copy of the context, as the daemon routes the output of
+                    # each request by its context
+                    future = executor.submit(
+                        contextvars.copy_context().run,
+                        _run_graph_command,
+                        commands[i],
+                        graph_token,
+                        cwd,
+                        cache_folder,
+                    )
+                    running[future] = i
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                exception = future.exception()
+                if exception is None:
+                    finished.add(i)
+                elif error is None:
+                    # Fail fast, stopping the other running commands
+                    error = exception
+                    graph_token.cancel()
+    raise_if_cancelled(cancellation_token)
+    if error is not None:
+        raise error
+
+
+def _run_graph_command(
+    command: UserCommand,
+    cancellation_token: CancellationToken,
+    cwd: Optional[Path],
+    cache_folder: Optional[Path],
+):
+    raise_if_cancelled(cancellation_token)
+    run_command(
+        command,
+        cancellation_token=cancellation_token,
+        output_prefix=f"[{command.display_name}] ",
+        cwd=cwd,
+        cache_folder=cache_folder,
+    )
+
+
+def _get_dependencies(commands: List[UserCommand]) -> List[Set[int]]:
+    """
+    Determines the indices of the commands that each command depends on.
+
+    :raises CommandDependencyException: If a command depends on an unknown command
+        or the dependencies form a cycle
+    """
+    indices_by_id: Dict[str, int] = {}
+    for i, command in enumerate(commands):
+        if command.id is None:
+            continue
+        if command.id in indices_by_id:
+            raise CommandDependencyException(
+                f"Multiple commands have id {command.id}, "
+                f"so commands can't depend on it"
+            )
+        indices_by_id[command.id] = i
+
+    dependencies: List[Set[int]] = []
+    for command in commands:
+        command_dependencies: Set[int] = set()
+        for dependency_id in command.depends_on or []:
+            if dependency_id not in indices_by_id:
+                raise CommandDependencyException(
+                    f"Command {command.display_name} depends on {dependency_id}, "
+                    f"but no command in the same hook has that id"
+                )
+            command_dependencies.add(indices_by_id[dependency_id])
+        dependencies.append(command_dependencies)
+
+    # Check for cycles by repeatedly removing commands without remaining dependencies
+    remaining = set(range(len(commands)))
+    while remaining:
+        removable = {i for i in remaining if not dependencies[i] & remaining}
+        if not removable:
+            names = ", ".join(commands[i].display_name for i in sorted(remaining))
+            raise CommandDependencyException(
+                f"Commands depend on each other in a cycle: {names}"
+            )
+        remaining -= removable
+    return dependencies
+
+
+@contextlib.contextmanager
+def _create_graph_token(
+    cancellation_token: Optional[CancellationToken],
+) -> Iterator[CancellationToken]:
+    # Separate token so that a failing command can cancel the others without
+    # cancelling the caller's operation
+    graph_token = CancellationToken()
+    if cancellation_token is None:
+        yield graph_token
+        return
+    with cancellation_token.link(graph_token):
+        yield graph_token
@@ -1,19 +1,20 @@
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Dict, Final, List, Optional, Union
+from typing import Any, Dict, Final, List, Optional, Tuple, Union
 
 from flexlate.template_data import TemplateData
 from pyappconf import AppConfig, BaseConfig, ConfigFormats
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 
 from flexlate_dev.dict_merge import merge_dicts_preferring_non_none
 from flexlate_dev.exc import (
+    CircularExtendsException,
     NoSuchCommandException,
     NoSuchDataException,
     NoSuchRunConfigurationException,
 )
 from flexlate_dev.external_command_type import ExternalCLICommandType
-from flexlate_dev.ignore import IgnoreSpecification
+from flexlate_dev.ignore import IgnoreSpecification, TemplateIgnores
 from flexlate_dev.user_command import UserCommand
 from flexlate_dev.user_runner import (
     CommandContext,
@@ -27,6 +28,8 @@ SCHEMA_URL: Final[
     str
 ] = "https://nickderobertis.github.io/flexlate-dev/_static/config-schema.json"
 
+RunConfigKey = Tuple[ExternalCLICommandType, str]
+
 
 class DataConfiguration(BaseModel):
     data: TemplateData = Field(
@@ -75,8 +78,24 @@ class FullRunConfiguration:
     def _use_ignore(self) -> List[str]:
         return self.data.ignore if self.data is not None else []
 
-    def ignore_matches(self, to_match: Union[str, Path]) -> bool:
-        return self._ignore_spec.file_is_ignored(to_match)
+    @property
+    def ignore_spec(self) -> IgnoreSpecification:
+        return self._ignore_spec
+
+    def ignore_matches(
+        self, to_match: Union[str, Path], is_dir: Optional[bool] = None
+    ) -> bool:
+        return self._ignore_spec.file_is_ignored(to_match, is_dir)
+
+    def ignore_matches_whole_directory(self, directory: Path) -> bool:
+        return self._ignore_spec.directory_is_fully_ignored(directory)
+
+    def create_template_ignores(self, template_path: Path) -> TemplateIgnores:
+        """
+        Combines the ignores of this configuration with those of the git repository
+        the template is in.
+        """
+        return TemplateIgnores(template_path, self._ignore_spec)
 
 
 def create_default_run_configs() -> Dict[str, UserRootRunConfiguration]:
@@ -122,38 +141,88 @@ class FlexlateDevConfig(BaseConfig):
         schema_url=SCHEMA_URL,
     )
 
+    # Resolved configurations, built on first use as resolving extends is not free
+    _resolved_run_configs: Dict[RunConfigKey, UserRunConfiguration] = PrivateAttr(
+        default_factory=dict
+    )
+    _resolved_data_configs: Dict[str, DataConfiguration] = PrivateAttr(
+        default_factory=dict
+    )
+    _full_run_configs: Dict[RunConfigKey, FullRunConfiguration] = PrivateAttr(
+        default_factory=dict
+    )
+
     def save(self, serializer_kwargs: Optional[Dict[str, Any]] = None, **kwargs):
+        # Configuration is usually modified before saving
+        self.invalidate_resolved_configs()
         all_kwargs = dict(exclude_none=True, **kwargs)
         return super().save(serializer_kwargs=serializer_kwargs, **all_kwargs)
 
+    def invalidate_resolved_configs(self):
+        """
+        Clears the resolved run and data configurations. Must be called after
+        modifying the configuration in place, saving does it automatically.
+        """
+        self._resolved_run_configs.clear()
+        self._resolved_data_configs.clear()
+        self._full_run_configs.clear()
+
     def get_full_run_config(
         self, command: ExternalCLICommandType, name: Optional[str] = None
     ) -> FullRunConfiguration:
+        """
+        Gets the run configuration with all extends resolved along with its data
+        configuration. The result is cached and shared between callers, so it
+        should not be modified.
+        """
+        key = (command, name or "default")
+        full_run_config = self._full_run_configs.get(key)
+        if full_run_config is not None:
+            return full_run_config
         user_run_config = self.get_run_config(command, name)
         if user_run_config.data_name is None:
             data_config = self.get_default_data()
         else:
             data_config = self.get_data_config(user_run_config.data_name)
-        return FullRunConfiguration(config=user_run_config, data=data_config)
+        full_run_config = FullRunConfiguration(config=user_run_config, data=data_config)
+        self._full_run_configs[key] = full_run_config
+        return full_run_config
 
     def get_run_config(
         self, command: ExternalCLICommandType, name: Optional[str] = None
     ) -> UserRunConfiguration:
-        name = name or "default"
+        return self._resolve_run_config(command, name or "default", ())
+
+    def _resolve_run_config(
+        self, command: ExternalCLICommandType, name: str, extended_by: Tuple[str, ...]
+    ) -> UserRunConfiguration:
+        resolved = self._resolved_run_configs.get((command, name))
+        if resolved is not None:
+            return resolved
+        if name in extended_by:
+            raise CircularExtendsException(
+                f"Run configurations extend each other: "
+                f"{' -> '.join([*extended_by, name])}"
+            )
         user_root_run_config = self.run_configs.get(name)
         if not user_root_run_config:
             raise NoSuchRunConfigurationException(name)
         user_run_config = user_root_run_config.get_run_config(command)
         if not user_run_config.extends:
-            # No extends, so return the config as-is
-            return user_run_config
-        # Create a new config by extending the referenced config
-        extends_config = self.get_run_config(command, user_run_config.extends)
-        return UserRunConfiguration(
-            **merge_dicts_preferring_non_none(
-                extends_config.dict(), user_run_config.dict()
+            # No extends, so use the config as-is
+            resolved = user_run_config
+        else:
+            # Create a new config by extending the referenced config
+            extends_config = self._resolve_run_config(
+                command, user_run_config.extends, (*extended_by, name)
             )
-        )
+            resolved = UserRunConfiguration(
+                **merge_dicts_preferring_non_none(
+                    extends_config.dict(), user_run_config.dict()
+                )
+            )
+        self._resolved_run_configs[(command, name)] = resolved
+        return resolved
 
     def get_run_config_names(self, always_include_default: bool = False) -> List[str]:
         names = list(self.run_configs.keys())
@@ -168,26 +237,33 @@ class FlexlateDevConfig(BaseConfig):
             return None
 
     def get_data_config(self, name: str) -> DataConfiguration:
+        return self._resolve_data_config(name, ())
+
+    def _resolve_data_config(
+        self, name: str, extended_by: Tuple[str, ...]
+    ) -> DataConfiguration:
+        resolved = self._resolved_data_configs.get(name)
+        if resolved is not None:
+            return resolved
+        if name in extended_by:
+            raise CircularExtendsException(
+                f"Data configurations extend each other: "
+                f"{' -> '.join([*extended_by, name])}"
+            )
         user_data_config = self.data.get(name)
         if not user_data_config:
             raise NoSuchDataException(name)
         if not user_data_config.extends:
-            # No extends, so return the config as-is
-            return user_data_config
-        # Create a new config by extending the referenced config
-        extends_config = self.get_data_config(user_data_config.extends)
-        extended_data = {**extends_config.data, **user_data_config.data}
-        folder_name = user_data_config.folder_name or extends_config.folder_name
-        if extends_config.ignore is None:
-            extended_ignore = user_data_config.ignore
-        elif user_data_config.ignore is None:
-            extended_ignore = extends_config.ignore
+            # No extends, so use the config as-is
+            resolved = user_data_config
         else:
-            # Both specified ignores, extend the list
-            extended_ignore = [*extends_config.ignore, *user_data_config.ignore]
-        return DataConfiguration(
-            data=extended_data, folder_name=folder_name, ignore=extended_ignore
-        )
+            # Create a new config by extending the referenced config
+            extends_config = self._resolve_data_config(
+                user_data_config.extends, (*extended_by, name)
+            )
+            resolved = _extend_data_config(extends_config, user_data_config)
+        self._resolved_data_configs[name] = resolved
+        return resolved
 
     def save_data_for_run_config(
         self, run_config: FullRunConfiguration, data: TemplateData
@@ -206,17 +282,90 @@ class FlexlateDevConfig(BaseConfig):
         raise NoSuchCommandException(id)
 
 
-def load_config(config_path: Optional[Path]) -> FlexlateDevConfig:
-    if config_path is None:
-        for possible_name in ["flexlate-dev.yaml", "flexlate-dev.yml"]:
-            path = Path(possible_name)
-            if path.exists():
-                return FlexlateDevConfig.load(path)
-    elif config_path.exists():
-        return FlexlateDevConfig.load(config_path)
+def _extend_data_config(
+    extends_config: DataConfiguration, user_data_config: UserDataConfiguration
+) -> DataConfiguration:
+    extended_data = {**extends_config.data, **user_data_config.data}
+    folder_name = user_data_config.folder_name or extends_config.folder_name
+    if extends_config.ignore is None:
+        extended_ignore = user_data_config.ignore
+    elif user_data_config.ignore is None:
+        extended_ignore = extends_config.ignore
     else:
-        # Passed config path, but does not exist, might be trying to save new config
-        return FlexlateDevConfig.load_or_create(config_path.resolve())
+        # Both specified ignores, extend the list
+        extended_ignore = [*extends_config.ignore, *user_data_config.ignore]
+    return DataConfiguration(
+        data=extended_data, folder_name=folder_name, ignore=extended_ignore
+    )
 
-    # Could not find any config, create a blank one at the default location
-    return FlexlateDevConfig.load_or_create(Path("flexlate-dev.yaml").resolve())
+
+@dataclass
+class _CachedConfig:
+    config: FlexlateDevConfig
+    modified_ns: int
+    size: int
+
+
+class ConfigCache:
+    """
+    Keeps loaded configs by path, loading them again only when the file changes.
+    The configs are shared, so they must be saved after modifying them.
+    """
+
+    def __init__(self):
+        self._configs: Dict[Path, _CachedConfig] = {}
+
+    def __len__(self) -> int:
+        return len(self._configs)
+
+    def load(self, path: Path) -> FlexlateDevConfig:
+        path = path.resolve()
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            # Config does not exist yet, might be trying to save new config. Cache it
+            # once it does
+            return FlexlateDevConfig.load_or_create(path)
+        cached = self._configs.get(path)
+        if (
+            cached is not None
+            and cached.modified_ns == stat.st_mtime_ns
+            and cached.size == stat.st_size
+        ):
+            return cached.config
+        config = FlexlateDevConfig.load(path)
+        self._configs[path] = _CachedConfig(config, stat.st_mtime_ns, stat.st_size)
+        return config
+
+
+_config_cache = ConfigCache()
+
+
+def load_config(config_path: Optional[Path]) -> FlexlateDevConfig:
+    """
+    Loads the config, reusing the previously loaded one and its resolved run
+    configurations until the file changes.
+    """
+    return _config_cache.load(resolve_config_path(config_path))
+
+
+def resolve_config_path(
+    config_path: Optional[Path], directory: Optional[Path] = None
+) -> Path:
+    """
+    Determines the config file to use, which may not exist yet.
+
+    :param config_path: Passed location of the config. If not passed, looks for a config
+        in the directory, defaulting to flexlate-dev.yaml
+    :param directory: Directory to look for a config in, defaults to the current
+        directory
+    """
+    if config_path is not None:
+        return config_path
+    directory = directory or Path()
+    for possible_name in ["flexlate-dev.yaml", "flexlate-dev.yml"]:
+        path = directory / possible_name
+        if path.exists():
+            return path
+    # Could not find any config, use the default location
+    return directory / "flexlate-dev.yaml"
@@ -0,0 +1,379 @@
+"""
+Long-lived daemon that publishes templates on behalf of the CLI, so that repeated
+publishes don't pay for interpreter startup, imports, loading the config and setting
+up flexlate every time.
+
+Only publishing goes through the daemon. dfxt serve is itself a long-lived process
+that keeps everything loaded, so there is nothing to gain from running it here. What
+the daemon keeps warm between requests is its imports, the loaded configs and the
+module level flexlate instance and jinja environment.
+
+The CLI talks to the daemon over a Unix domain socket. Each connection sends one
+request as a line of JSON and receives the output of the request as it is produced,
+followed by the result, each also as a line of JSON.
+
+Requests run at the same time unless they publish to the same folder. They use the
+absolute paths sent by the client rather than the working directory of the daemon,
+and their output is routed to the client by the thread context they run in.
+
+The CLI imports this module to send requests, so the server dependencies are
+imported only once the daemon runs a request.
+"""
+import contextlib
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+import traceback
+from contextvars import ContextVar
+from enum import Enum
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Final,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    TextIO,
+    Tuple,
+)
+
+from flexlate_dev.exc import DaemonNotRunningException, UserInputException
+
+if TYPE_CHECKING:
+    from flexlate_dev.config import FlexlateDevConfig
+
+SOCKET_PATH_ENV_VAR: Final[str] = "FLEXLATE_DEV_DAEMON_SOCKET"
+
+
+class DaemonCommand(str, Enum):
+    PUBLISH = "publish"
+    PUBLISH_ALL = "publish-all"
+    STATUS = "status"
+    STOP = "stop"
+
+
+class MessageType(str, Enum):
+    OUTPUT = "output"
+    RESULT = "result"
+
+
+def get_default_socket_path() -> Path:
+    from_env = os.environ.get(SOCKET_PATH_ENV_VAR)
+    if from_env:
+        return Path(from_env)
+    return Path.home() / ".flexlate-dev" / "daemon.sock"
+
+
+class _SocketOutput:
+    def __init__(self, send: Callable[[Dict[str, Any]], None]):
+        self.send = send
+
+    def write(self, text: str):
+        self.send(dict(type=MessageType.OUTPUT, text=text))
+
+
+# Output of the request running in the current context. Threads started while
+# running a request copy the context so that their output also reaches the client
+_request_output: ContextVar[Optional[_SocketOutput]] = ContextVar(
+    "_request_output", default=None
+)
+
+
+class _RequestOutputStream:
+    """
+    Stands in for sys.stdout or sys.stderr while the daemon runs, sending what is
+    written to the client of the request running in the current context, and
+    writing to the original stream otherwise
+    """
+
+    def __init__(self, original: TextIO):
+        self.original = original
+
+    def write(self, text: str) -> int:
+        out = _request_output.get()
+        if out is None:
+            return self.original.write(text)
+        out.write(text)
+        return len(text)
+
+    def flush(self):
+        if _request_output.get() is None:
+            self.original.flush()
+
+    def isatty(self) -> bool:
+        if _request_output.get() is None:
+            return self.original.isatty()
+        return False
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.original, name)
+
+
+@contextlib.contextmanager
+def _route_output_to_requests() -> Iterator[None]:
+    original_stdout, original_stderr = sys.stdout, sys.stderr
+    sys.stdout = _RequestOutputStream(original_stdout)  # type: ignore
+    sys.stderr = _RequestOutputStream(original_stderr)  # type: ignore
+    try:
+        yield
+    finally:
+        sys.stdout, sys.stderr = original_stdout, original_stderr
+
+
+class _PathLocks:
+    """
+    Locks by path, so that requests working on different paths run at the same time
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks: Dict[Path, threading.Lock] = {}
+
+    @contextlib.contextmanager
+    def hold(self, paths: Iterable[Path]) -> Iterator[None]:
+        with self._lock:
+            # Always taken in the same order so requests can't deadlock
+            locks = [
+                self._locks.setdefault(path, threading.Lock())
+                for path in sorted(set(paths))
+            ]
+        with contextlib.ExitStack() as stack:
+            for lock in locks:
+                stack.enter_context(lock)
+            yield
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path):
+        from flexlate_dev.config import ConfigCache
+
+        self.socket_path = socket_path
+        self.config_cache = ConfigCache()
+        self.started_at = time.time()
+        self.requests_handled = 0
+        self.active_publishes = 0
+        self._counts_lock = threading.Lock()
+        self._path_locks = _PathLocks()
+        _remove_stale_socket(socket_path)
+        socket_path.parent.mkdir(parents=True, exist_ok=True)
+        super().__init__(str(socket_path), _RequestHandler)
+
+    def serve_until_stopped(self):
+        try:
+            with _route_output_to_requests():
+                self.serve_forever()
+        finally:
+            self.server_close()
+            self.socket_path.unlink(missing_ok=True)
+
+    def stop(self):
+        # Must not be called from the thread running serve_forever
+        threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def status(self) -> Dict[str, Any]:
+        return dict(
+            pid=os.getpid(),
+            uptime_seconds=time.time() - self.started_at,
+            requests_handled=self.requests_handled,
+            active_publishes=self.active_publishes,
+            cached_configs=len(self.config_cache),
+        )
+
+    def run_publish(
+        self,
+        command: DaemonCommand,
+        cwd: Path,
+        kwargs: Dict[str, Any],
+        out: _SocketOutput,
+    ) -> Tuple[int, Optional[str]]:
+        """
+        Runs the publish, writing its output to out as it is produced.
+
+        :param cwd: Working directory of the client, where the config is looked up
+            when no config path was passed
+        :return: Exit code and error message if it failed
+        """
+        from flexlate_dev.config import resolve_config_path
+        from flexlate_dev.exc import PublishFailedException
+        from flexlate_dev.publish import publish_all_templates, publish_template
+
+        publish: Callable[..., None] = (
+            publish_template
+            if command == DaemonCommand.PUBLISH
+            else publish_all_templates
+        )
+        with self._counts_lock:
+            self.requests_handled += 1
+            self.active_publishes += 1
+        token = _request_output.set(out)
+        try:
+            # Also passed on, as parallel publish jobs load the config themselves
+            kwargs["config_path"] = resolve_config_path(
+                kwargs.get("config_path"), cwd
+            ).resolve()
+            config = self.config_cache.load(kwargs["config_path"])
+            with self._path_locks.hold(_get_locked_paths(command, config, kwargs)):
+                publish(config=config, **kwargs)
+        except (PublishFailedException, UserInputException) as e:
+            return 1, str(e)
+        except Exception:
+            return 1, traceback.format_exc()
+        finally:
+            _request_output.reset(token)
+            with self._counts_lock:
+                self.active_publishes -= 1
+        return 0, None
+
+
+def _get_locked_paths(
+    command: DaemonCommand, config: "FlexlateDevConfig", kwargs: Dict[str, Any]
+) -> List[Path]:
+    """
+    Paths the publish writes to, which other publishes must not write at the same time
+    """
+    from flexlate_dev.publish import (
+        get_publish_folders,
+        get_run_config_names_to_publish,
+    )
+
+    if command == DaemonCommand.PUBLISH:
+        run_config_names: List[Optional[str]] = [kwargs.get("run_config_name")]
+    else:
+        run_config_names = list(
+            get_run_config_names_to_publish(
+                config,
+                kwargs.get("always_include_default", False),
+                kwargs.get("exclude"),
+            )
+        )
+    paths = get_publish_folders(
+        config, kwargs["out_root"], run_config_names, kwargs.get("folder_name")
+    )
+    if kwargs.get("save"):
+        paths.append(kwargs["config_path"])
+    return paths
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    server: DaemonServer
+
+    def setup(self):
+        super().setup()
+        # Commands run in parallel within a request may write output at the same time
+        self._send_lock = threading.Lock()
+
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        command = DaemonCommand(request["command"])
+        if command == DaemonCommand.STATUS:
+            self._send_result(0, status=self.server.status())
+        elif command == DaemonCommand.STOP:
+            self._send_result(0)
+            self.server.stop()
+        elif command in (DaemonCommand.PUBLISH, DaemonCommand.PUBLISH_ALL):
+            kwargs = _deserialize_publish_kwargs(request["kwargs"])
+            exit_code, error = self.server.run_publish(
+                command, Path(request["cwd"]), kwargs, _SocketOutput(self._send)
+            )
+            self._send_result(exit_code, error=error)
+
+    def _send(self, message: Dict[str, Any]):
+        try:
+            with self._send_lock:
+                self.wfile.write(json.dumps(message).encode("utf-8") + b"\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError, ValueError):
+            # Client went away, or the request finished while a background
+            # command is still writing output
+            pass
+
+    def _send_result(self, exit_code: int, **fields):
+        self._send(dict(type=MessageType.RESULT, exit_code=exit_code, **fields))
+
+
+def _remove_stale_socket(socket_path: Path):
+    if not socket_path.exists():
+        return
+    try:
+        _connect(socket_path).close()
+    except DaemonNotRunningException:
+        # Left over from a daemon that did not shut down cleanly
+        socket_path.unlink()
+        return
+    raise UserInputException(f"A daemon is already running on {socket_path}")
+
+
+def _connect(socket_path: Path) -> socket.socket:
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(str(socket_path))
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        client.close()
+        raise DaemonNotRunningException(
+            f"No daemon is running on {socket_path}, start one with dfxt daemon start"
+        ) from e
+    return client
+
+
+_PATH_KWARGS: Final[Tuple[str, ...]] = ("template_path", "out_root", "config_path")
+
+
+def _serialize_publish_kwargs(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    # Resolve paths as the daemon runs in a different working directory
+    return {
+        key: str(Path(value).resolve())
+        if key in _PATH_KWARGS and value is not None
+        else value
+        for key, value in kwargs.items()
+    }
+
+
+def _deserialize_publish_kwargs(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        key: Path(value) if key in _PATH_KWARGS and value is not None else value
+        for key, value in kwargs.items()
+    }
+
+
+def send_request(
+    command: DaemonCommand,
+    socket_path: Optional[Path] = None,
+    publish_kwargs: Optional[Dict[str, Any]] = None,
+    out: Optional[TextIO] = None,
+) -> Dict[str, Any]:
+    """
+    Sends a request to the daemon, writing output to out as it arrives.
+
+    :raises DaemonNotRunningException: If no daemon is listening on the socket
+    :return: The result message, with the exit code and any error or status
+    """
+    socket_path = socket_path or get_default_socket_path()
+    out = out or sys.stdout
+    request = dict(
+        command=command,
+        cwd=os.getcwd(),
+        kwargs=_serialize_publish_kwargs(publish_kwargs or {}),
+    )
+    with _connect(socket_path) as client:
+        client.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with client.makefile("rb") as messages:
+            for line in messages:
+                message = json.loads(line)
+                if message["type"] == MessageType.OUTPUT:
+                    out.write(message["text"])
+                    out.flush()
+                elif message["type"] == MessageType.RESULT:
+                    return message
+    raise DaemonNotRunningException(
+        f"Daemon on {socket_path} closed the connection without a result"
+    )
@@ -1,15 +1,66 @@
+import hashlib
 import os
+import secrets
 from contextlib import contextmanager
 from pathlib import Path
+from typing import Final
+
+HASH_CHUNK_SIZE: Final[int] = 1024 * 1024
+STATE_FOLDER_NAME: Final[str] = ".flexlate-dev"
 
 
 @contextmanager
 def change_directory_to(path: Path):
     current_path = os.getcwd()
     os.chdir(path)
-    yield
-    os.chdir(current_path)
+    try:
+        yield
+    finally:
+        os.chdir(current_path)
 
 
 def directory_has_files_or_directories(path: Path):
     return len(list(path.iterdir())) > 0
+
+
+def read_text_keep_new_lines(path: Path) -> str:
+    """
+    Reads the file without translating new lines, unlike Path.read_text
+    """
+    with open(path, encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+def write_text_atomically(path: Path, content: str):
+    """
+    Writes the content to a temporary file next to the path and then replaces the
+    path with it, so that the file is never seen partially written. Keeps the
+    permissions of an existing file.
+    """
+    mode = path.stat().st_mode if path.exists() else None
+    temp_path = path.parent / f".{path.name}.{secrets.token_hex(4)}.tmp"
+    # Exclusive create so that new files get the default permissions from the umask
+    with open(temp_path, "x", encoding="utf-8", newline="") as f:
+        f.write(content)
+    try:
+        if mode is not None:
+            os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def hash_file(path: Path) -> bytes:
+    file_hash = hashlib.blake2b()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            file_hash.update(chunk)
+    return file_hash.digest()
+
+
+def get_state_folder(out_root: Path) -> Path:
+    """
+    Folder in the output root for flexlate-dev to keep state between runs
+    """
+    return out_root / STATE_FOLDER_NAME
@@ -16,3 +16,35 @@ class NoSuchDataException(UserInputException):
 
 class NoSuchCommandException(UserInputException):
     pass
+
+
+class CircularExtendsException(UserInputException):
+    pass
+
+
+class DaemonNotRunningException(UserInputException):
+    pass
+
+
+class CancelledException(FlexlateDevException):
+    pass
+
+
+class PatchApplyException(FlexlateDevException):
+    pass
+
+
+class PublishFailedException(FlexlateDevException):
+    pass
+
+
+class CommandFailedException(FlexlateDevException):
+    pass
+
+
+class CommandTimeoutException(CommandFailedException):
+    pass
+
+
+class CommandDependencyException(UserInputException):
+    pass
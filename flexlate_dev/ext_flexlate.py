@@ -1,7 +1,8 @@
 from pathlib import Path
 from typing import List
 
-from flexlate.config import TemplateSource
+from flexlate.branch_update import get_flexlate_branch_name
+from flexlate.config import AppliedTemplateConfig, TemplateSource
 from flexlate.config_manager import ConfigManager
 from flexlate.exc import CannotParseCommitMessageFlexlateTransaction
 from flexlate.ext_git import get_commits_between_two_commits
@@ -23,6 +24,23 @@ def get_template_path_from_project_path(project_path: Path) -> str:
     return ts.path
 
 
+def get_render_root_in_project_from_project_path(project_path: Path) -> Path:
+    at = _get_applied_template_from_project_path(project_path)
+    return project_path / at.root
+
+
+def _get_applied_template_from_project_path(
+    project_path: Path,
+) -> AppliedTemplateConfig:
+    config_manager = ConfigManager()
+    config = config_manager.load_config(project_path)
+    if len(config.applied_templates) != 1:
+        raise ValueError(
+            "Must have only a single applied template to extract render root"
+        )
+    return config.applied_templates[0]
+
+
 def _get_template_source_from_project_path(project_path: Path) -> TemplateSource:
     config_manager = ConfigManager()
     config = config_manager.load_config(project_path)
@@ -42,9 +60,22 @@ def get_non_flexlate_commits_between_commits(
     template_branch_name: str,
 ) -> List[Commit]:
     between_commits = get_commits_between_two_commits(repo, start, end)
+    # Flexlate merges into branches named after the current branch, such as when
+    # the project has commits that are not on the template branch
+    branch_names = [(merged_branch_name, template_branch_name)]
+    if not repo.head.is_detached:
+        branch_names.append(
+            (
+                get_flexlate_branch_name(repo, merged_branch_name),
+                get_flexlate_branch_name(repo, template_branch_name),
+            )
+        )
     non_flexlate_commits: List[Commit] = []
     for commit in between_commits:
-        if _is_flexlate_merge_commit(commit, merged_branch_name, template_branch_name):
+        if any(
+            _is_flexlate_merge_commit(commit, merged_name, template_name)
+            for merged_name, template_name in branch_names
+        ):
             continue
         try:
             FlexlateTransaction.parse_commit_message(commit.message)
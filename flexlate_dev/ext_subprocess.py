@@ -1,21 +1,182 @@
+import asyncio
+import codecs
+import contextlib
 import subprocess
 import sys
-import threading
+from pathlib import Path
+from typing import IO, Dict, Final, Iterator, Optional, Tuple
 
+from flexlate_dev.cancellation import CancellationToken, kill_process_group
+from flexlate_dev.exc import CommandTimeoutException
 
-def run_command_stream_output(cmd: str):
-    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, shell=True)
-    _stream_output_from_process(process)
+OUTPUT_CHUNK_SIZE: Final[int] = 64 * 1024
+# Chunks of output waiting to be written. Once full, reading from the process pauses,
+# so a command producing output faster than it can be written doesn't use up memory
+MAX_BUFFERED_OUTPUT_CHUNKS: Final[int] = 16
 
+# Whether the chunk is from stderr, and the chunk. An empty chunk ends the stream
+_OutputChunk = Tuple[bool, bytes]
 
-def run_command_in_background_stream_output(cmd: str):
-    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, shell=True)
-    output_thread = threading.Thread(
-        target=_stream_output_from_process, args=(process,), daemon=True
+
+def run_command_stream_output(
+    cmd: str,
+    cancellation_token: Optional[CancellationToken] = None,
+    output_prefix: str = "",
+    timeout: Optional[float] = None,
+    cwd: Optional[Path] = None,
+) -> int:
+    """
+    Runs the command, writing its stdout and stderr as they are produced.
+
+    :param output_prefix: Prefix for each line of output
+    :param timeout: Seconds after which the command is killed
+    :param cwd: Directory to run the command in, defaults to the current directory
+    :raises CommandTimeoutException: If the command did not finish within the timeout
+    :return: The exit code of the command
+    """
+    return asyncio.run(
+        _run_command_stream_output(cmd, cancellation_token, output_prefix, timeout, cwd)
+    )
+
+
+async def _run_command_stream_output(
+    cmd: str,
+    cancellation_token: Optional[CancellationToken],
+    output_prefix: str,
+    timeout: Optional[float],
+    cwd: Optional[Path],
+) -> int:
+    # Start a new process group so that cancelling or timing out also kills the
+    # children of the shell
+    process = await asyncio.create_subprocess_shell(
+        cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=True,
+        cwd=cwd,
+    )
+    with _track_process(cancellation_token, process):
+        try:
+            await asyncio.wait_for(
+                _stream_output_and_wait(process, output_prefix), timeout
+            )
+        except asyncio.TimeoutError:
+            raise CommandTimeoutException(
+                f"Command {cmd} did not finish within {timeout} seconds"
+            )
+        finally:
+            if process.returncode is None:
+                kill_process_group(process)
+                await process.wait()
+    return process.returncode  # type: ignore
+
+
+async def _stream_output_and_wait(
+    process: asyncio.subprocess.Process, output_prefix: str
+):
+    await _stream_output(process.stdout, process.stderr, output_prefix)  # type: ignore
+    await process.wait()
+
+
+async def _stream_output(
+    stdout: asyncio.StreamReader, stderr: asyncio.StreamReader, output_prefix: str
+):
+    queue: "asyncio.Queue[_OutputChunk]" = asyncio.Queue(
+        maxsize=MAX_BUFFERED_OUTPUT_CHUNKS
     )
-    output_thread.start()
+    readers = [
+        asyncio.create_task(_read_chunks(stdout, False, queue)),
+        asyncio.create_task(_read_chunks(stderr, True, queue)),
+    ]
+    writer = _OutputWriter(output_prefix)
+    open_streams = len(readers)
+    while open_streams:
+        is_stderr, chunk = await queue.get()
+        writer.write(is_stderr, chunk)
+        if not chunk:
+            open_streams -= 1
+    await asyncio.gather(*readers)
+
+
+async def _read_chunks(
+    stream: asyncio.StreamReader, is_stderr: bool, queue: "asyncio.Queue[_OutputChunk]"
+):
+    while True:
+        chunk = await stream.read(OUTPUT_CHUNK_SIZE)
+        await queue.put((is_stderr, chunk))
+        if not chunk:
+            return
+
+
+class _OutputWriter:
+    """
+    Writes chunks of output from stdout and stderr, prefixing each line
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self._decoders = {
+            is_stderr: codecs.getincrementaldecoder("utf-8")(errors="replace")
+            for is_stderr in (False, True)
+        }
+        self._at_line_start: Dict[bool, bool] = {False: True, True: True}
+
+    def write(self, is_stderr: bool, chunk: bytes):
+        # Chunks may end partway through a character
+        text = self._decoders[is_stderr].decode(chunk, final=not chunk)
+        if not text:
+            return
+        if self.prefix:
+            text = self._prefix_lines(is_stderr, text)
+        # Look up the stream on each write as it may be redirected
+        out = sys.stderr if is_stderr else sys.stdout
+        out.write(text)
+        out.flush()
+
+    def _prefix_lines(self, is_stderr: bool, text: str) -> str:
+        lines = text.splitlines(keepends=True)
+        prefixed = [
+            line
+            if i == 0 and not self._at_line_start[is_stderr]
+            else self.prefix + line
+            for i, line in enumerate(lines)
+        ]
+        self._at_line_start[is_stderr] = text.endswith("\n")
+        return "".join(prefixed)
+
+
+@contextlib.contextmanager
+def _track_process(
+    cancellation_token: Optional[CancellationToken],
+    process: asyncio.subprocess.Process,
+) -> Iterator[None]:
+    if cancellation_token is None:
+        yield
+        return
+    with cancellation_token.track_process(process):
+        yield
+
+
+def stream_output_from_process(process: subprocess.Popen, output_prefix: str = ""):
+    """
+    Writes the stdout and stderr of a process started with both piped until they
+    are closed, in the same way as run_command_stream_output.
+
+    :param output_prefix: Prefix for each line of output
+    """
+    asyncio.run(_stream_output_from_pipes(process, output_prefix))
+
+
+async def _stream_output_from_pipes(process: subprocess.Popen, output_prefix: str):
+    loop = asyncio.get_running_loop()
+    stdout = await _open_stream_reader(loop, process.stdout)  # type: ignore
+    stderr = await _open_stream_reader(loop, process.stderr)  # type: ignore
+    await _stream_output(stdout, stderr, output_prefix)
 
 
-def _stream_output_from_process(process: subprocess.Popen):
-    for line in iter(process.stdout.readline, b""):  # type: ignore
-        sys.stdout.write(line.decode("utf-8"))
+async def _open_stream_reader(
+    loop: asyncio.AbstractEventLoop, pipe: IO[bytes]
+) -> asyncio.StreamReader:
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+    return reader
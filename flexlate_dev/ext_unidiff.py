@@ -0,0 +1,98 @@
+"""
+Applies unidiff patches to file contents in memory
+"""
+from typing import Final, List, Sequence, Tuple
+
+from unidiff import Hunk, PatchedFile
+from unidiff.constants import (
+    LINE_TYPE_ADDED,
+    LINE_TYPE_CONTEXT,
+    LINE_TYPE_NO_NEWLINE,
+    LINE_TYPE_REMOVED,
+)
+
+from flexlate_dev.exc import PatchApplyException
+
+# How many lines away from the position in the hunk header to look for the hunk,
+# in case the file has changed elsewhere
+MAX_HUNK_OFFSET: Final[int] = 100
+
+
+def apply_patched_file_to_content(content: str, patched_file: PatchedFile) -> str:
+    """
+    Applies the hunks of the patched file to the content of the source file.
+
+    :raises PatchApplyException: If a hunk does not match the content
+    """
+    source_lines = split_lines_keep_ends(content)
+    result: List[str] = []
+    position = 0
+    for hunk in patched_file:
+        hunk_source, hunk_target = _get_hunk_source_and_target(hunk)
+        # Hunks without source lines are inserted after the start line
+        expected_start = (
+            hunk.source_start - 1 if hunk.source_length else hunk.source_start
+        )
+        start = _find_hunk_start(source_lines, hunk_source, expected_start, position)
+        result.extend(source_lines[position:start])
+        result.extend(hunk_target)
+        position = start + len(hunk_source)
+    result.extend(source_lines[position:])
+    return "".join(result)
+
+
+def split_lines_keep_ends(content: str) -> List[str]:
+    """
+    Splits only on new line characters, unlike str.splitlines, so that lines
+    match the lines in the diff
+    """
+    lines = content.split("\n")
+    with_ends = [line + "\n" for line in lines[:-1]]
+    if lines[-1]:
+        # Last line without a trailing new line
+        with_ends.append(lines[-1])
+    return with_ends
+
+
+def _get_hunk_source_and_target(hunk: Hunk) -> Tuple[List[str], List[str]]:
+    source: List[str] = []
+    target: List[str] = []
+    last_line_type = LINE_TYPE_CONTEXT
+    for line in hunk:
+        if line.line_type == LINE_TYPE_NO_NEWLINE:
+            # Marker applies to the previous line
+            if last_line_type in (LINE_TYPE_CONTEXT, LINE_TYPE_REMOVED):
+                source[-1] = _strip_new_line(source[-1])
+            if last_line_type in (LINE_TYPE_CONTEXT, LINE_TYPE_ADDED):
+                target[-1] = _strip_new_line(target[-1])
+            continue
+        if line.line_type in (LINE_TYPE_CONTEXT, LINE_TYPE_REMOVED):
+            source.append(line.value)
+        if line.line_type in (LINE_TYPE_CONTEXT, LINE_TYPE_ADDED):
+            target.append(line.value)
+        last_line_type = line.line_type
+    return source, target
+
+
+def _strip_new_line(line: str) -> str:
+    # The diff adds a new line before the marker, any carriage return is part of the content
+    if line.endswith("\n"):
+        return line[:-1]
+    return line
+
+
+def _find_hunk_start(
+    lines: Sequence[str],
+    hunk_source: Sequence[str],
+    expected_start: int,
+    min_start: int,
+) -> int:
+    for offset in range(MAX_HUNK_OFFSET + 1):
+        for start in {expected_start + offset, expected_start - offset}:
+            if start < min_start or start + len(hunk_source) > len(lines):
+                continue
+            if lines[start : start + len(hunk_source)] == list(hunk_source):
+                return start
+    raise PatchApplyException(
+        f"Could not find lines to patch near line {expected_start + 1}: {''.join(hunk_source)}"
+    )
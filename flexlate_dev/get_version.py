@@ -1,6 +1,17 @@
-# TODO: get version statically inside package by restructuring template
-import pkg_resources
+from importlib.metadata import PackageNotFoundError, version
+
+import flexlate_dev
 
 
 def get_flexlate_dev_version() -> str:
-    return pkg_resources.get_distribution("flexlate-dev").version
+    try:
+        return version("flexlate-dev")
+    except PackageNotFoundError:
+        # Running from a source checkout that is not installed
+        return flexlate_dev.__version__
+
+
+def get_flexlate_version() -> str:
+    # Read the metadata rather than using flexlate.get_version, as importing
+    # flexlate is slow and this is used on CLI startup
+    return version("flexlate")
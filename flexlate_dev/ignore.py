@@ -1,47 +1,375 @@
+import fnmatch
 import os.path
+import re
 from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
-from typing import Callable, Final, List, Union
+from typing import (
+    Callable,
+    Dict,
+    Final,
+    Iterator,
+    List,
+    Optional,
+    Pattern,
+    Sequence,
+    Union,
+)
 
-from pathspec import PathSpec
+from pathspec.patterns import GitWildMatchPattern
 
 ALWAYS_IGNORE: Final[List[str]] = [".git/"]
+# Paths whose result is remembered, enough for the files touched by a large rebuild
+DEFAULT_MATCH_CACHE_SIZE: Final[int] = 8192
 
 
 @dataclass
 class IgnoreSpecification:
     ignore_list: List[str]
-    _ignore_matches: Callable[[Union[str, Path]], bool] = field(init=False)
+    _ignore_matches: "GitIgnoreMatcher" = field(init=False)
+    _directory_is_fully_ignored: Callable[[Path], bool] = field(init=False)
 
     def __post_init__(self):
         self._ignore_matches = self._build_ignore_matches()
+        self._directory_is_fully_ignored = lru_cache(maxsize=DEFAULT_MATCH_CACHE_SIZE)(
+            self._check_directory_is_fully_ignored
+        )
 
     @property
     def all_ignores(self) -> List[str]:
         return [*ALWAYS_IGNORE, *self.ignore_list]
 
-    def _build_ignore_matches(self) -> Callable[[str], bool]:
+    def _build_ignore_matches(self) -> "GitIgnoreMatcher":
         return parse_gitignore_list_into_matcher(self.all_ignores)
 
-    def file_is_ignored(self, file_path: Union[str, Path]) -> bool:
-        return self._ignore_matches(file_path)
+    def file_is_ignored(
+        self, file_path: Union[str, Path], is_dir: Optional[bool] = None
+    ) -> bool:
+        """
+        :param is_dir: Whether the path is a directory, when known. Otherwise it is
+            checked on the file system
+        """
+        return self._ignore_matches(file_path, is_dir)
+
+    def directory_is_fully_ignored(self, directory: Path) -> bool:
+        """
+        Whether the directory and everything in it is ignored, so that it can be
+        skipped without looking inside. A directory is not fully ignored if a negation
+        could re-include anything within it.
+
+        :param directory: Path to the directory, relative to the root of the ignores
+        """
+        return self._directory_is_fully_ignored(directory)
+
+    def _check_directory_is_fully_ignored(self, directory: Path) -> bool:
+        if not self._ignore_matches(directory, is_dir=True):
+            return False
+        return not any(
+            _negation_could_match_within(pattern[1:], directory.parts)
+            for pattern in self.all_ignores
+            if pattern.startswith("!")
+        )
+
+
+class GitIgnoreMatcher:
+    """
+    Matches paths against gitignore patterns. The patterns are combined into one
+    regex and the results for recent paths are remembered, as the watcher checks
+    every file system event.
+    """
 
+    def __init__(
+        self, patterns: Sequence[str], cache_size: int = DEFAULT_MATCH_CACHE_SIZE
+    ):
+        """
+        :param cache_size: Number of paths to remember the result for
+        """
+        self._regex: Optional[Pattern[str]] = None
+        # Whether the pattern in each alternative of the regex ignores or re-includes
+        self._include_by_group: Dict[int, bool] = {}
+        alternatives: List[str] = []
+        group = 1
+        # The last matching pattern decides, but the regex takes the first matching
+        # alternative, so add them in reverse
+        for pattern in reversed([GitWildMatchPattern(line) for line in patterns]):
+            if pattern.include is None:
+                # Comment or blank line
+                continue
+            alternatives.append(f"({_remove_group_names(pattern.regex.pattern)})")
+            self._include_by_group[group] = pattern.include
+            group += 1 + pattern.regex.groups
+        if alternatives:
+            self._regex = re.compile("|".join(alternatives))
+        self._cached_matches = lru_cache(maxsize=cache_size)(self._matches)
 
-def parse_gitignore_list_into_matcher(
-    gitignore_list: List[str],
-) -> Callable[[Union[str, Path]], bool]:
-    spec = PathSpec.from_lines("gitwildmatch", gitignore_list)
+    def __call__(
+        self, file_path: Union[str, Path], is_dir: Optional[bool] = None
+    ) -> bool:
+        """
+        :param is_dir: Whether the path is a directory, when known. Otherwise it is
+            checked on the file system
+        """
+        return self.check(file_path, is_dir) is True
 
-    def matcher(file_path: Union[str, Path]) -> bool:
+    def check(
+        self, file_path: Union[str, Path], is_dir: Optional[bool] = None
+    ) -> Optional[bool]:
         """
-        Adjust the base_matcher from pathspec gitwildmatch so that passed
-        directories end in a trailing slash.
+        Checks the path, telling apart paths that no pattern matches from paths that
+        a negation re-includes.
+
+        :return: Whether the last matching pattern ignores the path, or None if no
+            pattern matches it
         """
-        path = Path(file_path)
-        if path.is_dir():
-            match_path = str(path) + os.path.sep
-        else:
-            match_path = str(path)
-        return spec.match_file(match_path)
+        match_path = str(file_path).replace(os.path.sep, "/")
+        if is_dir is None:
+            is_dir = match_path.endswith("/") or Path(file_path).is_dir()
+        return self._cached_matches(match_path.rstrip("/"), is_dir)
+
+    def _matches(self, match_path: str, is_dir: bool) -> Optional[bool]:
+        if self._regex is None:
+            return None
+        # Directory patterns end in a slash, so they only match directories with one
+        match = self._regex.match(match_path + "/" if is_dir else match_path)
+        if match is None:
+            return None
+        return self._include_by_group[match.lastindex]  # type: ignore
+
+
+class GitIgnores:
+    """
+    Ignores from the .gitignore files and .git/info/exclude of the git repository
+    that contains a folder. The .gitignore file of a directory is only read once
+    something in the directory is checked, so walks that skip ignored directories
+    never read the files in them.
+
+    When the repository ignores the folder itself, such as a template generated into
+    an ignored build folder, its ignores don't apply to anything in the folder.
+    """
+
+    def __init__(self, root: Path, cache_size: int = DEFAULT_MATCH_CACHE_SIZE):
+        """
+        :param root: Folder that checked paths are relative to
+        :param cache_size: Number of paths to remember the result for
+        """
+        root = root.resolve()
+        self.repo_root = _find_repo_root(root)
+        self._root_in_repo = (
+            root.relative_to(self.repo_root) if self.repo_root is not None else None
+        )
+        self._exclude_matcher: Optional[GitIgnoreMatcher] = None
+        self._root_is_ignored = False
+        # Keyed by directory relative to the repository root
+        self._matchers: Dict[Path, Optional[GitIgnoreMatcher]] = {}
+        self._cached_is_ignored = lru_cache(maxsize=cache_size)(self._is_ignored)
+        self.clear_cache()
+
+    def is_ignored(self, path: Path, is_dir: bool) -> bool:
+        """
+        :param path: Path relative to the root
+        """
+        return self._cached_is_ignored(path, is_dir)
+
+    def clear_cache(self):
+        """
+        Forgets the read ignore files, so that changes to them are picked up.
+        """
+        self._matchers.clear()
+        self._cached_is_ignored.cache_clear()
+        if self.repo_root is not None:
+            self._exclude_matcher = _read_ignore_file(
+                self.repo_root / ".git" / "info" / "exclude"
+            )
+        self._root_is_ignored = self._root_in_repo is not None and any(
+            self._repo_path_is_ignored(directory, True)
+            for directory in [*reversed(self._root_in_repo.parents), self._root_in_repo]
+            if directory != Path(".")
+        )
+
+    def _is_ignored(self, path: Path, is_dir: bool) -> bool:
+        if self._root_in_repo is None or self._root_is_ignored or path == Path("."):
+            return False
+        # Git doesn't look inside ignored directories, so nothing in them can be
+        # re-included
+        if path.parent != Path(".") and self._cached_is_ignored(path.parent, True):
+            return True
+        return self._repo_path_is_ignored(self._root_in_repo / path, is_dir)
+
+    def _repo_path_is_ignored(self, repo_path: Path, is_dir: bool) -> bool:
+        """
+        Checks the path against the ignore files, without checking its parents.
+
+        :param repo_path: Path relative to the repository root
+        """
+        ignored: Optional[bool] = None
+        if self._exclude_matcher is not None:
+            ignored = self._exclude_matcher.check(repo_path, is_dir)
+        # Deeper ignore files take precedence, so check them last
+        for directory in reversed(repo_path.parents):
+            matcher = self._get_matcher(directory)
+            if matcher is None:
+                continue
+            result = matcher.check(repo_path.relative_to(directory), is_dir)
+            if result is not None:
+                ignored = result
+        return ignored is True
+
+    def _get_matcher(self, directory: Path) -> Optional[GitIgnoreMatcher]:
+        if directory not in self._matchers:
+            self._matchers[directory] = _read_ignore_file(
+                self.repo_root / directory / ".gitignore"  # type: ignore
+            )
+        return self._matchers[directory]
+
+
+class TemplateIgnores:
+    """
+    Ignores for a template folder, combining the configured ignores with those of
+    the git repository the template is in.
+    """
+
+    def __init__(self, root: Path, spec: Optional[IgnoreSpecification] = None):
+        """
+        :param spec: Configured ignores, defaults to only the ignores that always apply
+        """
+        self.root = root
+        self.spec = spec or IgnoreSpecification(ignore_list=[])
+        self.git_ignores = GitIgnores(root)
+
+    def file_is_ignored(self, path: Path, is_dir: Optional[bool] = None) -> bool:
+        """
+        :param path: Path relative to the root
+        :param is_dir: Whether the path is a directory, when known. Otherwise it is
+            checked on the file system
+        """
+        if is_dir is None:
+            is_dir = (self.root / path).is_dir()
+        return self.spec.file_is_ignored(path, is_dir) or self.git_ignores.is_ignored(
+            path, is_dir
+        )
+
+    def directory_is_fully_ignored(self, directory: Path) -> bool:
+        """
+        Whether the directory and everything in it is ignored. Git never re-includes
+        anything in an ignored directory.
+
+        :param directory: Path to the directory, relative to the root
+        """
+        return self.spec.directory_is_fully_ignored(
+            directory
+        ) or self.git_ignores.is_ignored(directory, True)
+
+    def clear_cache(self):
+        """
+        Picks up changes to the ignore files of the repository.
+        """
+        self.git_ignores.clear_cache()
+
+    def walk_unignored(self) -> Iterator[Path]:
+        return walk_unignored(self.root, self.directory_is_fully_ignored)
+
+    def walk_unignored_directories(self) -> Iterator["WalkedDirectory"]:
+        return walk_unignored_directories(self.root, self.directory_is_fully_ignored)
+
+
+@dataclass
+class WalkedDirectory:
+    """
+    A directory reached while walking, with all paths relative to the walked root
+    """
+
+    path: Path
+    directories: List[Path]
+    ignored_directories: List[Path]
+    files: List[Path]
+
+
+def walk_unignored_directories(
+    root: Path, directory_is_ignored: Optional[Callable[[Path], bool]] = None
+) -> Iterator[WalkedDirectory]:
+    """
+    Walks the directories in the root from the top down in a stable order without
+    entering ignored directories.
+
+    :param directory_is_ignored: Whether a directory and everything in it is ignored,
+        gets the path relative to the root. Defaults to the ignores that always apply
+        and those of the git repository the root is in
+    """
+    if directory_is_ignored is None:
+        directory_is_ignored = TemplateIgnores(root).directory_is_fully_ignored
+    for dir_path, dir_names, file_names in os.walk(root):
+        current = Path(dir_path).relative_to(root)
+        kept_dir_names: List[str] = []
+        ignored_dir_names: List[str] = []
+        for dir_name in sorted(dir_names):
+            if directory_is_ignored(current / dir_name):
+                ignored_dir_names.append(dir_name)
+            else:
+                kept_dir_names.append(dir_name)
+        # Don't descend into ignored directories
+        dir_names[:] = kept_dir_names
+        yield WalkedDirectory(
+            path=current,
+            directories=[current / dir_name for dir_name in kept_dir_names],
+            ignored_directories=[current / dir_name for dir_name in ignored_dir_names],
+            files=[current / file_name for file_name in sorted(file_names)],
+        )
+
+
+def walk_unignored(
+    root: Path, directory_is_ignored: Optional[Callable[[Path], bool]] = None
+) -> Iterator[Path]:
+    """
+    Walks the files in the root in a stable order without entering ignored directories.
+
+    :param directory_is_ignored: Whether a directory and everything in it is ignored,
+        gets the path relative to the root. Defaults to the ignores that always apply
+        and those of the git repository the root is in
+    :return: The paths of the files, relative to the root
+    """
+    for directory in walk_unignored_directories(root, directory_is_ignored):
+        yield from directory.files
+
+
+def parse_gitignore_list_into_matcher(gitignore_list: List[str]) -> GitIgnoreMatcher:
+    return GitIgnoreMatcher(gitignore_list)
+
+
+def _find_repo_root(path: Path) -> Optional[Path]:
+    for directory in [path, *path.parents]:
+        if (directory / ".git").exists():
+            return directory
+    return None
+
+
+def _read_ignore_file(path: Path) -> Optional[GitIgnoreMatcher]:
+    try:
+        lines = path.read_text(encoding="utf-8").splitlines()
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    # GitIgnores caches the result for each path, so don't cache here as well
+    return GitIgnoreMatcher(lines, cache_size=0)
+
+
+def _remove_group_names(regex: str) -> str:
+    # Patterns may use the same group names, which can't be combined into one regex
+    return re.sub(r"\(\?P<\w+>", "(", regex)
+
 
-    return matcher
+def _negation_could_match_within(pattern: str, directory_parts: Sequence[str]) -> bool:
+    """
+    Conservatively determines whether a negated pattern could re-include
+    something within the directory.
+    """
+    pattern = pattern.rstrip("/")
+    if "/" not in pattern:
+        # Matches by name at any depth
+        return True
+    pattern_parts = pattern.lstrip("/").split("/")
+    for pattern_part, directory_part in zip(pattern_parts, directory_parts):
+        if pattern_part == "**":
+            return True
+        if not fnmatch.fnmatchcase(directory_part, pattern_part):
+            return False
+    # Pattern refers to the directory, something in it or one of its parents
+    return True
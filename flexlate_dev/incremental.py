@@ -0,0 +1,120 @@
+"""
+Applies template changes directly to a generated project when they do not need
+to be rendered, so that the server can skip a full flexlate update.
+
+Unlike a flexlate update, the changes are committed straight onto the checked out
+branch of the project rather than rendered onto the flexlate template branch and
+merged in. The template branch catches up on the next full update, which renders the
+same content for these files, so merging it into the project does not conflict.
+The commits are marked with a trailer so that back sync does not send them back to
+the template.
+"""
+import shutil
+from pathlib import Path
+from typing import Final, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+from git import Repo
+
+from flexlate_dev.ext_flexlate import (
+    get_render_relative_root_in_template_from_project_path,
+    get_render_root_in_project_from_project_path,
+)
+from flexlate_dev.logger import log
+
+TEMPLATE_CONFIG_FILE_NAMES: Final[FrozenSet[str]] = frozenset(
+    ["copier.yml", "copier.yaml", "cookiecutter.json"]
+)
+JINJA_MARKERS: Final[Tuple[bytes, ...]] = (b"{{", b"{%", b"{#")
+INCREMENTAL_COMMIT_MESSAGE: Final[
+    str
+] = "chore: incremental update of non-templated files"
+# Added to the commits of incremental updates. Unlike the message, users won't
+# write it by hand
+INCREMENTAL_COMMIT_TRAILER: Final[str] = "Flexlate-Dev-Incremental-Update: true"
+
+# Template file and the output file it should be copied to
+IncrementalFileUpdate = Tuple[Path, Path]
+
+
+def plan_incremental_update(
+    template_path: Path, project_path: Path, changed_paths: Iterable[Path]
+) -> Optional[List[IncrementalFileUpdate]]:
+    """
+    Determines the files to copy from the template to the project for the changed paths.
+
+    :param template_path: Root of the template
+    :param project_path: Root of the generated project
+    :param changed_paths: Changed paths, relative to the template root
+    :return: The files to copy, or None if a full update is needed
+    """
+    render_root_in_template = get_render_relative_root_in_template_from_project_path(
+        project_path
+    )
+    render_root_in_project = get_render_root_in_project_from_project_path(project_path)
+    updates: List[IncrementalFileUpdate] = []
+    for changed_path in changed_paths:
+        if changed_path.name in TEMPLATE_CONFIG_FILE_NAMES:
+            log.debug(f"Template config {changed_path} changed, need full update")
+            return None
+        template_file = template_path / changed_path
+        if not template_file.is_file():
+            # Deleted files and directories may change the structure of the output
+            log.debug(f"{changed_path} is not an existing file, need full update")
+            return None
+        try:
+            relative_path = changed_path.relative_to(render_root_in_template)
+        except ValueError:
+            log.debug(f"{changed_path} is outside of the render root, need full update")
+            return None
+        if _is_templated(relative_path, template_file):
+            log.debug(f"{changed_path} is templated, need full update")
+            return None
+        out_file = render_root_in_project / relative_path
+        if not out_file.is_file():
+            # New files, renamed outputs and excluded files are left to the renderer
+            log.debug(f"{out_file} does not exist in the project, need full update")
+            return None
+        updates.append((template_file, out_file))
+    return updates
+
+
+def apply_incremental_update(
+    project_path: Path,
+    updates: Sequence[IncrementalFileUpdate],
+    commit_message: str = INCREMENTAL_COMMIT_MESSAGE,
+) -> bool:
+    """
+    Copies the planned files into the project and commits only those files onto
+    the checked out branch, bypassing the flexlate branches.
+
+    :return: Whether there were any changes to commit
+    """
+    for template_file, out_file in updates:
+        shutil.copyfile(template_file, out_file)
+    repo = Repo(project_path)
+    out_files = [str(out_file.relative_to(project_path)) for _, out_file in updates]
+    repo.git.add("--", *out_files)
+    if not repo.git.diff("--cached", "--name-only", "--", *out_files):
+        return False
+    repo.git.commit(
+        "-m", commit_message, "-m", INCREMENTAL_COMMIT_TRAILER, "--", *out_files
+    )
+    return True
+
+
+def is_incremental_update_commit_message(message: str) -> bool:
+    # Trailers are in the last paragraph of the message
+    trailers = message.strip().split("\n\n")[-1].splitlines()
+    return INCREMENTAL_COMMIT_TRAILER in (line.strip() for line in trailers)
+
+
+def project_has_uncommitted_changes(project_path: Path) -> bool:
+    return Repo(project_path).is_dirty(untracked_files=True)
+
+
+def _is_templated(relative_path: Path, template_file: Path) -> bool:
+    encoded_path = str(relative_path).encode("utf-8")
+    if any(marker in encoded_path for marker in JINJA_MARKERS):
+        return True
+    content = template_file.read_bytes()
+    return any(marker in content for marker in JINJA_MARKERS)
@@ -0,0 +1,166 @@
+"""
+Supervises commands that run in the background, such as a dev server started by a
+post_update hook. Each command runs at most once per output directory: running it
+again, as happens on every rebuild, restarts it rather than starting another copy.
+A command exiting on its own, rather than being restarted or stopped, is reported.
+"""
+import contextvars
+import os
+import signal
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Final, List, Optional, Tuple
+
+from flexlate_dev.ext_subprocess import stream_output_from_process
+from flexlate_dev.logger import log
+from flexlate_dev.styles import ALERT_STYLE, INFO_STYLE, print_styled
+from flexlate_dev.user_command import UserCommand
+
+DEFAULT_STOP_TIMEOUT_SECONDS: Final[float] = 5
+
+# Directory the command runs in and the identity of the command within it
+ProcessKey = Tuple[Path, str]
+
+
+@dataclass(frozen=True)
+class BackgroundCommandStatus:
+    name: str
+    directory: Path
+    pid: int
+    running: bool
+    exit_code: Optional[int]
+    starts: int
+    started_at: float
+
+
+@dataclass
+class _SupervisedProcess:
+    name: str
+    process: subprocess.Popen
+    starts: int
+    started_at: float
+
+
+class ProcessSupervisor:
+    def __init__(self, stop_timeout_seconds: float = DEFAULT_STOP_TIMEOUT_SECONDS):
+        """
+        :param stop_timeout_seconds: How long to wait for a process group to exit after
+            asking it to terminate before killing it
+        """
+        self.stop_timeout_seconds = stop_timeout_seconds
+        self._processes: Dict[ProcessKey, _SupervisedProcess] = {}
+        self._lock = threading.Lock()
+
+    def start(
+        self, command: UserCommand, directory: Optional[Path] = None
+    ) -> subprocess.Popen:
+        """
+        Starts the command in the background, stopping the instance of it that was
+        previously started in the same directory.
+
+        :param directory: Directory to run the command in, defaults to the current directory
+        """
+        if command.run is None:
+            raise ValueError(f"Cannot run command {command} as run=None")
+        directory = (directory or Path.cwd()).resolve()
+        key = (directory, _get_identity(command))
+        with self._lock:
+            previous = self._processes.get(key)
+            if previous is not None:
+                log.debug(f"Restarting background command {previous.name}")
+                _stop_process_group(previous.process, self.stop_timeout_seconds)
+            # Start a new process group so that stopping also stops its children
+            process = subprocess.Popen(
+                command.run,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                shell=True,
+                start_new_session=True,
+                cwd=directory,
+            )
+            self._processes[key] = _SupervisedProcess(
+                name=command.display_name,
+                process=process,
+                starts=previous.starts + 1 if previous is not None else 1,
+                started_at=time.time(),
+            )
+        # In a copy of the context, as the daemon routes the output of each request
+        # by its context
+        output_thread = threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(self._stream_output_and_report_exit, key, process),
+            daemon=True,
+        )
+        output_thread.start()
+        return process
+
+    def _stream_output_and_report_exit(
+        self, key: ProcessKey, process: subprocess.Popen
+    ):
+        stream_output_from_process(process)
+        exit_code = process.wait()
+        with self._lock:
+            supervised = self._processes.get(key)
+            # Otherwise it was restarted or stopped, which is expected
+            if supervised is None or supervised.process is not process:
+                return
+            name = supervised.name
+        print_styled(
+            f"Background command {name} in {key[0]} exited with code {exit_code}",
+            INFO_STYLE if exit_code == 0 else ALERT_STYLE,
+        )
+
+    def stop_all(self):
+        with self._lock:
+            processes = list(self._processes.values())
+            self._processes.clear()
+        for supervised in processes:
+            log.debug(f"Stopping background command {supervised.name}")
+            _stop_process_group(supervised.process, self.stop_timeout_seconds)
+
+    def statuses(self) -> List[BackgroundCommandStatus]:
+        with self._lock:
+            items = list(self._processes.items())
+        statuses: List[BackgroundCommandStatus] = []
+        for (directory, _), supervised in items:
+            exit_code = supervised.process.poll()
+            statuses.append(
+                BackgroundCommandStatus(
+                    name=supervised.name,
+                    directory=directory,
+                    pid=supervised.process.pid,
+                    running=exit_code is None,
+                    exit_code=exit_code,
+                    starts=supervised.starts,
+                    started_at=supervised.started_at,
+                )
+            )
+        return statuses
+
+
+def _get_identity(command: UserCommand) -> str:
+    # Prefer identities that stay the same when the rendered command changes
+    return command.id or command.name or command.run  # type: ignore
+
+
+def _stop_process_group(process: subprocess.Popen, timeout: float):
+    if process.poll() is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=timeout)
+    except ProcessLookupError:
+        return
+    except subprocess.TimeoutExpired:
+        log.debug(f"Process group {process.pid} did not terminate, killing it")
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            return
+        process.wait()
+
+
+process_supervisor: Final[ProcessSupervisor] = ProcessSupervisor()
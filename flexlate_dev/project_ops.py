@@ -1,5 +1,6 @@
+import threading
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Optional
 
 import jinja2
 from flexlate import Flexlate
@@ -8,6 +9,7 @@ from flexlate.config import FlexlateConfig
 from flexlate.template_data import TemplateData
 from git import Repo
 
+from flexlate_dev.cancellation import CancellationToken, raise_if_cancelled
 from flexlate_dev.config import (
     DEFAULT_PROJECT_NAME,
     FlexlateDevConfig,
@@ -16,11 +18,26 @@ from flexlate_dev.config import (
 from flexlate_dev.dirutils import directory_has_files_or_directories
 from flexlate_dev.ext_flexlate import get_template_path_from_project_path
 from flexlate_dev.gitutils import stage_and_commit_all
-from flexlate_dev.render import create_jinja_environment
+from flexlate_dev.incremental import (
+    apply_incremental_update,
+    plan_incremental_update,
+    project_has_uncommitted_changes,
+)
+from flexlate_dev.render import get_default_jinja_environment
+from flexlate_dev.staging import (
+    apply_staged_update,
+    get_staging_path,
+    prepare_staging_repo,
+    remove_staging_repo,
+)
 from flexlate_dev.styles import ACTION_REQUIRED_STYLE, INFO_STYLE, print_styled
+from flexlate_dev.timing import timeline
 from flexlate_dev.user_runner import CommandContext, RunnerHookType, run_user_hook
 
 fxt = Flexlate()
+# Flexlate changes the working directory while rendering, so only one project can be
+# rendered at a time in a process. Hooks still run in parallel
+_render_lock = threading.Lock()
 
 
 def update_or_initialize_project_get_folder(
@@ -35,9 +52,21 @@ def update_or_initialize_project_get_folder(
     auto_commit: bool = True,
     known_folder_name: Optional[str] = None,
     default_folder_name: str = DEFAULT_PROJECT_NAME,
+    cancellation_token: Optional[CancellationToken] = None,
+    staged: bool = False,
 ) -> str:
+    """
+    Updates the project if it exists, otherwise initializes it.
+
+    When a cancellation token is passed, an update stops at the next safe point after
+    the token is cancelled, raising CancelledException. Initialization is never
+    cancelled so that post-init commands always run.
+
+    :param staged: Run the update in a shadow clone next to the project and bring it
+        into the project in one step. Hooks still run in the project
+    """
     # TODO: Allow passing options to Jinja environment
-    jinja_env = create_jinja_environment()
+    jinja_env = get_default_jinja_environment()
 
     def init_project() -> str:
         return initialize_project_get_folder(
@@ -74,8 +103,15 @@ def update_or_initialize_project_get_folder(
         abort_on_conflict=abort_on_conflict,
         auto_commit=auto_commit,
     )
+    raise_if_cancelled(cancellation_token)
     run_user_hook(
-        RunnerHookType.PRE_CHECK, out_path, run_config, config, jinja_env, context
+        RunnerHookType.PRE_CHECK,
+        out_path,
+        run_config,
+        config,
+        jinja_env,
+        context,
+        cancellation_token=cancellation_token,
     )
 
     if out_path.exists() and directory_has_files_or_directories(out_path):
@@ -90,6 +126,8 @@ def update_or_initialize_project_get_folder(
             abort_on_conflict=abort_on_conflict,
             auto_commit=auto_commit,
             save=save,
+            cancellation_token=cancellation_token,
+            staged=staged,
         )
         return folder
 
@@ -111,13 +149,14 @@ def initialize_project_get_folder(
     save: bool = True,
     default_folder_name: str = DEFAULT_PROJECT_NAME,
 ) -> str:
-    folder = fxt.init_project_from(
-        str(template_path),
-        path=out_root,
-        no_input=no_input,
-        data=data,
-        default_folder_name=default_folder_name,
-    )
+    with _render_lock, timeline.phase("flexlate init"):
+        folder = fxt.init_project_from(
+            str(template_path),
+            path=out_root,
+            no_input=no_input,
+            data=data,
+            default_folder_name=default_folder_name,
+        )
     out_path = out_root / folder
 
     context = CommandContext.create(
@@ -146,15 +185,18 @@ def update_project(
     abort_on_conflict: bool = False,
     auto_commit: bool = True,
     save: bool = True,
+    cancellation_token: Optional[CancellationToken] = None,
+    staged: bool = False,
 ):
-    def run_update_check_was_aborted() -> bool:
+    def run_update_check_was_aborted(project_path: Path = out_path) -> bool:
         try:
-            fxt.update(
-                data=[data] if data else None,
-                no_input=no_input,
-                abort_on_conflict=abort_on_conflict,
-                project_path=out_path,
-            )
+            with _render_lock, timeline.phase("flexlate update"):
+                fxt.update(
+                    data=[data] if data else None,
+                    no_input=no_input,
+                    abort_on_conflict=abort_on_conflict,
+                    project_path=project_path,
+                )
             return False
         except flexlate_exc.TriedToCommitButNoChangesException:
             print_styled("Update did not have any changes", INFO_STYLE)
@@ -165,6 +207,32 @@ def update_project(
             )
             return True
 
+    def run_staged_update_check_was_aborted() -> bool:
+        if project_has_uncommitted_changes(out_path):
+            # Staging starts from the last commit, so it would miss the changes
+            raise flexlate_exc.GitRepoDirtyException(
+                f"{out_path} has uncommitted changes"
+            )
+        repo = Repo(out_path)
+        base_sha = repo.head.commit.hexsha
+        staging_path = get_staging_path(out_path)
+        try:
+            with timeline.phase("prepare staging"):
+                staging_repo = prepare_staging_repo(repo, staging_path)
+            if run_update_check_was_aborted(Path(staging_repo.working_dir)):
+                return True
+            raise_if_cancelled(cancellation_token)
+            with timeline.phase("apply staged update"):
+                apply_staged_update(repo, staging_repo, base_sha)
+        except BaseException:
+            # Kept between updates to be reused, but not when it may be left broken
+            remove_staging_repo(staging_path)
+            raise
+        return False
+
+    run_update = (
+        run_staged_update_check_was_aborted if staged else run_update_check_was_aborted
+    )
     template_path = Path(get_template_path_from_project_path(out_path))
     context = CommandContext.create(
         template_root=template_path,
@@ -175,20 +243,27 @@ def update_project(
         auto_commit=auto_commit,
     )
     run_user_hook(
-        RunnerHookType.PRE_UPDATE, out_path, run_config, config, jinja_env, context
+        RunnerHookType.PRE_UPDATE,
+        out_path,
+        run_config,
+        config,
+        jinja_env,
+        context,
+        cancellation_token=cancellation_token,
     )
 
     try:
-        aborted = run_update_check_was_aborted()
+        aborted = run_update()
     except flexlate_exc.GitRepoDirtyException:
         if auto_commit:
             repo = Repo(out_path)
-            stage_and_commit_all(repo, run_config.config.commit_message)
+            with timeline.phase("auto-commit"):
+                stage_and_commit_all(repo, run_config.config.commit_message)
             print_styled(
                 "Detected manual changes to generated files and auto_commit=True, committing",
                 INFO_STYLE,
             )
-            aborted = run_update_check_was_aborted()
+            aborted = run_update()
         else:
             print_styled(
                 "Detected manual changes to generated files and auto_commit=False. Please manually commit the changes to continue updating",
@@ -200,13 +275,83 @@ def update_project(
         # If update was not successful, skip post update hook and saving config
         return
 
+    raise_if_cancelled(cancellation_token)
     run_user_hook(
-        RunnerHookType.POST_UPDATE, out_path, run_config, config, jinja_env, context
+        RunnerHookType.POST_UPDATE,
+        out_path,
+        run_config,
+        config,
+        jinja_env,
+        context,
+        cancellation_token=cancellation_token,
     )
     if save:
         _save_config(out_path, config, run_config)
 
 
+def incrementally_update_project(
+    template_path: Path,
+    out_path: Path,
+    config: FlexlateDevConfig,
+    run_config: FullRunConfiguration,
+    changed_paths: Iterable[Path],
+    no_input: bool = False,
+    auto_commit: bool = True,
+    save: bool = False,
+    cancellation_token: Optional[CancellationToken] = None,
+) -> bool:
+    """
+    Updates the project by copying the changed template files that do not need rendering,
+    rather than running a full flexlate update.
+
+    :return: Whether the incremental update could be used. When False, nothing was
+        changed and a full update should be run instead.
+    """
+    if project_has_uncommitted_changes(out_path):
+        # Let the full update handle manual changes according to auto_commit
+        return False
+    updates = plan_incremental_update(template_path, out_path, changed_paths)
+    if updates is None:
+        return False
+
+    jinja_env = get_default_jinja_environment()
+    context = CommandContext.create(
+        template_root=template_path,
+        out_root=out_path,
+        no_input=no_input,
+        save=save,
+        auto_commit=auto_commit,
+    )
+    run_user_hook(
+        RunnerHookType.PRE_UPDATE,
+        out_path,
+        run_config,
+        config,
+        jinja_env,
+        context,
+        cancellation_token=cancellation_token,
+    )
+    with timeline.phase("incremental copy"):
+        has_changes = apply_incremental_update(out_path, updates)
+    if not has_changes:
+        print_styled("Update did not have any changes", INFO_STYLE)
+        return True
+    print_styled(
+        f"Incrementally updated {len(updates)} non-templated files", INFO_STYLE
+    )
+    raise_if_cancelled(cancellation_token)
+    run_user_hook(
+        RunnerHookType.POST_UPDATE,
+        out_path,
+        run_config,
+        config,
+        jinja_env,
+        context,
+        cancellation_token=cancellation_token,
+    )
+    return True
+
+
 def _save_config(
     out_path: Path, config: FlexlateDevConfig, run_config: FullRunConfiguration
 ):
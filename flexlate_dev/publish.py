@@ -1,12 +1,33 @@
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Sequence
 
 from flexlate.template_data import TemplateData
+from rich.table import Table
 
-from flexlate_dev.config import DEFAULT_PROJECT_NAME, load_config
+from flexlate_dev.config import (
+    DEFAULT_PROJECT_NAME,
+    FlexlateDevConfig,
+    FullRunConfiguration,
+    load_config,
+)
 from flexlate_dev.dict_merge import merge_dicts_preferring_non_none
+from flexlate_dev.exc import PublishFailedException, UserInputException
 from flexlate_dev.external_command_type import ExternalCLICommandType
 from flexlate_dev.project_ops import update_or_initialize_project_get_folder
+from flexlate_dev.publish_state import (
+    get_publish_fingerprint,
+    publish_is_up_to_date,
+    save_publish_state,
+)
+from flexlate_dev.styles import INFO_STYLE, console, print_styled
 
 
 def publish_template(
@@ -19,8 +40,43 @@ def publish_template(
     abort_on_conflict: bool = False,
     data: Optional[TemplateData] = None,
     folder_name: Optional[str] = None,
+    skip_unchanged: bool = False,
+    config: Optional[FlexlateDevConfig] = None,
+):
+    """
+    Publishes the template for the run configuration.
+
+    :param skip_unchanged: Skip publishing if the template, configuration and versions
+        are the same as the last successful publish of this run configuration
+    :param config: Already loaded configuration to use rather than loading it
+        from config_path
+    """
+    _publish_template_with_config(
+        template_path,
+        out_root,
+        config if config is not None else load_config(config_path),
+        run_config_name=run_config_name,
+        no_input=no_input,
+        save=save,
+        abort_on_conflict=abort_on_conflict,
+        data=data,
+        folder_name=folder_name,
+        skip_unchanged=skip_unchanged,
+    )
+
+
+def _publish_template_with_config(
+    template_path: Path,
+    out_root: Path,
+    config: FlexlateDevConfig,
+    run_config_name: Optional[str] = None,
+    no_input: bool = False,
+    save: bool = False,
+    abort_on_conflict: bool = False,
+    data: Optional[TemplateData] = None,
+    folder_name: Optional[str] = None,
+    skip_unchanged: bool = False,
 ):
-    config = load_config(config_path)
     run_config = config.get_full_run_config(
         ExternalCLICommandType.PUBLISH, run_config_name
     )
@@ -29,6 +85,24 @@ def publish_template(
         run_config.data.data if run_config.data else {}, data or {}
     )
 
+    fingerprint: Optional[str] = None
+    if skip_unchanged:
+        use_folder_name = _get_publish_folder_name(run_config, folder_name)
+        fingerprint = get_publish_fingerprint(
+            template_path, config, run_config, use_data, use_folder_name
+        )
+        if (
+            fingerprint is not None
+            and (out_root / use_folder_name).exists()
+            and publish_is_up_to_date(out_root, run_config_name, fingerprint)
+        ):
+            print_styled(
+                f"Skipping publish of {run_config_name or 'default'} as nothing "
+                f"changed since it was last published",
+                INFO_STYLE,
+            )
+            return
+
     update_or_initialize_project_get_folder(
         template_path,
         out_root,
@@ -39,11 +113,29 @@ def publish_template(
         auto_commit=False,
         save=save,
         abort_on_conflict=abort_on_conflict,
-        default_folder_name=folder_name
-        or (
-            run_config.data.use_folder_name if run_config.data else DEFAULT_PROJECT_NAME
-        ),
+        default_folder_name=_get_publish_folder_name(run_config, folder_name),
     )
+    if fingerprint is None:
+        return
+    if save:
+        # Saving stores the data and folder name in the config, so fingerprint the
+        # saved configuration that the next publish will load
+        run_config = config.get_full_run_config(
+            ExternalCLICommandType.PUBLISH, run_config_name
+        )
+        use_data = merge_dicts_preferring_non_none(
+            run_config.data.data if run_config.data else {}, data or {}
+        )
+        fingerprint = get_publish_fingerprint(
+            template_path,
+            config,
+            run_config,
+            use_data,
+            _get_publish_folder_name(run_config, folder_name),
+        )
+        if fingerprint is None:
+            return
+    save_publish_state(out_root, run_config_name, fingerprint)
 
 
 def publish_all_templates(
@@ -57,25 +149,239 @@ def publish_all_templates(
     abort_on_conflict: bool = False,
     data: Optional[TemplateData] = None,
     folder_name: Optional[str] = None,
+    jobs: int = 1,
+    skip_unchanged: bool = False,
+    config: Optional[FlexlateDevConfig] = None,
 ):
-    config = load_config(config_path)
-    exclude = exclude or []
-    run_config_names = [
-        name
-        for name in config.get_run_config_names(
-            always_include_default=always_include_default
+    """
+    Publishes the template for each run configuration.
+
+    :param jobs: Number of run configurations to publish at once in separate processes.
+        Run configurations that publish to the same folder are always published one
+        after another. With more than one job, the output of each run configuration
+        is shown once it finishes, followed by a summary, and PublishFailedException
+        is raised if any of them failed
+    :param config: Already loaded configuration to use rather than loading it
+        from config_path. Parallel jobs always load it from config_path
+    """
+    if jobs > 1 and not no_input:
+        raise UserInputException("Publishing with multiple jobs requires --no-input")
+    if jobs > 1 and save:
+        raise UserInputException(
+            "Publishing with multiple jobs cannot save the config as it would be "
+            "written by multiple processes"
         )
-        if name not in exclude
-    ]
+    config = config if config is not None else load_config(config_path)
+    run_config_names = get_run_config_names_to_publish(
+        config, always_include_default, exclude
+    )
+    if jobs > 1:
+        _publish_in_parallel(
+            config,
+            run_config_names,
+            jobs,
+            dict(
+                template_path=template_path,
+                out_root=out_root,
+                config_path=config_path,
+                no_input=no_input,
+                save=save,
+                abort_on_conflict=abort_on_conflict,
+                data=data,
+                folder_name=folder_name,
+                skip_unchanged=skip_unchanged,
+            ),
+        )
+        return
     for run_config_name in run_config_names:
-        publish_template(
+        _publish_template_with_config(
             template_path,
             out_root,
+            config,
             run_config_name=run_config_name,
-            config_path=config_path,
             no_input=no_input,
             save=save,
             abort_on_conflict=abort_on_conflict,
             data=data,
             folder_name=folder_name,
+            skip_unchanged=skip_unchanged,
+        )
+
+
+@dataclass
+class PublishResult:
+    run_config_name: str
+    folder_name: str
+    duration_seconds: float
+    output: str
+    error: Optional[str] = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+
+def _publish_in_parallel(
+    config: FlexlateDevConfig,
+    run_config_names: List[str],
+    jobs: int,
+    publish_kwargs: Dict[str, Any],
+):
+    # Run configurations publishing to the same folder can't run at the same time
+    groups: Dict[str, List[str]] = {}
+    for run_config_name in run_config_names:
+        run_config = config.get_full_run_config(
+            ExternalCLICommandType.PUBLISH, run_config_name
+        )
+        folder_name = _get_publish_folder_name(
+            run_config, publish_kwargs["folder_name"]
+        )
+        groups.setdefault(folder_name, []).append(run_config_name)
+
+    print_styled(
+        f"Publishing {len(run_config_names)} run configurations with {jobs} jobs",
+        INFO_STYLE,
+    )
+    results: List[PublishResult] = []
+    # Spawn rather than fork as the parent may have running threads
+    mp_context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=mp_context) as executor:
+        futures = [
+            executor.submit(
+                _publish_group_capturing_output, folder_name, names, publish_kwargs
+            )
+            for folder_name, names in groups.items()
+        ]
+        for future in as_completed(futures):
+            for result in future.result():
+                _print_prefixed_output(result)
+                results.append(result)
+
+    # Show results in the order of the config
+    results.sort(key=lambda result: run_config_names.index(result.run_config_name))
+    console.print(_create_summary_table(results))
+    failed_names = [
+        result.run_config_name for result in results if not result.succeeded
+    ]
+    if failed_names:
+        raise PublishFailedException(
+            f"Publishing failed for run configurations: {', '.join(failed_names)}"
+        )
+
+
+def get_run_config_names_to_publish(
+    config: FlexlateDevConfig,
+    always_include_default: bool = False,
+    exclude: Optional[List[str]] = None,
+) -> List[str]:
+    exclude = exclude or []
+    return [
+        name
+        for name in config.get_run_config_names(
+            always_include_default=always_include_default
+        )
+        if name not in exclude
+    ]
+
+
+def get_publish_folders(
+    config: FlexlateDevConfig,
+    out_root: Path,
+    run_config_names: Sequence[Optional[str]],
+    folder_name: Optional[str] = None,
+) -> List[Path]:
+    """
+    Determines the folders the run configurations are published to
+    """
+    return [
+        out_root
+        / _get_publish_folder_name(
+            config.get_full_run_config(ExternalCLICommandType.PUBLISH, name),
+            folder_name,
+        )
+        for name in run_config_names
+    ]
+
+
+def _get_publish_folder_name(
+    run_config: FullRunConfiguration, folder_name: Optional[str]
+) -> str:
+    if folder_name is not None:
+        return folder_name
+    if run_config.data is None:
+        return DEFAULT_PROJECT_NAME
+    return run_config.data.use_folder_name
+
+
+def _publish_group_capturing_output(
+    folder_name: str, run_config_names: List[str], publish_kwargs: Dict[str, Any]
+) -> List[PublishResult]:
+    """
+    Publishes the run configurations one after another. Runs in a worker process, so
+    it is safe to redirect the output file descriptors, which also captures the
+    output of the hook commands.
+    """
+    publish_kwargs = dict(publish_kwargs)
+    config = load_config(publish_kwargs.pop("config_path"))
+    results: List[PublishResult] = []
+    for run_config_name in run_config_names:
+        with tempfile.TemporaryFile(mode="w+", encoding="utf-8") as output_file:
+            start = time.perf_counter()
+            error: Optional[str] = None
+            sys.stdout.flush()
+            sys.stderr.flush()
+            original_stdout = os.dup(1)
+            original_stderr = os.dup(2)
+            os.dup2(output_file.fileno(), 1)
+            os.dup2(output_file.fileno(), 2)
+            try:
+                _publish_template_with_config(
+                    config=config, run_config_name=run_config_name, **publish_kwargs
+                )
+            except Exception:
+                error = traceback.format_exc()
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os.dup2(original_stdout, 1)
+                os.dup2(original_stderr, 2)
+                os.close(original_stdout)
+                os.close(original_stderr)
+            output_file.seek(0)
+            results.append(
+                PublishResult(
+                    run_config_name=run_config_name,
+                    folder_name=folder_name,
+                    duration_seconds=time.perf_counter() - start,
+                    output=output_file.read(),
+                    error=error,
+                )
+            )
+    return results
+
+
+def _print_prefixed_output(result: PublishResult):
+    prefix = f"[{result.run_config_name}] "
+    output = result.output
+    if result.error is not None:
+        output += result.error
+    for line in output.splitlines():
+        sys.stdout.write(prefix + line + "\n")
+    sys.stdout.flush()
+
+
+def _create_summary_table(results: List[PublishResult]) -> Table:
+    table = Table(title="Publish summary")
+    table.add_column("Run configuration")
+    table.add_column("Folder")
+    table.add_column("Status")
+    table.add_column("Duration", justify="right")
+    for result in results:
+        status = "[green]succeeded" if result.succeeded else "[red]failed"
+        table.add_row(
+            result.run_config_name,
+            result.folder_name,
+            status,
+            f"{result.duration_seconds:.1f}s",
         )
+    return table
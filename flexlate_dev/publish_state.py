@@ -0,0 +1,105 @@
+"""
+Remembers what was last published for each run configuration so that publishing
+can be skipped when nothing that affects the output has changed.
+"""
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Dict, Final, Optional
+
+from flexlate.template_data import TemplateData
+from git import InvalidGitRepositoryError, NoSuchPathError, Repo
+from pydantic import BaseModel
+
+import flexlate_dev
+from flexlate_dev.config import FlexlateDevConfig, FullRunConfiguration
+from flexlate_dev.dirutils import (
+    get_state_folder,
+    hash_file,
+    read_text_keep_new_lines,
+    write_text_atomically,
+)
+from flexlate_dev.get_version import get_flexlate_version
+
+PUBLISH_STATE_FOLDER_NAME: Final[str] = "publish-state"
+
+
+class PublishState(BaseModel):
+    fingerprint: str
+
+
+def get_publish_fingerprint(
+    template_path: Path,
+    config: FlexlateDevConfig,
+    run_config: FullRunConfiguration,
+    data: TemplateData,
+    folder_name: str,
+) -> Optional[str]:
+    """
+    Fingerprints everything that affects the published output of a run configuration.
+
+    :return: The fingerprint, or None if the template is not a local folder and so
+        can't be fingerprinted
+    """
+    if not template_path.is_dir():
+        return None
+    payload: Dict[str, Any] = dict(
+        template_tree=_hash_template_tree(template_path, run_config),
+        template_version=_get_template_version(template_path),
+        run_config=run_config.config.dict(),
+        data_config=run_config.data.dict() if run_config.data else None,
+        commands=[command.dict() for command in config.commands],
+        data=data,
+        folder_name=folder_name,
+        flexlate_version=get_flexlate_version(),
+        flexlate_dev_version=flexlate_dev.__version__,
+    )
+    serialized = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.blake2b(serialized.encode("utf-8")).hexdigest()
+
+
+def publish_is_up_to_date(
+    out_root: Path, run_config_name: Optional[str], fingerprint: str
+) -> bool:
+    state_path = _get_state_path(out_root, run_config_name)
+    if not state_path.exists():
+        return False
+    state = PublishState.parse_raw(read_text_keep_new_lines(state_path))
+    return state.fingerprint == fingerprint
+
+
+def save_publish_state(
+    out_root: Path, run_config_name: Optional[str], fingerprint: str
+):
+    state_path = _get_state_path(out_root, run_config_name)
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    write_text_atomically(state_path, PublishState(fingerprint=fingerprint).json())
+
+
+def _get_state_path(out_root: Path, run_config_name: Optional[str]) -> Path:
+    # Separate files per run configuration so that parallel publishes don't conflict
+    name = run_config_name or "default"
+    return get_state_folder(out_root) / PUBLISH_STATE_FOLDER_NAME / f"{name}.json"
+
+
+def _hash_template_tree(template_path: Path, run_config: FullRunConfiguration) -> str:
+    tree_hash = hashlib.blake2b()
+    # Walks in a stable order, so the hash only depends on the content
+    for relative_path in run_config.create_template_ignores(
+        template_path
+    ).walk_unignored():
+        path = template_path / relative_path
+        if not path.is_file():
+            continue
+        tree_hash.update(str(relative_path).encode("utf-8"))
+        tree_hash.update(hash_file(path))
+    return tree_hash.hexdigest()
+
+
+def _get_template_version(template_path: Path) -> Optional[str]:
+    # Flexlate records the template commit in the project, so new commits change the output
+    try:
+        repo = Repo(template_path, search_parent_directories=True)
+        return repo.head.commit.hexsha
+    except (InvalidGitRepositoryError, NoSuchPathError, ValueError):
+        return None
@@ -1,4 +1,39 @@
-from jinja2 import Environment
+from functools import lru_cache
+from typing import Any, Final, Mapping, Optional, Type, Union
+
+from jinja2 import Environment, Template, nodes
+from jinja2.utils import LRUCache
+
+# Same as the number of templates Jinja keeps compiled by default
+DEFAULT_FROM_STRING_CACHE_SIZE: Final[int] = 400
+
+
+class CachingEnvironment(Environment):
+    """
+    Jinja environment that compiles each template string only once, so that
+    rendering the same commands on every rebuild doesn't recompile them.
+    """
+
+    def __init__(
+        self, from_string_cache_size: int = DEFAULT_FROM_STRING_CACHE_SIZE, **options
+    ):
+        super().__init__(**options)
+        # Thread safe, as hooks may be rendered from multiple threads
+        self._from_string_cache = LRUCache(from_string_cache_size)
+
+    def from_string(
+        self,
+        source: Union[str, nodes.Template],
+        globals: Optional[Mapping[str, Any]] = None,
+        template_class: Optional[Type[Template]] = None,
+    ) -> Template:
+        if globals or template_class is not None or not isinstance(source, str):
+            return super().from_string(source, globals, template_class)
+        template = self._from_string_cache.get(source)
+        if template is None:
+            template = super().from_string(source)
+            self._from_string_cache[source] = template
+        return template
 
 
 def create_jinja_environment(**options) -> Environment:
@@ -6,7 +41,17 @@ def create_jinja_environment(**options) -> Environment:
     Creates a jinja environment for rendering templates.
     :return: jinja2 environment
     """
-    env = Environment(
+    env = CachingEnvironment(
         **options,
     )
     return env
+
+
+@lru_cache(maxsize=None)
+def get_default_jinja_environment() -> Environment:
+    """
+    Gets the jinja environment with the default options, shared so that compiled
+    templates are reused between updates.
+    :return: jinja2 environment
+    """
+    return create_jinja_environment()
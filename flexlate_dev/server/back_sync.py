@@ -1,32 +1,59 @@
 import threading
-import time
 from pathlib import Path
-from typing import Optional, Union, cast
+from typing import Callable, Final, Optional, cast
 
-import patch
-from git import Repo
+from git import Commit, Repo  # type: ignore[attr-defined]
 from unidiff import PatchedFile, PatchSet
+from watchdog.events import (
+    FileSystemEvent,
+    FileSystemEventHandler,
+    FileSystemMovedEvent,
+)
+from watchdog.observers import Observer
+from watchdog.observers.api import BaseObserver
 
-from flexlate_dev.dirutils import change_directory_to
+from flexlate_dev.dirutils import read_text_keep_new_lines, write_text_atomically
 from flexlate_dev.ext_flexlate import (
     get_flexlate_branch_names_from_project_path,
     get_non_flexlate_commits_between_commits,
     get_render_relative_root_in_template_from_project_path,
 )
 from flexlate_dev.ext_threading import PropagatingThread
-from flexlate_dev.gitutils import stage_and_commit_all, temporary_branch_from_commits
+from flexlate_dev.ext_unidiff import apply_patched_file_to_content
+from flexlate_dev.gitutils import stage_and_commit_all
+from flexlate_dev.incremental import is_incremental_update_commit_message
 from flexlate_dev.logger import log
 from flexlate_dev.server.sync import SyncServerManager, pause_sync
 from flexlate_dev.styles import INFO_STYLE, print_styled
 
+# Back-sync is woken up by changes to the git refs, polling is only a fallback
+DEFAULT_FALLBACK_CHECK_INTERVAL_SECONDS: Final[int] = 10
+REBUILD_RECHECK_INTERVAL_SECONDS: Final[float] = 0.1
+
 
 def get_last_commit_sha(repo: Repo) -> str:
     return repo.head.commit.hexsha
 
 
 def get_diff_between_commits(repo: Repo, sha1: str, sha2: str) -> PatchSet:
-    diff_str = repo.git.diff(sha1, sha2)
-    return PatchSet(diff_str)
+    return _diff_tree(repo, sha1, sha2)
+
+
+def get_diff_for_commit(repo: Repo, commit: Commit) -> PatchSet:
+    """
+    Gets the changes made by the commit compared to its first parent, reading
+    only from the object database so that HEAD and the working tree are untouched
+    """
+    if not commit.parents:
+        return _diff_tree(repo, "--root", commit.hexsha)
+    return _diff_tree(repo, commit.parents[0].hexsha, commit.hexsha)
+
+
+def _diff_tree(repo: Repo, *args: str) -> PatchSet:
+    # Plumbing command so that user diff settings such as noprefix don't change the output
+    diff_str = repo.git.diff_tree("-p", "-M", "--no-commit-id", *args)
+    # GitPython strips the final new line of the output, but it is part of the last diff line
+    return PatchSet(diff_str + "\n")
 
 
 def commit_in_one_repo_with_another_repo_commit_message(
@@ -69,10 +96,10 @@ def _relative_path_from_diff_path(diff_path: str) -> Optional[Path]:
         raise ValueError(f"Unknown diff path {diff_path}")
 
 
-def apply_diff_between_commits_to_separate_project(
-    repo: Repo, sha1: str, sha2: str, project_path: Path
+def apply_commit_diff_to_separate_project(
+    repo: Repo, commit: Commit, project_path: Path
 ) -> None:
-    diff = get_diff_between_commits(repo, sha1, sha2)
+    diff = get_diff_for_commit(repo, commit)
     apply_diff_to_project(project_path, diff)
 
 
@@ -82,18 +109,17 @@ def apply_diff_to_project(project_path: Path, diff: PatchSet) -> None:
         apply_file_diff_to_project(project_path, file_diff)
 
 
-def _get_content_from_file_added_diff(diff: PatchedFile) -> str:
-    # Combine lines
-    return "\n".join(["".join([line.value for line in hunk]) for hunk in diff])
+def _apply_patch(diff: PatchedFile, file_path: Path, content: str) -> None:
+    new_content = apply_patched_file_to_content(content, diff)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    write_text_atomically(file_path, new_content)
 
 
-def _apply_patch(diff: Union[PatchedFile, PatchSet, str], project_path: Path) -> None:
-    # TODO: for some reason the patch library will add a new line to the end of the file
-    #  even when it is not supposed to have one
-    patch_set = patch.fromstring(str(diff).encode("utf-8"))
-    with change_directory_to(project_path):
-        patch_set.apply()
-    return
+def _is_incremental_update_commit(commit: Commit) -> bool:
+    message = commit.message
+    if isinstance(message, bytes):
+        message = message.decode("utf-8")
+    return is_incremental_update_commit_message(message)
 
 
 def is_pure_rename(diff: PatchedFile) -> bool:
@@ -117,11 +143,12 @@ def apply_file_diff_to_project(project_path: Path, diff: PatchedFile) -> None:
         target_path.parent.mkdir(parents=True, exist_ok=True)
         source_path.rename(target_path)
 
-    if diff.is_added_file:
+    def patch_target():
         out_path = cast(Path, target_path)
-        content = _get_content_from_file_added_diff(diff)
-        out_path.parent.mkdir(parents=True, exist_ok=True)
-        out_path.write_text(content)
+        _apply_patch(diff, out_path, read_text_keep_new_lines(out_path))
+
+    if diff.is_added_file:
+        _apply_patch(diff, cast(Path, target_path), "")
     elif diff.is_removed_file:
         out_path = cast(Path, source_path)
         out_path.unlink()
@@ -130,14 +157,47 @@ def apply_file_diff_to_project(project_path: Path, diff: PatchedFile) -> None:
     elif diff.is_rename:
         # Rename with modifications
         rename()
-        _apply_patch(diff, project_path)
+        patch_target()
     elif diff.is_modified_file:
         # Modifications in place
-        _apply_patch(diff, project_path)
+        patch_target()
     else:
         raise NotImplementedError("Unknown diff type")
 
 
+class GitRefChangeHandler(FileSystemEventHandler):
+    """
+    Calls back when HEAD, a branch or the packed refs of a repo change
+    """
+
+    def __init__(self, repo: Repo, on_change: Callable[[], None]):
+        super().__init__()
+        self.on_change = on_change
+        git_dir = Path(repo.git_dir)
+        common_dir = Path(repo.common_dir)
+        self.ref_files = {git_dir / "HEAD", common_dir / "packed-refs"}
+        self.heads_dir = common_dir / "refs" / "heads"
+        self.watch_dirs = {git_dir: False, common_dir: False, self.heads_dir: True}
+
+    def on_any_event(self, event: FileSystemEvent):
+        paths = [event.src_path]
+        if isinstance(event, FileSystemMovedEvent):
+            # Git writes refs to a lock file and then renames it
+            paths.append(event.dest_path)
+        if any(self._is_ref_path(Path(path)) for path in paths):
+            self.on_change()
+
+    def _is_ref_path(self, path: Path) -> bool:
+        if path.suffix == ".lock":
+            return False
+        return path in self.ref_files or self.heads_dir in path.parents
+
+    def schedule(self, observer: BaseObserver):
+        for path, recursive in self.watch_dirs.items():
+            if path.exists():
+                observer.schedule(self, str(path), recursive=recursive)
+
+
 class BackSyncServer:
     def __init__(
         self,
@@ -145,8 +205,12 @@ class BackSyncServer:
         project_folder: Path,
         sync_manager: SyncServerManager,
         auto_commit: bool = True,
-        check_interval_seconds: int = 1,
+        check_interval_seconds: int = DEFAULT_FALLBACK_CHECK_INTERVAL_SECONDS,
     ):
+        """
+        :param check_interval_seconds: How often to check for new commits in case
+            a change to the git refs was missed by the file watcher
+        """
         super().__init__()
         self.template_path = template_path
         self.project_folder = project_folder
@@ -162,6 +226,9 @@ class BackSyncServer:
         self.thread: Optional[threading.Thread] = None
         self.is_syncing = False
         self.is_sleeping = False
+        self._refs_changed = threading.Event()
+        self._stopping = False
+        self.observer = Observer()
         self.template_output_path = (
             self.template_path
             / get_render_relative_root_in_template_from_project_path(
@@ -175,41 +242,60 @@ class BackSyncServer:
     def start(self):
         if self.thread is not None:
             raise RuntimeError("Already started")
+        self._stopping = False
+        GitRefChangeHandler(self.project_repo, self._refs_changed.set).schedule(
+            self.observer
+        )
+        self.observer.start()
         # Run start_sync on a background thread
         self.thread = PropagatingThread(target=self.start_sync, daemon=True)
         self.thread.start()
 
     def stop(self):
         if self.thread is not None:
-            log.debug("Killing back sync thread")
-            self.thread.join(timeout=0.1)
+            log.debug("Stopping back sync thread")
+            self._stopping = True
+            self._refs_changed.set()
+            self.observer.stop()
+            self.observer.join()
+            self.observer = Observer()
+            self.thread.join()
             self.thread = None
 
     def start_sync(self):
-        while True:
+        while not self._stopping:
+            # Clear before checking so that a change during the check wakes up the next wait
+            self._refs_changed.clear()
             new_commit = get_last_commit_sha(self.project_repo)
             if self.last_commit == new_commit:
-                self._sleep()
+                self._wait_for_ref_change(self.check_interval_seconds)
+                continue
+            if not self.sync_manager.is_idle:
+                # Forward sync is still committing to the project, check again once it is done
+                self._wait_for_ref_change(REBUILD_RECHECK_INTERVAL_SECONDS)
                 continue
-            self.sync()
+            self.sync(new_commit)
             self.last_commit = new_commit
-            self._sleep()
 
-    def sync(self):
+    def sync(self, new_commit_sha: str):
+        """
+        Back-syncs the commits after the last synced commit up to the new commit.
+        """
         self.is_syncing = True
         try:
-            self._sync()
+            self._sync(new_commit_sha)
         finally:
             self.is_syncing = False
 
-    def _sleep(self):
+    def _wait_for_ref_change(self, timeout: float):
         self.is_sleeping = True
-        time.sleep(self.check_interval_seconds)
+        self._refs_changed.wait(timeout)
         self.is_sleeping = False
 
-    def _sync(self):
+    def _sync(self, new_commit_sha: str):
         last_commit = self.project_repo.commit(self.last_commit)
-        new_commit = self.project_repo.commit(get_last_commit_sha(self.project_repo))
+        # Not the latest commit, as commits after it are synced next time
+        new_commit = self.project_repo.commit(new_commit_sha)
         new_commits = get_non_flexlate_commits_between_commits(
             self.project_repo,
             last_commit,
@@ -217,6 +303,12 @@ class BackSyncServer:
             self.branch_names.merged_branch_name,
             self.branch_names.template_branch_name,
         )
+        # Incremental updates copied these changes from the template, don't send them back
+        new_commits = [
+            commit
+            for commit in new_commits
+            if not _is_incremental_update_commit(commit)
+        ]
         if not new_commits:
             log.debug("Skipping back-sync as there are no non-flexlate commits")
             return
@@ -225,22 +317,14 @@ class BackSyncServer:
             INFO_STYLE,
         )
         with pause_sync(self.sync_manager):
-            with temporary_branch_from_commits(
-                self.project_repo, last_commit, new_commits
-            ) as branch_info:
-                last_commit_sha = self.last_commit
-                for new_commit_sha in branch_info.commit_shas:
-                    apply_diff_between_commits_to_separate_project(
-                        self.project_repo,
-                        last_commit_sha,
-                        new_commit_sha,
-                        self.template_output_path,
+            for commit in new_commits:
+                apply_commit_diff_to_separate_project(
+                    self.project_repo, commit, self.template_output_path
+                )
+                if self.auto_commit:
+                    commit_in_one_repo_with_another_repo_commit_message(
+                        self.project_repo, self.template_repo, commit.hexsha
                     )
-                    if self.auto_commit:
-                        commit_in_one_repo_with_another_repo_commit_message(
-                            self.project_repo, self.template_repo, new_commit_sha
-                        )
-                    last_commit_sha = new_commit_sha
 
     def __enter__(self) -> "BackSyncServer":
         self.start()
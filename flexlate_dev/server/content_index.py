@@ -0,0 +1,113 @@
+"""
+Tracks the content of the template files so that events which did not change any
+content, such as touching a file or saving it without changes, don't cause rebuilds.
+"""
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Final, Iterable, Optional
+
+from flexlate_dev.dirutils import hash_file
+from flexlate_dev.ignore import walk_unignored
+
+# File systems may store modification times with a coarse resolution, so a file
+# modified shortly after it was hashed can keep the same size and modification time.
+# Those files are always hashed again, similar to git's racily clean entries.
+RACY_MODIFICATION_SECONDS: Final[int] = 2
+_RACY_MODIFICATION_NS: Final[int] = RACY_MODIFICATION_SECONDS * 1_000_000_000
+
+
+@dataclass(frozen=True)
+class FileFingerprint:
+    size: int
+    modified_ns: int
+    digest: bytes
+    hashed_at_ns: int
+
+    def stat_matches(self, stat: os.stat_result) -> bool:
+        if stat.st_size != self.size or stat.st_mtime_ns != self.modified_ns:
+            return False
+        # Only trust the stat information if the file was not modified around hashing
+        return self.modified_ns + _RACY_MODIFICATION_NS < self.hashed_at_ns
+
+
+class ContentHashIndex:
+    """
+    Index of the content hashes of the files in a directory, keyed by their path
+    relative to the directory. The size and modification time are checked first so
+    that only files that may have changed are hashed.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._fingerprints: Dict[Path, FileFingerprint] = {}
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+    def refresh(self, directory_is_ignored: Callable[[Path], bool]):
+        """
+        Updates the index to the current files, hashing only files that may have changed.
+
+        :param directory_is_ignored: Whether a directory and everything in it is ignored,
+            gets the path relative to the root. Files in ignored directories are not indexed
+        """
+        fingerprints: Dict[Path, FileFingerprint] = {}
+        for path in walk_unignored(self.root, directory_is_ignored):
+            fingerprint = self._current_fingerprint(path)
+            if fingerprint is not None:
+                fingerprints[path] = fingerprint
+        self._fingerprints = fingerprints
+
+    def changed_fingerprints(
+        self, paths: Iterable[Path]
+    ) -> Dict[Path, Optional[FileFingerprint]]:
+        """
+        Determines which of the paths have different content than when they were
+        last indexed. Directories and paths that don't exist are always considered changed.
+
+        :return: The current fingerprints of the changed paths, None for paths that
+            are not files. Pass to record once the changes have been handled
+        """
+        changed: Dict[Path, Optional[FileFingerprint]] = {}
+        for path in paths:
+            old_fingerprint = self._fingerprints.get(path)
+            new_fingerprint = self._current_fingerprint(path)
+            if (
+                old_fingerprint is None
+                or new_fingerprint is None
+                or new_fingerprint.digest != old_fingerprint.digest
+            ):
+                changed[path] = new_fingerprint
+        return changed
+
+    def record(self, fingerprints: Dict[Path, Optional[FileFingerprint]]):
+        for path, fingerprint in fingerprints.items():
+            if fingerprint is None:
+                self._fingerprints.pop(path, None)
+            else:
+                self._fingerprints[path] = fingerprint
+
+    def _current_fingerprint(self, path: Path) -> Optional[FileFingerprint]:
+        full_path = self.root / path
+        try:
+            stat = full_path.stat()
+        except OSError:
+            return None
+        if not full_path.is_file():
+            return None
+        old_fingerprint = self._fingerprints.get(path)
+        if old_fingerprint is not None and old_fingerprint.stat_matches(stat):
+            return old_fingerprint
+        hashed_at_ns = time.time_ns()
+        try:
+            digest = hash_file(full_path)
+        except OSError:
+            return None
+        return FileFingerprint(
+            size=stat.st_size,
+            modified_ns=stat.st_mtime_ns,
+            digest=digest,
+            hashed_at_ns=hashed_at_ns,
+        )
@@ -0,0 +1,7 @@
+"""
+Defaults for serving that are also used by the CLI, kept separate so that the
+CLI does not have to import the server to start up.
+"""
+from typing import Final
+
+DEFAULT_QUIET_PERIOD_SECONDS: Final[float] = 0.25
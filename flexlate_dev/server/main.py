@@ -2,14 +2,21 @@ import contextlib
 import tempfile
 import time
 from pathlib import Path
-from typing import Iterator, Optional
+from typing import Iterator, List, Optional
 
 from flexlate.template_data import TemplateData
 
-from flexlate_dev.config import FlexlateDevConfig, load_config
-from flexlate_dev.server.back_sync import BackSyncServer
+from flexlate_dev.config import FlexlateDevConfig, load_config, resolve_config_path
+from flexlate_dev.exc import UserInputException
+from flexlate_dev.process_supervisor import process_supervisor
+from flexlate_dev.server.back_sync import (
+    DEFAULT_FALLBACK_CHECK_INTERVAL_SECONDS,
+    BackSyncServer,
+)
+from flexlate_dev.server.defaults import DEFAULT_QUIET_PERIOD_SECONDS
 from flexlate_dev.server.sync import SyncServerManager, create_sync_server
-from flexlate_dev.styles import INFO_STYLE, SUCCESS_STYLE, print_styled
+from flexlate_dev.styles import ALERT_STYLE, INFO_STYLE, SUCCESS_STYLE, print_styled
+from flexlate_dev.timing import timeline
 
 
 def serve_template(
@@ -23,26 +30,59 @@ def serve_template(
     save: bool = False,
     data: Optional[TemplateData] = None,
     folder_name: Optional[str] = None,
+    quiet_period_seconds: float = DEFAULT_QUIET_PERIOD_SECONDS,
+    incremental: bool = False,
+    trace_path: Optional[Path] = None,
+    run_config_names: Optional[List[str]] = None,
+    serve_all: bool = False,
+    staged: bool = False,
 ):
+    """
+    :param run_config_names: Serve multiple run configurations from one watcher
+        rather than only run_config_name
+    :param serve_all: Serve every run configuration in the config, only including the
+        default when no others are defined
+    :param staged: Stage each update next to the output and bring it into the output
+        in one step, so that tools watching the output see a single change
+    """
     config = load_config(config_path)
+    if serve_all:
+        if run_config_name is not None or run_config_names:
+            raise UserInputException(
+                "Cannot pass run configuration names when serving all of them"
+            )
+        run_config_names = config.get_run_config_names()
+    if trace_path is not None:
+        timeline.start_recording()
 
-    with run_server(
-        config,
-        run_config_name=run_config_name,
-        template_path=template_path,
-        out_path=out_path,
-        back_sync=back_sync,
-        no_input=no_input,
-        auto_commit=auto_commit,
-        save=save,
-        data=data,
-        folder_name=folder_name,
-    ):
-        try:
-            while True:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            return
+    try:
+        with run_server(
+            config,
+            run_config_name=run_config_name,
+            template_path=template_path,
+            out_path=out_path,
+            back_sync=back_sync,
+            no_input=no_input,
+            auto_commit=auto_commit,
+            save=save,
+            data=data,
+            folder_name=folder_name,
+            quiet_period_seconds=quiet_period_seconds,
+            incremental=incremental,
+            config_path=resolve_config_path(config_path),
+            run_config_names=run_config_names,
+            staged=staged,
+        ):
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                return
+    finally:
+        if trace_path is not None:
+            timeline.stop_recording()
+            timeline.save_chrome_trace(trace_path)
+            print_styled(f"Saved timing trace to {trace_path}", INFO_STYLE)
 
 
 class ServerContext:
@@ -77,11 +117,29 @@ def run_server(
     no_input: bool = False,
     auto_commit: bool = True,
     back_sync_auto_commit: bool = True,
-    back_sync_check_interval_seconds: int = 1,
+    back_sync_check_interval_seconds: int = DEFAULT_FALLBACK_CHECK_INTERVAL_SECONDS,
     save: bool = False,
     data: Optional[TemplateData] = None,
     folder_name: Optional[str] = None,
+    quiet_period_seconds: float = DEFAULT_QUIET_PERIOD_SECONDS,
+    incremental: bool = False,
+    config_path: Optional[Path] = None,
+    run_config_names: Optional[List[str]] = None,
+    staged: bool = False,
 ) -> Iterator[ServerContext]:
+    """
+    :param config_path: Path the config was loaded from. When passed, changes to the
+        config are picked up without restarting the server
+    :param run_config_names: Serve multiple run configurations from one watcher
+        rather than only run_config_name, each to a folder named after it in out_path.
+        They are rebuilt one after another
+    :param staged: Stage each update next to the output and bring it into the output
+        in one step, so that tools watching the output see a single change
+    """
+    if back_sync and run_config_names is not None and len(run_config_names) > 1:
+        raise UserInputException(
+            "Back syncing is only supported when serving a single run configuration"
+        )
     temp_file: Optional[tempfile.TemporaryDirectory] = None
     if out_path is None:
         temp_file = tempfile.TemporaryDirectory()
@@ -90,36 +148,62 @@ def run_server(
         f"Starting server, watching for changes in {template_path}. Generating output at {out_path}",
         INFO_STYLE,
     )
-    with create_sync_server(
-        config,
-        template_path,
-        out_path,
-        run_config_name=run_config_name,
-        no_input=no_input,
-        auto_commit=auto_commit,
-        save=save,
-        data=data,
-        folder_name=folder_name,
-    ) as sync_manager:
-
-        out_folder = sync_manager.handler.out_path
-
-        print_styled(
-            f"Running auto-reloader, updating {out_folder} with changes to {template_path}",
-            SUCCESS_STYLE,
-        )
+    try:
+        with create_sync_server(
+            config,
+            template_path,
+            out_path,
+            run_config_name=run_config_name,
+            no_input=no_input,
+            auto_commit=auto_commit,
+            save=save,
+            data=data,
+            folder_name=folder_name,
+            quiet_period_seconds=quiet_period_seconds,
+            incremental=incremental,
+            config_path=config_path,
+            run_config_names=run_config_names,
+            staged=staged,
+        ) as sync_manager:
 
-        if back_sync:
-            with BackSyncServer(
-                template_path,
-                out_folder,
-                sync_manager,
-                auto_commit=back_sync_auto_commit,
-                check_interval_seconds=back_sync_check_interval_seconds,
-            ) as back_sync_manager:
-                yield ServerContext(sync_manager, back_sync_manager)
-        else:
-            yield ServerContext(sync_manager)
+            for output in sync_manager.handler.outputs:
+                print_styled(
+                    f"Running auto-reloader, updating {output.out_path} with changes to {template_path}",
+                    SUCCESS_STYLE,
+                )
+
+            if back_sync:
+                out_folder = sync_manager.handler.output.out_path
+                with BackSyncServer(
+                    template_path,
+                    out_folder,
+                    sync_manager,
+                    auto_commit=back_sync_auto_commit,
+                    check_interval_seconds=back_sync_check_interval_seconds,
+                ) as back_sync_manager:
+                    yield ServerContext(sync_manager, back_sync_manager)
+            else:
+                yield ServerContext(sync_manager)
+    finally:
+        _print_background_command_statuses()
+        # Background commands started by hooks must not outlive the server
+        process_supervisor.stop_all()
 
     if temp_file is not None:
         temp_file.cleanup()
+
+
+def _print_background_command_statuses():
+    for status in process_supervisor.statuses():
+        if status.running:
+            print_styled(
+                f"Stopping background command {status.name} in {status.directory}, "
+                f"started {status.starts} time(s)",
+                INFO_STYLE,
+            )
+        else:
+            print_styled(
+                f"Background command {status.name} in {status.directory} had "
+                f"exited with code {status.exit_code}, started {status.starts} time(s)",
+                INFO_STYLE if status.exit_code == 0 else ALERT_STYLE,
+            )
@@ -0,0 +1,151 @@
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional, Set, Tuple
+
+from flexlate_dev.cancellation import CancellationToken
+from flexlate_dev.exc import CancelledException
+from flexlate_dev.logger import log
+from flexlate_dev.server.defaults import DEFAULT_QUIET_PERIOD_SECONDS
+from flexlate_dev.timing import timeline
+
+RebuildCallback = Callable[[Set[Path], CancellationToken], None]
+PathFilter = Callable[[Set[Path]], Set[Path]]
+
+
+class RebuildScheduler:
+    """
+    Collects changed paths from the file watcher and runs a single rebuild per burst of changes.
+
+    A rebuild starts once no new changes have arrived for the quiet period. Changes that arrive
+    while a rebuild is running cancel it through its cancellation token, and the cancelled
+    changes are rebuilt together with the new ones. A rebuild that finishes before it
+    notices the cancellation is followed by exactly one more rebuild.
+    """
+
+    def __init__(
+        self,
+        rebuild: RebuildCallback,
+        quiet_period_seconds: float = DEFAULT_QUIET_PERIOD_SECONDS,
+        filter_paths: Optional[PathFilter] = None,
+    ):
+        """
+        :param rebuild: Called with the changed paths of each burst
+        :param quiet_period_seconds: Time without new changes before rebuilding
+        :param filter_paths: Called with the changed paths of each burst once it is
+            complete to select the paths that need a rebuild. No rebuild is run if none do
+        """
+        self.rebuild = rebuild
+        self.quiet_period_seconds = quiet_period_seconds
+        self.filter_paths = filter_paths
+        self.is_rebuilding = False
+        self._dirty_paths: Set[Path] = set()
+        self._last_change_time: float = 0.0
+        self._first_change_time: float = 0.0
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._current_token: Optional[CancellationToken] = None
+
+    @property
+    def has_pending_changes(self) -> bool:
+        with self._condition:
+            return len(self._dirty_paths) > 0
+
+    @property
+    def is_idle(self) -> bool:
+        return not self.is_rebuilding and not self.has_pending_changes
+
+    def mark_dirty(self, path: Path):
+        with self._condition:
+            self._last_change_time = time.perf_counter()
+            if not self._dirty_paths:
+                self._first_change_time = self._last_change_time
+            self._dirty_paths.add(path)
+            if self._current_token is not None:
+                # Newer changes supersede the in-flight rebuild
+                self._current_token.cancel()
+            self._condition.notify_all()
+
+    def start(self):
+        if self._thread is not None:
+            raise RuntimeError("Already started")
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the scheduler, cancelling any in-flight rebuild and waiting for it to exit.
+        Changes that have not been rebuilt yet are kept and will be rebuilt after the next start.
+        """
+        if self._thread is None:
+            return
+        with self._condition:
+            self._stopping = True
+            if self._current_token is not None:
+                self._current_token.cancel()
+            self._condition.notify_all()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            burst = self._wait_for_burst()
+            if burst is None:
+                return
+            dirty_paths, first_change_time = burst
+            token = self._current_token
+            assert token is not None
+            try:
+                if self.filter_paths is not None:
+                    dirty_paths = self.filter_paths(dirty_paths)
+                    if not dirty_paths:
+                        log.debug("No changed paths need a rebuild, skipping")
+                        continue
+                # Count the rebuild from the first change so the watcher delay is included
+                with timeline.build(
+                    "Rebuild", start=first_change_time, changed_paths=len(dirty_paths)
+                ):
+                    timeline.record(
+                        "watch delay", first_change_time, time.perf_counter()
+                    )
+                    self.rebuild(dirty_paths, token)
+            except CancelledException:
+                log.debug("Rebuild was cancelled, will rebuild with newer changes")
+                self._requeue(dirty_paths, first_change_time)
+            except Exception as e:
+                log.exception(e)
+            finally:
+                with self._condition:
+                    self._current_token = None
+                    self.is_rebuilding = False
+
+    def _wait_for_burst(self) -> Optional[Tuple[Set[Path], float]]:
+        with self._condition:
+            while not self._dirty_paths and not self._stopping:
+                self._condition.wait()
+            # Wait for changes to stop arriving so that the whole burst is rebuilt at once
+            while not self._stopping:
+                remaining = (
+                    self._last_change_time
+                    + self.quiet_period_seconds
+                    - time.perf_counter()
+                )
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            if self._stopping:
+                return None
+            dirty_paths = self._dirty_paths
+            self._dirty_paths = set()
+            self._current_token = CancellationToken()
+            self.is_rebuilding = True
+            return dirty_paths, self._first_change_time
+
+    def _requeue(self, paths: Set[Path], first_change_time: float):
+        with self._condition:
+            # Changes were waiting since the cancelled burst started
+            self._first_change_time = first_change_time
+            self._dirty_paths.update(paths)
+            self._condition.notify_all()
@@ -1,25 +1,67 @@
 import contextlib
+import functools
 import os
 from pathlib import Path
-from typing import Iterator, Optional
+from typing import (
+    Callable,
+    Dict,
+    Final,
+    FrozenSet,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 
-from flexlate import Flexlate
 from flexlate.template_data import TemplateData
 from git import Repo
-from watchdog.events import FileSystemEvent, FileSystemEventHandler
+from rich.markup import escape
+from watchdog.events import (
+    EVENT_TYPE_CREATED,
+    EVENT_TYPE_DELETED,
+    EVENT_TYPE_MODIFIED,
+    EVENT_TYPE_MOVED,
+    FileSystemEvent,
+    FileSystemEventHandler,
+    FileSystemMovedEvent,
+)
 from watchdog.observers import Observer
 
-from flexlate_dev.config import DEFAULT_PROJECT_NAME, FlexlateDevConfig
+from flexlate_dev.cancellation import CancellationToken
+from flexlate_dev.config import (
+    DEFAULT_PROJECT_NAME,
+    FlexlateDevConfig,
+    FullRunConfiguration,
+    load_config,
+)
 from flexlate_dev.dict_merge import merge_dicts_preferring_non_none
+from flexlate_dev.exc import CancelledException, UserInputException
 from flexlate_dev.external_command_type import ExternalCLICommandType
+from flexlate_dev.ignore import IgnoreSpecification, TemplateIgnores
 from flexlate_dev.logger import log
-from flexlate_dev.project_ops import update_or_initialize_project_get_folder
-from flexlate_dev.styles import INFO_STYLE, print_styled
+from flexlate_dev.project_ops import (
+    incrementally_update_project,
+    update_or_initialize_project_get_folder,
+)
+from flexlate_dev.server.content_index import ContentHashIndex, FileFingerprint
+from flexlate_dev.server.defaults import DEFAULT_QUIET_PERIOD_SECONDS
+from flexlate_dev.server.scheduler import RebuildScheduler
+from flexlate_dev.server.watches import TemplateWatches
+from flexlate_dev.styles import ALERT_STYLE, INFO_STYLE, print_styled
+from flexlate_dev.timing import timeline
 
-old = 0.0
+CHANGE_EVENT_TYPES: Final[FrozenSet[str]] = frozenset(
+    [EVENT_TYPE_CREATED, EVENT_TYPE_DELETED, EVENT_TYPE_MODIFIED, EVENT_TYPE_MOVED]
+)
 
 
-class ServerEventHandler(FileSystemEventHandler):
+class ServedOutput:
+    """
+    Output project of one of the served run configurations
+    """
+
     def __init__(
         self,
         config: FlexlateDevConfig,
@@ -31,8 +73,9 @@ class ServerEventHandler(FileSystemEventHandler):
         save: bool = False,
         data: Optional[TemplateData] = None,
         folder_name: Optional[str] = None,
+        incremental: bool = False,
+        staged: bool = False,
     ):
-        super().__init__()
         self.config = config
         self.run_config_name = run_config_name
         self.run_config = config.get_full_run_config(
@@ -45,9 +88,16 @@ class ServerEventHandler(FileSystemEventHandler):
         self.save = save
         self.cli_data = data
         self.cli_folder_name = folder_name
+        self.incremental = incremental
+        self.staged = staged
         self.folder: Optional[str] = None
         self.repo: Optional[Repo] = None
-        self.fxt = Flexlate()
+        # Set when a reloaded config changed the data, until the rebuild succeeds
+        self.config_changed = False
+
+    @property
+    def name(self) -> str:
+        return self.run_config_name or "default"
 
     @property
     def out_path(self) -> Path:
@@ -62,38 +112,58 @@ class ServerEventHandler(FileSystemEventHandler):
             self.cli_data or {},
         )
 
-    def on_modified(self, event: FileSystemEvent):
-        global old
-        super().on_modified(event)
-        log.debug(f"on_modified called with {event=}")
-        if not os.path.exists(event.src_path):
-            log.debug(f"{event.src_path} does not exist, will not update")
-            return
+    def reload(self, config: FlexlateDevConfig, run_config: FullRunConfiguration):
+        """
+        Uses the reloaded config, keeping the output project.
+        """
+        previous_data = self.data
+        self.config = config
+        self.run_config = run_config
+        if self.data != previous_data:
+            self.config_changed = True
+        else:
+            log.debug(
+                f"Data of {self.name} did not change with the reloaded config, "
+                f"not rebuilding it"
+            )
 
-        relative_path = Path(event.src_path).relative_to(self.template_path)
-        if relative_path == Path("."):
-            # Watchdog seems to throw events on the whole directory after a file in the directory changed, ignore those
-            log.debug("Got root template folder as change, ignoring")
-            return
-        if self.run_config.ignore_matches(relative_path):
-            # Ignored file changed, don't trigger reload
-            log.debug(f"Ignored file {relative_path} changed, ignoring")
-            return
+    def paths_to_rebuild(self, dirty_paths: Set[Path]) -> Set[Path]:
+        """
+        Selects the changed template paths that are not ignored by this run
+        configuration.
+        """
+        return {
+            path
+            for path in dirty_paths
+            if not self.run_config.ignore_matches(
+                path, (self.template_path / path).is_dir()
+            )
+        }
 
-        # Watchdog has a bug where two events will be triggered very quickly for one modification.
-        # Track whether it's been at least a half second since the last modification, and only then
-        # consider it a valid event
-        stat_buf = os.stat(event.src_path)
-        new = stat_buf.st_mtime
-        if (new - old) > 0.5:
-            # This is a valid event, now the main logic
-            print_styled(f"Detected change in {event.src_path}", INFO_STYLE)
-            self.sync_output()
-        else:
-            log.debug(f"Ignoring duplicate event {event.src_path}")
-        old = new
+    def update_output(
+        self, dirty_paths: Set[Path], cancellation_token: CancellationToken
+    ):
+        # Changed data can affect every templated file
+        if self.incremental and self.folder is not None and not self.config_changed:
+            if incrementally_update_project(
+                self.template_path,
+                self.out_path,
+                self.config,
+                self.run_config,
+                dirty_paths,
+                no_input=self.no_input,
+                auto_commit=self.auto_commit,
+                save=self.save,
+                cancellation_token=cancellation_token,
+            ):
+                return
+            log.debug("Could not update incrementally, running a full update")
+        self.sync_output(cancellation_token=cancellation_token)
+        self.config_changed = False
 
-    def sync_output(self):
+    def sync_output(self, cancellation_token: Optional[CancellationToken] = None):
+        # Each run configuration has its own folder when serving multiple
+        self.out_root.mkdir(parents=True, exist_ok=True)
         self.folder = update_or_initialize_project_get_folder(
             self.template_path,
             self.out_root,
@@ -110,35 +180,334 @@ class ServerEventHandler(FileSystemEventHandler):
                 if self.run_config.data
                 else DEFAULT_PROJECT_NAME
             ),
+            cancellation_token=cancellation_token,
+            staged=self.staged,
         )
         self.repo = Repo(self.out_path)
 
 
+class ServerEventHandler(FileSystemEventHandler):
+    def __init__(
+        self,
+        config: FlexlateDevConfig,
+        template_path: Path,
+        out_root: Path,
+        run_config_name: Optional[str] = None,
+        no_input: bool = False,
+        auto_commit: bool = True,
+        save: bool = False,
+        data: Optional[TemplateData] = None,
+        folder_name: Optional[str] = None,
+        quiet_period_seconds: float = DEFAULT_QUIET_PERIOD_SECONDS,
+        incremental: bool = False,
+        config_path: Optional[Path] = None,
+        run_config_names: Optional[Sequence[str]] = None,
+        staged: bool = False,
+    ):
+        """
+        :param config_path: Path the config was loaded from. When passed, changes to it
+            are loaded without restarting the server
+        :param run_config_names: Names of multiple run configurations to serve from the
+            same watcher instead of only run_config_name. Each is output to a folder
+            named after it in the out root. They are rebuilt one after another, as
+            flexlate renders one project at a time
+        :param staged: Stage each update in a shadow clone next to the output and bring
+            it into the output in one step
+        """
+        super().__init__()
+        self.config = config
+        self.config_path = (
+            Path(os.path.abspath(config_path)) if config_path is not None else None
+        )
+        if run_config_names is not None and len(run_config_names) > 1:
+            if run_config_name is not None:
+                raise UserInputException(
+                    "Pass either a run configuration name or multiple names, not both"
+                )
+            if save or folder_name is not None:
+                raise UserInputException(
+                    "Serving multiple run configurations cannot save the config or "
+                    "use a single folder name, as they would conflict"
+                )
+            output_roots = [(name, out_root / name) for name in run_config_names]
+        else:
+            if run_config_names:
+                run_config_name = run_config_names[0]
+            output_roots = [(run_config_name, out_root)]
+        self.outputs: List[ServedOutput] = [
+            ServedOutput(
+                config,
+                template_path,
+                output_root,
+                run_config_name=name,
+                no_input=no_input,
+                auto_commit=auto_commit,
+                save=save,
+                data=data,
+                folder_name=folder_name,
+                incremental=incremental,
+                staged=staged,
+            )
+            for name, output_root in output_roots
+        ]
+        self.template_path = template_path
+        self.out_root = out_root
+        self.ignores = TemplateIgnores(template_path, self._shared_ignore_spec())
+        self.content_index = ContentHashIndex(template_path)
+        self._changed_fingerprints: Dict[Path, Optional[FileFingerprint]] = {}
+        # Called from the rebuild thread after a reloaded config changed the ignores
+        self.on_ignores_changed: Optional[Callable[[], None]] = None
+        self.scheduler = RebuildScheduler(
+            self._rebuild,
+            quiet_period_seconds=quiet_period_seconds,
+            filter_paths=self._content_changed_paths,
+        )
+
+    @property
+    def output(self) -> ServedOutput:
+        """
+        The output when serving a single run configuration
+        """
+        if len(self.outputs) != 1:
+            raise ValueError("Serving multiple run configurations, use outputs")
+        return self.outputs[0]
+
+    def on_any_event(self, event: FileSystemEvent):
+        super().on_any_event(event)
+        log.debug(f"on_any_event called with {event=}")
+        if event.event_type not in CHANGE_EVENT_TYPES:
+            return
+        if event.is_directory and event.event_type == EVENT_TYPE_MODIFIED:
+            # Watchdog throws events on the directory after a file in the directory changed,
+            # the event for the file itself is enough to know what changed
+            log.debug(f"Got directory modified event for {event.src_path}, ignoring")
+            return
+        self._mark_dirty(event.src_path, event.is_directory)
+        if isinstance(event, FileSystemMovedEvent):
+            self._mark_dirty(event.dest_path, event.is_directory)
+
+    def is_config_path(self, path: str) -> bool:
+        if self.config_path is None:
+            return False
+        return Path(os.path.abspath(path)) == self.config_path
+
+    def config_file_changed(self):
+        """
+        Schedules the config to be reloaded, rebuilding only if the data changed
+        """
+        assert self.config_path is not None
+        # Absolute, so it can't be confused with the relative template paths
+        self.scheduler.mark_dirty(self.config_path)
+
+    def _mark_dirty(self, path: str, is_dir: bool):
+        if self.is_config_path(path):
+            # The config may be in the template folder, but it is a change to the
+            # configuration rather than the template
+            self.config_file_changed()
+            return
+        try:
+            relative_path = Path(path).relative_to(self.template_path)
+        except ValueError:
+            log.debug(f"{path} is outside of the template folder, ignoring")
+            return
+        if relative_path == Path("."):
+            log.debug("Got root template folder as change, ignoring")
+            return
+        if relative_path.name == ".gitignore":
+            self.ignores.clear_cache()
+        # The event says whether it is a directory, saving a stat per event
+        if self.ignores.file_is_ignored(relative_path, is_dir):
+            # Ignored file changed, don't trigger reload
+            log.debug(f"Ignored file {relative_path} changed, ignoring")
+            return
+        self.scheduler.mark_dirty(relative_path)
+
+    def _content_changed_paths(self, dirty_paths: Set[Path]) -> Set[Path]:
+        # Content is checked once the burst is complete as files may be
+        # partially written when the events arrive
+        template_paths = dirty_paths - {self.config_path}
+        self._changed_fingerprints = self.content_index.changed_fingerprints(
+            template_paths
+        )
+        changed_paths = set(self._changed_fingerprints)
+        for path in template_paths - changed_paths:
+            # Touched or saved without changes, nothing to rebuild
+            log.debug(f"Content of {path} did not change, ignoring")
+        if self.config_path in dirty_paths:
+            self._reload_config()
+        if any(output.config_changed for output in self.outputs):
+            # Still set if a rebuild for the changed config was cancelled or failed
+            changed_paths.add(self.config_path)
+        return changed_paths
+
+    def _reload_config(self):
+        """
+        Loads the config again and resolves the run configurations from it, keeping
+        the output projects and the watches.
+        """
+        assert self.config_path is not None
+        try:
+            config = load_config(self.config_path)
+            run_configs = [
+                config.get_full_run_config(
+                    ExternalCLICommandType.SERVE, output.run_config_name
+                )
+                for output in self.outputs
+            ]
+        except Exception as e:
+            # Likely saved in the middle of editing, keep serving with the last valid config
+            print_styled(
+                f"Could not reload {self.config_path}, keeping the previous "
+                f"configuration: {escape(str(e))}",
+                ALERT_STYLE,
+            )
+            return
+        self.config = config
+        for output, run_config in zip(self.outputs, run_configs):
+            output.reload(config, run_config)
+        print_styled(f"Reloaded configuration from {self.config_path}", INFO_STYLE)
+        ignore_spec = self._shared_ignore_spec()
+        if ignore_spec.ignore_list != self.ignores.spec.ignore_list:
+            # Keep the ignores of the repository, which did not change
+            self.ignores.spec = ignore_spec
+            if self.on_ignores_changed is not None:
+                self.on_ignores_changed()
+
+    def _shared_ignore_spec(self) -> IgnoreSpecification:
+        # The watcher can only skip what every run configuration ignores. Rather than
+        # combining differing lists, which is not possible in general with negations,
+        # fall back to the ignores that always apply and filter for each output
+        specs = [output.run_config.ignore_spec for output in self.outputs]
+        if all(spec.ignore_list == specs[0].ignore_list for spec in specs):
+            return specs[0]
+        return IgnoreSpecification(ignore_list=[])
+
+    def _rebuild(self, dirty_paths: Set[Path], cancellation_token: CancellationToken):
+        changed = ", ".join(sorted(str(path) for path in dirty_paths))
+        print_styled(f"Detected changes in {changed}", INFO_STYLE)
+        template_paths = dirty_paths - {self.config_path}
+        filter_per_output = any(
+            output.run_config.ignore_spec.ignore_list != self.ignores.spec.ignore_list
+            for output in self.outputs
+        )
+        updates: List[Tuple[ServedOutput, Set[Path]]] = []
+        for output in self.outputs:
+            paths = (
+                output.paths_to_rebuild(template_paths)
+                if filter_per_output
+                else template_paths
+            )
+            if paths or output.config_changed:
+                updates.append((output, paths))
+            else:
+                log.debug(f"No changes for {output.name}, not rebuilding it")
+        self._run_for_outputs(
+            [
+                functools.partial(output.update_output, paths, cancellation_token)
+                for output, paths in updates
+            ]
+        )
+        # Only index after the rebuild succeeded so that cancelled or failed
+        # changes are rebuilt again
+        self.content_index.record(self._changed_fingerprints)
+
+    def sync_output(self, cancellation_token: Optional[CancellationToken] = None):
+        self._run_for_outputs(
+            [
+                functools.partial(output.sync_output, cancellation_token)
+                for output in self.outputs
+            ]
+        )
+
+    def _run_for_outputs(self, updates: List[Callable[[], None]]):
+        # One after another, as flexlate changes the working directory while rendering
+        exceptions: List[Exception] = []
+        for update in updates:
+            try:
+                update()
+            except CancelledException:
+                # Makes the scheduler rebuild all of them again
+                raise
+            except Exception as e:
+                # Still rebuild the other outputs
+                exceptions.append(e)
+        for exception in exceptions[1:]:
+            log.exception(exception)
+        if exceptions:
+            raise exceptions[0]
+
+
 class SyncServerManager:
     def __init__(self, handler: ServerEventHandler):
         self.observer = Observer()
         self.handler = handler
+        self.watches = self._create_watches()
+        self.config_handler = _ConfigFileEventHandler(handler)
+        self.handler.on_ignores_changed = self._ignores_changed
+
+    @property
+    def is_idle(self) -> bool:
+        """
+        Whether there are no rebuilds running or waiting to run
+        """
+        return self.handler.scheduler.is_idle
 
     def initial_start(self):
-        self.handler.sync_output()  # do a sync before starting watcher
+        # do a sync before starting watcher
+        with timeline.build("Initial build"):
+            with timeline.phase("index template"):
+                self.handler.content_index.refresh(
+                    self.handler.ignores.directory_is_fully_ignored
+                )
+            self.handler.sync_output()
         self.start()
 
     def start(self):
-        # setting up inotify and specifying path to watch
-        self.observer.schedule(
-            self.handler, str(self.handler.template_path), recursive=True
-        )
+        self.handler.scheduler.start()
+        # setting up inotify, skipping ignored directories
+        self.watches.schedule()
+        self._schedule_config_watch()
         self.observer.start()
         log.debug("Watching for changes in template folder in sync server manager")
 
     def stop(self):
         self.observer.stop()
         self.observer.join()
+        # Finish any in-flight rebuild so that the output is not changing while stopped
+        self.handler.scheduler.stop()
         log.debug(
             "Stopped watching for changes in template folder in sync server manager"
         )
         # Recycle observer so that it can be restarted
         self.observer = Observer()
+        self.watches = self._create_watches()
+
+    def _create_watches(self) -> TemplateWatches:
+        return TemplateWatches(
+            self.observer,
+            self.handler,
+            self.handler.template_path,
+            self.handler.ignores.directory_is_fully_ignored,
+        )
+
+    def _schedule_config_watch(self):
+        config_path = self.handler.config_path
+        if config_path is None or not config_path.parent.is_dir():
+            return
+        # Watching the folder rather than the file sees editors that save by
+        # replacing the file
+        self.observer.schedule(
+            self.config_handler,
+            str(config_path.parent),
+            recursive=False,
+        )
+
+    def _ignores_changed(self):
+        # Watch directories that are no longer ignored and stop watching newly
+        # ignored ones
+        self.watches.refresh()
+        # The config folder may share a watch with the template that was just removed
+        self._schedule_config_watch()
 
     def __enter__(self) -> "SyncServerManager":
         self.initial_start()
@@ -148,6 +517,21 @@ class SyncServerManager:
         self.stop()
 
 
+class _ConfigFileEventHandler(FileSystemEventHandler):
+    def __init__(self, handler: ServerEventHandler):
+        super().__init__()
+        self.handler = handler
+
+    def on_any_event(self, event: FileSystemEvent):
+        if event.event_type not in CHANGE_EVENT_TYPES or event.is_directory:
+            return
+        paths = [event.src_path]
+        if isinstance(event, FileSystemMovedEvent):
+            paths.append(event.dest_path)
+        if any(self.handler.is_config_path(path) for path in paths):
+            self.handler.config_file_changed()
+
+
 @contextlib.contextmanager
 def pause_sync(manager: SyncServerManager):
     manager.stop()
@@ -166,6 +550,11 @@ def create_sync_server(
     save: bool = False,
     data: Optional[TemplateData] = None,
     folder_name: Optional[str] = None,
+    quiet_period_seconds: float = DEFAULT_QUIET_PERIOD_SECONDS,
+    incremental: bool = False,
+    config_path: Optional[Path] = None,
+    run_config_names: Optional[Sequence[str]] = None,
+    staged: bool = False,
 ) -> Iterator[SyncServerManager]:
     event_handler = ServerEventHandler(
         config,
@@ -177,6 +566,11 @@ def create_sync_server(
         save=save,
         data=data,
         folder_name=folder_name,
+        quiet_period_seconds=quiet_period_seconds,
+        incremental=incremental,
+        config_path=config_path,
+        run_config_names=run_config_names,
+        staged=staged,
     )
     with SyncServerManager(event_handler) as manager:
         yield manager
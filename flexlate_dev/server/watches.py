@@ -0,0 +1,193 @@
+"""
+Schedules the file watches on the template so that ignored directories such as
+node_modules or .git are never watched.
+
+Watchdog uses a separate inotify instance and thread for every scheduled watch, so
+watching each directory non-recursively would run into the inotify instance limit on
+larger templates. Instead, only the directories on the way to an ignored directory
+are watched non-recursively and every other subtree gets a single recursive watch.
+"""
+from collections import deque
+from pathlib import Path
+from typing import Callable, Deque, Dict, Final, List, Set, Tuple
+
+from watchdog.events import (
+    DirCreatedEvent,
+    DirDeletedEvent,
+    DirMovedEvent,
+    FileSystemEvent,
+    FileSystemEventHandler,
+)
+from watchdog.observers.api import BaseObserver, ObservedWatch
+
+from flexlate_dev.ignore import walk_unignored_directories
+from flexlate_dev.logger import log
+
+MAX_SCHEDULED_WATCHES: Final[int] = 32
+
+# Directory to watch and whether to watch it recursively
+PlannedWatch = Tuple[Path, bool]
+
+
+def plan_watches(
+    root: Path,
+    directory_is_ignored: Callable[[Path], bool],
+    max_watches: int = MAX_SCHEDULED_WATCHES,
+) -> List[PlannedWatch]:
+    """
+    Determines the watches needed to see every change in the root directory
+    except those in ignored directories.
+
+    :param root: Directory to watch
+    :param directory_is_ignored: Whether a directory and everything in it is ignored,
+        gets the path relative to the root
+    :param max_watches: Maximum number of watches to plan. Once reached, the remaining
+        subtrees are watched recursively even if they contain ignored directories
+    :return: The directories to watch and whether to watch them recursively
+    """
+    children: Dict[Path, List[Path]] = {}
+    contains_ignored: Set[Path] = set()
+    for directory in walk_unignored_directories(root, directory_is_ignored):
+        current = root / directory.path
+        if directory.ignored_directories:
+            _mark_with_parents(current, root, contains_ignored)
+        children[current] = [root / path for path in directory.directories]
+
+    watches: List[PlannedWatch] = []
+    queue: Deque[Path] = deque([root])
+    while queue:
+        directory_path = queue.popleft()
+        sub_directories = children.get(directory_path, [])
+        would_exceed_max = (
+            len(watches) + len(queue) + len(sub_directories) + 1 > max_watches
+        )
+        if directory_path not in contains_ignored or would_exceed_max:
+            watches.append((directory_path, True))
+        else:
+            watches.append((directory_path, False))
+            queue.extend(sub_directories)
+    return watches
+
+
+def _mark_with_parents(directory: Path, root: Path, marked: Set[Path]):
+    while directory not in marked:
+        marked.add(directory)
+        if directory == root:
+            return
+        directory = directory.parent
+
+
+class TemplateWatches:
+    """
+    Schedules watches on the template for the handler and keeps them up to date as
+    directories are created, deleted and moved.
+    """
+
+    def __init__(
+        self,
+        observer: BaseObserver,
+        handler: FileSystemEventHandler,
+        root: Path,
+        directory_is_ignored: Callable[[Path], bool],
+        max_watches: int = MAX_SCHEDULED_WATCHES,
+    ):
+        """
+        :param directory_is_ignored: Whether a directory and everything in it is ignored,
+            gets the path relative to the root
+        """
+        self.observer = observer
+        self.handler = handler
+        self.root = root
+        self.directory_is_ignored = directory_is_ignored
+        self.max_watches = max_watches
+        self._watches: Dict[Path, Tuple[ObservedWatch, bool]] = {}
+        self._directory_handler = _DirectoryEventHandler(self)
+
+    @property
+    def watched_directories(self) -> Dict[Path, bool]:
+        """
+        The watched directories and whether they are watched recursively
+        """
+        return {path: recursive for path, (_, recursive) in self._watches.items()}
+
+    def schedule(self):
+        self._schedule_tree(self.root)
+
+    def refresh(self):
+        """
+        Plans the watches again after the ignores changed, keeping the watches that
+        are still needed so that no changes are missed while refreshing.
+        """
+        planned = dict(
+            plan_watches(
+                self.root, self.directory_is_ignored, max_watches=self.max_watches
+            )
+        )
+        for path, (_, recursive) in list(self._watches.items()):
+            if planned.get(path) != recursive:
+                self._unschedule(path)
+        for path, recursive in planned.items():
+            if path not in self._watches:
+                self._schedule(path, recursive)
+
+    def directory_created(self, directory: Path):
+        if directory in self._watches:
+            return
+        parent_watch = self._watches.get(directory.parent)
+        if parent_watch is None:
+            # Not inside a watched directory, or inside an ignored one
+            return
+        _, parent_is_recursive = parent_watch
+        if parent_is_recursive:
+            # Watchdog already adds new directories to recursive watches
+            return
+        if self._is_ignored(directory):
+            log.debug(f"Not watching new ignored directory {directory}")
+            return
+        log.debug(f"Watching new directory {directory}")
+        self._schedule_tree(directory)
+
+    def directory_removed(self, directory: Path):
+        for watched_path in list(self._watches):
+            if watched_path == directory or directory in watched_path.parents:
+                self._unschedule(watched_path)
+
+    def _schedule_tree(self, directory: Path):
+        available_watches = max(self.max_watches - len(self._watches), 1)
+        for path, recursive in plan_watches(
+            directory,
+            lambda path: self._is_ignored(directory / path),
+            max_watches=available_watches,
+        ):
+            self._schedule(path, recursive)
+
+    def _schedule(self, path: Path, recursive: bool):
+        watch = self.observer.schedule(self.handler, str(path), recursive=recursive)
+        self.observer.add_handler_for_watch(self._directory_handler, watch)
+        self._watches[path] = (watch, recursive)
+
+    def _unschedule(self, path: Path):
+        watch, _ = self._watches.pop(path)
+        try:
+            self.observer.unschedule(watch)
+        except (KeyError, OSError) as e:
+            # Watch may already be gone together with its directory
+            log.debug(f"Could not unschedule watch on {path}: {e}")
+
+    def _is_ignored(self, directory: Path) -> bool:
+        return self.directory_is_ignored(directory.relative_to(self.root))
+
+
+class _DirectoryEventHandler(FileSystemEventHandler):
+    def __init__(self, watches: TemplateWatches):
+        super().__init__()
+        self.watches = watches
+
+    def on_any_event(self, event: FileSystemEvent):
+        if isinstance(event, DirCreatedEvent):
+            self.watches.directory_created(Path(event.src_path))
+        elif isinstance(event, DirDeletedEvent):
+            self.watches.directory_removed(Path(event.src_path))
+        elif isinstance(event, DirMovedEvent):
+            self.watches.directory_removed(Path(event.src_path))
+            self.watches.directory_created(Path(event.dest_path))
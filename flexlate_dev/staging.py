@@ -0,0 +1,95 @@
+"""
+Stages updates of a project in a shadow clone next to it, so that tools watching the
+project see a single change per update rather than each of the branch switches and
+commits flexlate makes while updating.
+
+The shadow clone shares the object store of the project and sits next to it so that
+the relative template paths in its flexlate config still resolve.
+
+Applying the update fast-forwards the project, which is not atomic: the changed files
+are written one after another in a single checkout. This is preferred over preparing
+a worktree and swapping it in, as tools such as editors, shells and watchers hold on
+to the project directory and would be left in a replaced one. The fast-forward only
+touches the changed files, without any of the intermediate states flexlate goes
+through, and if it is interrupted the project is still on its previous commit, so
+``git status`` shows the partial update and ``git checkout .`` undoes it.
+"""
+import shutil
+from pathlib import Path
+from typing import Final
+
+from git import Repo
+
+from flexlate_dev.exc import CancelledException
+
+STAGED_HEADS_REF_PREFIX: Final[str] = "refs/flexlate-dev/staged-heads"
+
+
+def get_staging_path(project_path: Path) -> Path:
+    return project_path.parent / f".{project_path.name}.staging"
+
+
+def prepare_staging_repo(project_repo: Repo, staging_path: Path) -> Repo:
+    """
+    Creates the shadow clone of the project, or resets an existing one, so that it
+    matches the current commit and branches of the project.
+    """
+    if not (staging_path / ".git").exists():
+        shutil.rmtree(staging_path, ignore_errors=True)
+        Repo.clone_from(
+            project_repo.working_dir, staging_path, shared=True, no_checkout=True
+        )
+    staging_repo = Repo(staging_path)
+    # Same branch names as the project, as flexlate names its branches after the
+    # current branch. Forced, as a cancelled update may have left them ahead
+    staging_repo.git.fetch("--update-head-ok", "origin", "+refs/heads/*:refs/heads/*")
+    staging_repo.git.checkout(
+        "--force", "-B", project_repo.active_branch.name, project_repo.head.commit
+    )
+    staging_repo.git.clean("-ffdx")
+    return staging_repo
+
+
+def remove_staging_repo(staging_path: Path):
+    """
+    Removes the shadow clone, for when an update failed in it and it may have been
+    left in the middle of a merge or a branch switch.
+    """
+    shutil.rmtree(staging_path, ignore_errors=True)
+
+
+def apply_staged_update(project_repo: Repo, staging_repo: Repo, base_sha: str) -> bool:
+    """
+    Brings the branches updated in the shadow clone into the project and then
+    fast-forwards the project in one step. See the module docstring for why the
+    fast-forward is used even though it is not atomic.
+
+    :param base_sha: Commit of the project the shadow clone was prepared from
+    :raises CancelledException: if the project got new commits while staging, so
+        that the update is staged again on top of them
+    :return: Whether there was anything to bring in
+    """
+    if staging_repo.head.commit.hexsha == base_sha:
+        return False
+    branch_name = project_repo.active_branch.name
+    # Only the objects created while staging are copied, the rest are shared. Into
+    # separate refs first, so that nothing in the project changes if it is cancelled
+    project_repo.git.fetch(
+        "--prune",
+        staging_repo.working_dir,
+        f"+refs/heads/*:{STAGED_HEADS_REF_PREFIX}/*",
+    )
+    if project_repo.head.commit.hexsha != base_sha:
+        raise CancelledException(
+            f"{project_repo.working_dir} got new commits while staging the update"
+        )
+    # The flexlate branches, which are not checked out so only their refs change
+    refspecs = [
+        f"+{STAGED_HEADS_REF_PREFIX}/{head.name}:refs/heads/{head.name}"
+        for head in staging_repo.heads
+        if head.name != branch_name
+    ]
+    if refspecs:
+        project_repo.git.fetch(".", *refspecs)
+    project_repo.git.merge("--ff-only", f"{STAGED_HEADS_REF_PREFIX}/{branch_name}")
+    return True
@@ -0,0 +1,158 @@
+"""
+Times the phases of builds so that slow hooks and regressions are visible. Each build
+prints a summary line, and the whole session can be exported as a Chrome trace-event
+file to view in chrome://tracing or Perfetto.
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Final, Iterator, List, Optional
+
+from flexlate_dev.exc import CancelledException
+from flexlate_dev.styles import INFO_STYLE, print_styled
+
+
+@dataclass
+class TimedPhase:
+    name: str
+    start: float
+    end: float
+    thread_id: int
+    args: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+@dataclass
+class BuildTimings:
+    name: str
+    phases: List[TimedPhase] = field(default_factory=list)
+
+    def summary(self, total_seconds: float, outcome: str) -> str:
+        phase_summaries = ", ".join(
+            f"{phase.name} {phase.duration:.2f}s" for phase in self.phases
+        )
+        message = f"{self.name} {outcome} in {total_seconds:.2f}s"
+        if phase_summaries:
+            message += f" ({phase_summaries})"
+        return message
+
+
+class Timeline:
+    def __init__(self):
+        self.is_recording = False
+        self._phases: List[TimedPhase] = []
+        self._thread_names: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+
+    def start_recording(self):
+        """
+        Keep all timed phases for the session so that they can be exported.
+        Without recording, phases are only used for the build summaries.
+        """
+        with self._lock:
+            self.is_recording = True
+            self._phases = []
+            self._thread_names = {}
+
+    def stop_recording(self):
+        with self._lock:
+            self.is_recording = False
+
+    def record(self, name: str, start: float, end: float, **args):
+        """
+        Records a phase that was timed with time.perf_counter elsewhere.
+        """
+        thread = threading.current_thread()
+        phase = TimedPhase(name, start, end, thread.ident or 0, args)
+        build: Optional[BuildTimings] = getattr(self._local, "build", None)
+        if build is not None:
+            build.phases.append(phase)
+        with self._lock:
+            if self.is_recording:
+                self._phases.append(phase)
+                self._thread_names[phase.thread_id] = thread.name
+
+    @contextlib.contextmanager
+    def phase(self, name: str, **args) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter(), **args)
+
+    @contextlib.contextmanager
+    def build(
+        self, name: str = "Build", start: Optional[float] = None, **args
+    ) -> Iterator[BuildTimings]:
+        """
+        Times a whole build, collecting the phases timed on this thread within it and
+        printing a summary line when it finishes.
+
+        :param name: Name of the build
+        :param start: time.perf_counter value to count the build from, if it
+            started before entering the context
+        """
+        build = BuildTimings(name)
+        self._local.build = build
+        if start is None:
+            start = time.perf_counter()
+        outcome = "failed"
+        try:
+            yield build
+            outcome = "finished"
+        except CancelledException:
+            outcome = "cancelled"
+            raise
+        finally:
+            self._local.build = None
+            end = time.perf_counter()
+            self.record(name, start, end, outcome=outcome, **args)
+            print_styled(build.summary(end - start, outcome), INFO_STYLE)
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        pid = os.getpid()
+        with self._lock:
+            phases = list(self._phases)
+            thread_names = dict(self._thread_names)
+        events: List[Dict[str, Any]] = [
+            dict(
+                name="thread_name",
+                ph="M",
+                pid=pid,
+                tid=thread_id,
+                args=dict(name=thread_name),
+            )
+            for thread_id, thread_name in thread_names.items()
+        ]
+        for phase in phases:
+            events.append(
+                dict(
+                    name=phase.name,
+                    ph="X",
+                    ts=_to_microseconds(phase.start - self._origin),
+                    dur=_to_microseconds(phase.duration),
+                    pid=pid,
+                    tid=phase.thread_id,
+                    args=phase.args,
+                )
+            )
+        return dict(traceEvents=events, displayTimeUnit="ms")
+
+    def save_chrome_trace(self, path: Path):
+        path.write_text(json.dumps(self.to_chrome_trace(), default=str))
+
+
+def _to_microseconds(seconds: float) -> int:
+    return int(seconds * 1_000_000)
+
+
+timeline: Final[Timeline] = Timeline()
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel, root_validator
 
@@ -8,6 +8,11 @@ class UserCommand(BaseModel):
     name: Optional[str] = None
     background: Optional[bool] = None
     id: Optional[str] = None
+    depends_on: Optional[List[str]] = None
+    timeout: Optional[float] = None
+    check: Optional[bool] = None
+    inputs: Optional[List[str]] = None
+    outputs: Optional[List[str]] = None
 
     @root_validator
     def run_or_id_must_be_defined(cls, v):
@@ -15,6 +20,19 @@ class UserCommand(BaseModel):
             raise ValueError("run or id must be defined")
         return v
 
+    @root_validator
+    def background_commands_cannot_be_cached(cls, v):
+        if v.get("background") and v.get("inputs") is not None:
+            raise ValueError("inputs cannot be used with background commands")
+        return v
+
+    @root_validator
+    def cached_commands_must_have_outputs(cls, v):
+        # Skipping a command is only safe when its effects can be restored
+        if v.get("inputs") is not None and not v.get("outputs"):
+            raise ValueError("outputs must be defined when inputs are defined")
+        return v
+
     @classmethod
     def from_string(cls, command: str) -> "UserCommand":
         return cls(run=command)
@@ -10,6 +10,7 @@ from typing import TYPE_CHECKING, Any, Dict, List, Optional, cast
 
 import jinja2
 
+from flexlate_dev.cancellation import CancellationToken
 from flexlate_dev.dict_merge import merge_dicts_preferring_non_none
 from flexlate_dev.external_command_type import ExternalCLICommandType
 
@@ -18,9 +19,10 @@ if TYPE_CHECKING:
 
 from pydantic import BaseModel, Field
 
+from flexlate_dev.command_cache import get_command_cache_folder
 from flexlate_dev.command_runner import Runnable, run_command_or_command_strs
-from flexlate_dev.dirutils import change_directory_to
 from flexlate_dev.styles import INFO_STYLE, print_styled
+from flexlate_dev.timing import timeline
 from flexlate_dev.user_command import UserCommand
 
 
@@ -144,17 +146,26 @@ def run_user_hook(
     config: "FlexlateDevConfig",
     jinja_env: jinja2.Environment,
     context: CommandContext,
+    cancellation_token: Optional[CancellationToken] = None,
 ):
     """
     Runs a hook of the given type.
     """
     hook: Optional[List[Runnable]] = getattr(run_config.config, hook_type.value)
     if hook is not None:
-        commands = _create_command_list_resolving_references(hook, config)
-        rendered_commands = _render_commands(commands, run_config, jinja_env, context)
-        print_styled(f"Running {hook_type.value} commands", INFO_STYLE)
-        with change_directory_to(out_path):
-            run_command_or_command_strs(rendered_commands)
+        with timeline.phase(hook_type.value):
+            commands = _create_command_list_resolving_references(hook, config)
+            rendered_commands = _render_commands(
+                commands, run_config, jinja_env, context
+            )
+            print_styled(f"Running {hook_type.value} commands", INFO_STYLE)
+            run_command_or_command_strs(
+                rendered_commands,
+                cancellation_token=cancellation_token,
+                cwd=out_path,
+                # Shared between the projects in the output root
+                cache_folder=get_command_cache_folder(out_path.parent),
+            )
 
 
 def _create_command_list_resolving_references(
@@ -186,21 +197,19 @@ def _render_commands(
     """
     Renders the given commands using the given jinja environment, returning new commands.
     """
-    return [
-        _render_command(command, run_config, jinja_env, context) for command in commands
-    ]
+    # Same for every command, so only build it once
+    data = run_config.to_jinja_data(context)
+    return [_render_command(command, jinja_env, data) for command in commands]
 
 
 def _render_command(
     command: UserCommand,
-    run_config: "FullRunConfiguration",
     jinja_env: jinja2.Environment,
-    context: CommandContext,
+    data: Dict[str, Any],
 ) -> UserCommand:
     """
     Renders the given command using the given jinja environment, returning a new command.
     """
-    data = run_config.to_jinja_data(context)
     update_dict: Dict[str, Any] = {}
     for attr in ["run", "name"]:
         value = getattr(command, attr)
@@ -1,6 +1,23 @@
-from unidiff import PatchedFile
+import os
+import threading
+from pathlib import Path
 
-from flexlate_dev.server.back_sync import apply_file_diff_to_project
+import pytest
+from git import Repo
+from unidiff import PatchedFile, PatchSet
+from watchdog.observers import Observer
+
+from flexlate_dev.config import FlexlateDevConfig
+from flexlate_dev.exc import PatchApplyException
+from flexlate_dev.gitutils import stage_and_commit_all
+from flexlate_dev.server.back_sync import (
+    BackSyncServer,
+    GitRefChangeHandler,
+    apply_commit_diff_to_separate_project,
+    apply_file_diff_to_project,
+    get_diff_for_commit,
+)
+from flexlate_dev.server.main import run_server
 from tests.config import (
     GENERATED_FILES_DIR,
     MODIFIED_FILE,
@@ -16,6 +33,9 @@ from tests.fixtures.diff import (
 )
 from tests.fixtures.repo import flexlate_dev_repo
 from tests.fixtures.temp_dir import inside_generated_dir
+from tests.fixtures.template_path import *
+from tests.fixtures.template_repo import *
+from tests.waitutils import wait_until_path_exists
 
 
 def test_apply_added_file_diff_to_project(
@@ -99,3 +119,177 @@ def test_apply_modified_file_diff_to_project(
     new_file_content = expect_path.read_text()
     assert new_file_content != orig_file_content
     assert "0.20.0" in new_file_content
+
+
+def _single_file_diff(diff: str) -> PatchedFile:
+    return PatchSet(diff)[0]
+
+
+def test_apply_modified_file_diff_without_trailing_new_line():
+    path = GENERATED_FILES_DIR / "a.txt"
+    path.write_text("first\nsecond\nthird\n")
+    path.chmod(0o755)
+    diff = _single_file_diff(
+        """diff --git a/a.txt b/a.txt
+--- a/a.txt
++++ b/a.txt
+@@ -1,3 +1,3 @@
+ first
+ second
+-third
++new third
+\\ No newline at end of file
+"""
+    )
+
+    apply_file_diff_to_project(GENERATED_FILES_DIR, diff)
+
+    assert path.read_text() == "first\nsecond\nnew third"
+    assert path.stat().st_mode & 0o777 == 0o755
+    assert os.listdir(GENERATED_FILES_DIR) == ["a.txt"]
+
+
+def test_apply_added_file_diff_without_trailing_new_line():
+    path = GENERATED_FILES_DIR / "folder" / "a.txt"
+    diff = _single_file_diff(
+        """diff --git a/folder/a.txt b/folder/a.txt
+new file mode 100644
+--- /dev/null
++++ b/folder/a.txt
+@@ -0,0 +1,2 @@
++first
++second
+\\ No newline at end of file
+"""
+    )
+
+    apply_file_diff_to_project(GENERATED_FILES_DIR, diff)
+
+    assert path.read_text() == "first\nsecond"
+
+
+def test_apply_modified_file_diff_at_offset_keeps_windows_new_lines():
+    path = GENERATED_FILES_DIR / "a.txt"
+    path.write_bytes(b"added\r\nabove\r\nfirst\r\nsecond\r\n")
+    diff = _single_file_diff(
+        "diff --git a/a.txt b/a.txt\n"
+        "--- a/a.txt\n"
+        "+++ b/a.txt\n"
+        "@@ -1,2 +1,2 @@\n"
+        " first\r\n"
+        "-second\r\n"
+        "+new second\r\n"
+    )
+
+    apply_file_diff_to_project(GENERATED_FILES_DIR, diff)
+
+    assert path.read_bytes() == b"added\r\nabove\r\nfirst\r\nnew second\r\n"
+
+
+def test_apply_modified_file_diff_that_does_not_match_raises_and_keeps_file():
+    path = GENERATED_FILES_DIR / "a.txt"
+    path.write_text("something else\n")
+    diff = _single_file_diff(
+        """diff --git a/a.txt b/a.txt
+--- a/a.txt
++++ b/a.txt
+@@ -1 +1 @@
+-first
++new first
+"""
+    )
+
+    with pytest.raises(PatchApplyException):
+        apply_file_diff_to_project(GENERATED_FILES_DIR, diff)
+
+    assert path.read_text() == "something else\n"
+
+
+def test_apply_commit_diffs_without_touching_project_head(
+    copier_one_template_repo: Repo,
+):
+    repo = copier_one_template_repo
+    project_path = Path(repo.working_dir)
+    out_dir = GENERATED_FILES_DIR / "out"
+    (project_path / "README.md").write_text("first change")
+    stage_and_commit_all(repo, "First change")
+    first_commit = repo.head.commit
+    (project_path / "README.md").rename(project_path / "README.txt")
+    stage_and_commit_all(repo, "Rename")
+    second_commit = repo.head.commit
+    out_dir.mkdir()
+    (out_dir / "README.md").write_text("some existing content")
+    branches = [branch.name for branch in repo.branches]
+
+    for commit in [first_commit, second_commit]:
+        apply_commit_diff_to_separate_project(repo, commit, out_dir)
+
+    assert not (out_dir / "README.md").exists()
+    assert (out_dir / "README.txt").read_text() == "first change"
+    assert repo.head.commit == second_commit
+    assert [branch.name for branch in repo.branches] == branches
+    assert not repo.is_dirty(untracked_files=True)
+
+
+def test_get_diff_for_root_commit(copier_one_template_repo: Repo):
+    root_commit = copier_one_template_repo.head.commit
+    diff = get_diff_for_commit(copier_one_template_repo, root_commit)
+    assert all(file_diff.is_added_file for file_diff in diff)
+    assert "README.md" in [file_diff.path for file_diff in diff]
+
+
+def test_git_ref_change_handler_notifies_on_commit_and_checkout(
+    copier_one_template_repo: Repo,
+):
+    repo = copier_one_template_repo
+    changed = threading.Event()
+    observer = Observer()
+    GitRefChangeHandler(repo, changed.set).schedule(observer)
+    observer.start()
+    try:
+        # Changes that don't move any refs should not notify
+        (Path(repo.working_dir) / "README.md").write_text("new content")
+        repo.git.add("-A")
+        assert not changed.wait(0.5)
+
+        stage_and_commit_all(repo, "Move branch")
+        assert changed.wait(2)
+        changed.clear()
+
+        repo.git.checkout("-b", "feature/new-branch")
+        assert changed.wait(2)
+    finally:
+        observer.stop()
+        observer.join()
+
+
+def test_back_sync_syncs_only_up_to_the_checked_commit(
+    copier_one_template_repo: Repo,
+):
+    template_path = Path(copier_one_template_repo.working_dir)
+    project_path = GENERATED_FILES_DIR / "project"
+    template_readme = template_path / "README.md"
+    project_readme = project_path / "README.md"
+    with run_server(
+        FlexlateDevConfig(), None, template_path, GENERATED_FILES_DIR, no_input=True
+    ) as context:
+        wait_until_path_exists(project_readme)
+        project_repo = Repo(project_path)
+        # Not started, so that syncs only happen when called here
+        back_sync = BackSyncServer(template_path, project_path, context.sync_manager)
+        project_readme.write_text("first")
+        stage_and_commit_all(project_repo, "First change")
+        first_sha = project_repo.head.commit.hexsha
+        # Committed after the first commit was checked, but before it was synced
+        project_readme.write_text("second")
+        stage_and_commit_all(project_repo, "Second change")
+        second_sha = project_repo.head.commit.hexsha
+
+        back_sync.sync(first_sha)
+        assert template_readme.read_text() == "first"
+
+        # Had the first sync gone up to the latest commit, this would apply the
+        # second commit again and fail
+        back_sync.last_commit = first_sha
+        back_sync.sync(second_sha)
+        assert template_readme.read_text() == "second"
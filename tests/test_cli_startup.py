@@ -0,0 +1,42 @@
+import subprocess
+import sys
+from typing import Dict, Final, List
+
+from tests.config import PROJECT_DIR
+
+# Modules that are slow to import or only needed once a command runs
+SLOW_MODULES: Final[List[str]] = [
+    "flexlate",
+    "git",
+    "watchdog",
+    "jinja2",
+    "unidiff",
+    "pkg_resources",
+    "flexlate_dev.logger",
+    "flexlate_dev.daemon",
+]
+
+
+def _get_cumulative_import_times(module: str) -> Dict[str, int]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=PROJECT_DIR,
+        check=True,
+    )
+    # Lines look like: import time:  self [us] | cumulative | imported package
+    times: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_cli_import_does_not_import_command_modules():
+    times = _get_cumulative_import_times("flexlate_dev.cli")
+    imported_slow_modules = [module for module in SLOW_MODULES if module in times]
+    assert imported_slow_modules == []
@@ -1,8 +1,34 @@
+import shutil
+import subprocess
+import threading
+import time
 import timeit
 
+import jinja2
+import pytest
+
+from flexlate_dev.cancellation import CancellationToken
+from flexlate_dev.command_cache import MAX_ENTRIES_PER_COMMAND
 from flexlate_dev.command_runner import run_command_or_command_strs
+from flexlate_dev.config import FlexlateDevConfig
+from flexlate_dev.exc import (
+    CancelledException,
+    CommandDependencyException,
+    CommandFailedException,
+    CommandTimeoutException,
+)
+from flexlate_dev.ext_subprocess import stream_output_from_process
+from flexlate_dev.external_command_type import ExternalCLICommandType
 from flexlate_dev.user_command import UserCommand
+from flexlate_dev.user_runner import (
+    CommandContext,
+    RunnerHookType,
+    UserRootRunConfiguration,
+    UserRunConfiguration,
+    run_user_hook,
+)
 from tests.config import GENERATED_FILES_DIR
+from tests.fixtures.jinja_env import jinja_env
 from tests.fixtures.temp_dir import inside_generated_dir
 
 
@@ -31,3 +57,224 @@ def test_run_background_command(inside_generated_dir):
     end_time = timeit.default_timer()
     assert expect_path.exists()
     assert end_time - start_time < 0.9
+
+
+def test_cancel_kills_running_command_and_skips_the_rest(inside_generated_dir):
+    expect_path = GENERATED_FILES_DIR / "woo.txt"
+    token = CancellationToken()
+    timer = threading.Timer(0.3, token.cancel)
+    start_time = timeit.default_timer()
+    timer.start()
+    with pytest.raises(CancelledException):
+        run_command_or_command_strs(["sleep 5", "touch woo.txt"], token)
+    end_time = timeit.default_timer()
+    assert end_time - start_time < 2
+    assert not expect_path.exists()
+
+
+def test_run_dependent_commands_in_parallel(inside_generated_dir, capsys):
+    expect_path = GENERATED_FILES_DIR / "woo.txt"
+    commands = [
+        UserCommand(run="sleep 1 && echo first done", name="first", id="first"),
+        UserCommand(run="sleep 1", id="second"),
+        UserCommand(run="touch woo.txt", name="after", depends_on=["first", "second"]),
+    ]
+    start_time = timeit.default_timer()
+    run_command_or_command_strs(commands, max_parallel_commands=2)
+    end_time = timeit.default_timer()
+    assert expect_path.exists()
+    assert end_time - start_time < 1.8
+    assert "[first] first done" in capsys.readouterr().out
+
+
+def test_run_dependent_commands_after_their_dependencies(inside_generated_dir):
+    expect_path = GENERATED_FILES_DIR / "b.txt"
+    commands = [
+        UserCommand(run="test -f a.txt && touch b.txt", depends_on=["a"]),
+        UserCommand(run="sleep 0.5 && touch a.txt", id="a"),
+    ]
+    run_command_or_command_strs(commands)
+    assert expect_path.exists()
+
+
+def test_failing_dependent_command_stops_the_others(inside_generated_dir):
+    expect_path = GENERATED_FILES_DIR / "woo.txt"
+    commands = [
+        UserCommand(run="exit 3", id="fails", check=True),
+        UserCommand(run="sleep 5", id="slow"),
+        UserCommand(run="touch woo.txt", depends_on=["fails"]),
+    ]
+    start_time = timeit.default_timer()
+    with pytest.raises(CommandFailedException) as exc_info:
+        run_command_or_command_strs(commands, max_parallel_commands=2)
+    end_time = timeit.default_timer()
+    assert "exit code 3" in str(exc_info.value)
+    assert end_time - start_time < 2
+    assert not expect_path.exists()
+
+
+def test_command_dependency_cycle_raises(inside_generated_dir):
+    commands = [
+        UserCommand(run="true", id="a", depends_on=["b"]),
+        UserCommand(run="true", id="b", depends_on=["a"]),
+    ]
+    with pytest.raises(CommandDependencyException):
+        run_command_or_command_strs(commands)
+
+
+def test_failing_checked_command_raises_and_skips_the_rest(inside_generated_dir):
+    expect_path = GENERATED_FILES_DIR / "woo.txt"
+    with pytest.raises(CommandFailedException):
+        run_command_or_command_strs(
+            [UserCommand(run="exit 3", check=True), "touch woo.txt"]
+        )
+    assert not expect_path.exists()
+
+
+def test_failing_unchecked_command_continues_with_the_rest(inside_generated_dir):
+    expect_path = GENERATED_FILES_DIR / "woo.txt"
+    run_command_or_command_strs(["exit 3", "touch woo.txt"])
+    assert expect_path.exists()
+
+
+def test_run_command_streams_stdout_and_stderr(inside_generated_dir, capsys):
+    run_command_or_command_strs(["echo to-out; echo to-err >&2"])
+    captured = capsys.readouterr()
+    assert "to-out" in captured.out
+    assert "to-err" in captured.err
+
+
+def test_stream_output_from_background_process_includes_stderr(capsys):
+    process = subprocess.Popen(
+        "echo to-out; echo to-err >&2",
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        shell=True,
+    )
+    stream_output_from_process(process, output_prefix="[bg] ")
+    process.wait()
+    captured = capsys.readouterr()
+    assert captured.out == "[bg] to-out\n"
+    assert captured.err == "[bg] to-err\n"
+
+
+def test_command_timeout_kills_command(inside_generated_dir):
+    command = UserCommand(run="sleep 5", timeout=0.3)
+    start_time = timeit.default_timer()
+    with pytest.raises(CommandTimeoutException):
+        run_command_or_command_strs([command])
+    end_time = timeit.default_timer()
+    assert end_time - start_time < 2
+
+
+def test_run_command_in_directory(inside_generated_dir):
+    directory = GENERATED_FILES_DIR / "nested"
+    directory.mkdir()
+    run_command_or_command_strs(["touch woo.txt"], cwd=directory)
+    assert (directory / "woo.txt").exists()
+    assert not (GENERATED_FILES_DIR / "woo.txt").exists()
+
+
+def test_command_with_unchanged_inputs_restores_outputs(inside_generated_dir):
+    cache_folder = GENERATED_FILES_DIR / "cache"
+    input_path = GENERATED_FILES_DIR / "input.txt"
+    output_path = GENERATED_FILES_DIR / "out" / "output.txt"
+    runs_path = GENERATED_FILES_DIR / "runs.log"
+    command = UserCommand(
+        run="echo run >> runs.log; mkdir -p out; cp input.txt out/output.txt",
+        inputs=["*.txt"],
+        outputs=["out"],
+    )
+
+    def run_and_count_runs() -> int:
+        run_command_or_command_strs([command], cache_folder=cache_folder)
+        return len(runs_path.read_text().splitlines())
+
+    input_path.write_text("first")
+    assert run_and_count_runs() == 1
+    output_path.unlink()
+    assert run_and_count_runs() == 1
+    assert output_path.read_text() == "first"
+
+    input_path.write_text("second")
+    assert run_and_count_runs() == 2
+    assert output_path.read_text() == "second"
+
+
+def test_command_cache_keeps_only_most_recent_entries(inside_generated_dir):
+    cache_folder = GENERATED_FILES_DIR / "cache"
+    input_path = GENERATED_FILES_DIR / "input.txt"
+    runs_path = GENERATED_FILES_DIR / "runs.log"
+    command = UserCommand(
+        run="echo run >> runs.log; mkdir -p out; cp input.txt out/output.txt",
+        inputs=["input.txt"],
+        outputs=["out"],
+    )
+
+    def run_and_count_runs(content: str) -> int:
+        input_path.write_text(content)
+        run_command_or_command_strs([command], cache_folder=cache_folder)
+        # Entries are evicted by when they were last used
+        time.sleep(0.05)
+        return len(runs_path.read_text().splitlines())
+
+    contents = [str(i) for i in range(MAX_ENTRIES_PER_COMMAND + 1)]
+    for i, content in enumerate(contents):
+        assert run_and_count_runs(content) == i + 1
+    (command_folder,) = cache_folder.iterdir()
+    assert len(list(command_folder.iterdir())) == MAX_ENTRIES_PER_COMMAND
+
+    # Restoring the oldest remaining entry makes it the most recently used
+    num_runs = len(contents)
+    assert run_and_count_runs(contents[1]) == num_runs
+    assert run_and_count_runs(contents[0]) == num_runs + 1
+    assert run_and_count_runs(contents[1]) == num_runs + 1
+    assert run_and_count_runs(contents[2]) == num_runs + 2
+
+
+def test_command_with_inputs_requires_outputs():
+    with pytest.raises(ValueError):
+        UserCommand(run="pre-commit install", inputs=[".pre-commit-config.yaml"])
+
+
+def test_hook_reruns_command_whose_outputs_were_not_produced(
+    inside_generated_dir, jinja_env: jinja2.Environment
+):
+    project_path = GENERATED_FILES_DIR / "project"
+    runs_path = GENERATED_FILES_DIR / "runs.log"
+    command = UserCommand(
+        run=f"echo run >> {runs_path}",
+        inputs=["*.txt"],
+        outputs=["hooks"],
+    )
+    config = FlexlateDevConfig(
+        run_configs=dict(
+            default=UserRootRunConfiguration(
+                serve=UserRunConfiguration(post_init=[command])
+            )
+        )
+    )
+    run_config = config.get_full_run_config(ExternalCLICommandType.SERVE)
+    context = CommandContext.create(
+        template_root=GENERATED_FILES_DIR,
+        out_root=GENERATED_FILES_DIR,
+        no_input=True,
+        save=False,
+    )
+
+    def create_project_and_run_hook() -> int:
+        project_path.mkdir()
+        (project_path / "input.txt").write_text("input")
+        run_user_hook(
+            RunnerHookType.POST_INIT,
+            project_path,
+            run_config,
+            config,
+            jinja_env,
+            context,
+        )
+        return len(runs_path.read_text().splitlines())
+
+    assert create_project_and_run_hook() == 1
+    shutil.rmtree(project_path)
+    assert create_project_and_run_hook() == 2
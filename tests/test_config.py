@@ -1,6 +1,12 @@
-from flexlate_dev.config import FlexlateDevConfig
+import shutil
+
+import pytest
+
+from flexlate_dev.config import FlexlateDevConfig, UserDataConfiguration, load_config
+from flexlate_dev.exc import CircularExtendsException
 from flexlate_dev.external_command_type import ExternalCLICommandType
 from flexlate_dev.user_command import UserCommand
+from flexlate_dev.user_runner import UserRootRunConfiguration
 from tests.config import (
     EXTEND_DATA_CONFIG_PATH,
     EXTEND_DEFAULT_RUN_CONFIG_PATH,
@@ -98,3 +104,64 @@ def test_ignores_work_with_extensions():
     assert serve_config_unignore_git.ignore_matches("ignored.txt")
     assert not serve_config_unignore_git.ignore_matches(".git/a.txt")
     assert not serve_config_unignore_git.ignore_matches("a.txt")
+
+
+def test_resolved_run_config_is_reused_until_config_changes():
+    config = FlexlateDevConfig.load(EXTEND_RUN_CONFIG_PATH)
+    run_config = config.get_full_run_config(
+        ExternalCLICommandType.SERVE, "my-run-config"
+    )
+    assert (
+        config.get_full_run_config(ExternalCLICommandType.SERVE, "my-run-config")
+        is run_config
+    )
+
+    config.run_configs["my-run-config"].auto_commit_message = "changed"
+    config.invalidate_resolved_configs()
+    changed_run_config = config.get_full_run_config(
+        ExternalCLICommandType.SERVE, "my-run-config"
+    )
+    assert changed_run_config is not run_config
+    assert changed_run_config.config.auto_commit_message == "changed"
+
+
+def test_load_config_reuses_config_until_file_changes():
+    config_path = GENERATED_FILES_DIR / EXTEND_RUN_CONFIG_PATH.name
+    shutil.copy(EXTEND_RUN_CONFIG_PATH, config_path)
+    config = load_config(config_path)
+    run_config = config.get_full_run_config(
+        ExternalCLICommandType.SERVE, "my-run-config"
+    )
+    assert load_config(config_path) is config
+
+    config_path.write_text(
+        config_path.read_text().replace(
+            "auto_commit_message: something", "auto_commit_message: changed"
+        )
+    )
+    changed_config = load_config(config_path)
+    assert changed_config is not config
+    changed_run_config = changed_config.get_full_run_config(
+        ExternalCLICommandType.SERVE, "my-run-config"
+    )
+    assert changed_run_config.config.auto_commit_message == "changed"
+    assert run_config.config.auto_commit_message == "something"
+
+
+def test_circular_extends_raises():
+    config = FlexlateDevConfig(
+        data=dict(
+            a=UserDataConfiguration(extends="b"),
+            b=UserDataConfiguration(extends="a"),
+        ),
+        run_configs=dict(
+            default=UserRootRunConfiguration(extends="other"),
+            other=UserRootRunConfiguration(extends="default"),
+        ),
+    )
+    with pytest.raises(CircularExtendsException) as exc_info:
+        config.get_full_run_config(ExternalCLICommandType.SERVE)
+    assert "default -> other -> default" in str(exc_info.value)
+    with pytest.raises(CircularExtendsException) as exc_info:
+        config.get_data_config("a")
+    assert "a -> b -> a" in str(exc_info.value)
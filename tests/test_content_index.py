@@ -0,0 +1,61 @@
+import os
+from pathlib import Path
+
+from flexlate_dev.ignore import IgnoreSpecification
+from flexlate_dev.server.content_index import ContentHashIndex
+from tests.config import GENERATED_FILES_DIR
+
+
+def test_content_index_only_reports_changed_content():
+    file = GENERATED_FILES_DIR / "a.txt"
+    file.write_text("content")
+    index = ContentHashIndex(GENERATED_FILES_DIR)
+    index.refresh(lambda path: False)
+    path = Path("a.txt")
+
+    # Touched, and rewritten with the same content
+    os.utime(file)
+    assert index.changed_fingerprints([path]) == {}
+    file.write_text("content")
+    assert index.changed_fingerprints([path]) == {}
+
+    file.write_text("new content")
+    changed = index.changed_fingerprints([path])
+    assert list(changed) == [path]
+    # Not indexed until recorded
+    assert list(index.changed_fingerprints([path])) == [path]
+    index.record(changed)
+    assert index.changed_fingerprints([path]) == {}
+
+
+def test_content_index_reports_new_deleted_and_directory_paths():
+    folder = GENERATED_FILES_DIR / "folder"
+    folder.mkdir()
+    file = folder / "a.txt"
+    index = ContentHashIndex(GENERATED_FILES_DIR)
+    index.refresh(lambda path: False)
+    path = Path("folder") / "a.txt"
+
+    file.write_text("content")
+    index.record(index.changed_fingerprints([path]))
+    assert len(index) == 1
+    assert index.changed_fingerprints([path]) == {}
+    assert index.changed_fingerprints([Path("folder")]) == {Path("folder"): None}
+    file.unlink()
+    changed = index.changed_fingerprints([path])
+    assert changed == {path: None}
+    index.record(changed)
+    assert len(index) == 0
+
+
+def test_content_index_skips_ignored_directories():
+    for file in [
+        GENERATED_FILES_DIR / "node_modules" / "a.js",
+        GENERATED_FILES_DIR / "b.txt",
+    ]:
+        file.parent.mkdir(exist_ok=True)
+        file.write_text("content")
+    spec = IgnoreSpecification(ignore_list=["node_modules/"])
+    index = ContentHashIndex(GENERATED_FILES_DIR)
+    index.refresh(spec.directory_is_fully_ignored)
+    assert len(index) == 1
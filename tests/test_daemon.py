@@ -0,0 +1,148 @@
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from flexlate_dev.config import FlexlateDevConfig
+from flexlate_dev.daemon import DaemonCommand, DaemonServer, send_request
+from flexlate_dev.exc import DaemonNotRunningException
+from flexlate_dev.user_runner import UserRootRunConfiguration, UserRunConfiguration
+from tests.config import GENERATED_FILES_DIR
+from tests.fixtures.template_path import *
+
+SOCKET_PATH = GENERATED_FILES_DIR / "daemon.sock"
+
+
+def test_daemon_publishes_and_streams_output(copier_one_template_path: Path):
+    template_path = copier_one_template_path
+    project_path = GENERATED_FILES_DIR / "project"
+    config_path = GENERATED_FILES_DIR / "flexlate-dev.yaml"
+    config = FlexlateDevConfig.load_or_create(config_path)
+    config.run_configs["default"] = UserRootRunConfiguration(
+        publish=UserRunConfiguration(post_init=["echo from-hook"])
+    )
+    config.save()
+
+    server = DaemonServer(SOCKET_PATH)
+    server_thread = threading.Thread(target=server.serve_until_stopped, daemon=True)
+    server_thread.start()
+    try:
+        publish_kwargs = dict(
+            template_path=template_path,
+            out_root=GENERATED_FILES_DIR,
+            config_path=config_path,
+            no_input=True,
+        )
+        output = io.StringIO()
+        result = send_request(
+            DaemonCommand.PUBLISH,
+            SOCKET_PATH,
+            dict(publish_kwargs, save=True),
+            out=output,
+        )
+        assert result["exit_code"] == 0
+        assert (project_path / "a1.txt").read_text() == "1"
+        assert "from-hook" in output.getvalue()
+
+        # Config is kept loaded for the next publish, which updates the project
+        result = send_request(
+            DaemonCommand.PUBLISH, SOCKET_PATH, publish_kwargs, out=io.StringIO()
+        )
+        assert result["exit_code"] == 0
+        status = send_request(DaemonCommand.STATUS, SOCKET_PATH)["status"]
+        assert status["requests_handled"] == 2
+        assert status["cached_configs"] == 1
+        assert status["active_publishes"] == 0
+    finally:
+        send_request(DaemonCommand.STOP, SOCKET_PATH)
+        server_thread.join(timeout=5)
+    assert not server_thread.is_alive()
+    assert not SOCKET_PATH.exists()
+
+
+def _create_config(folder: Path, hook: str) -> Path:
+    folder.mkdir(parents=True)
+    config_path = folder / "flexlate-dev.yaml"
+    config = FlexlateDevConfig.load_or_create(config_path)
+    config.run_configs["default"] = UserRootRunConfiguration(
+        publish=UserRunConfiguration(post_init=[hook])
+    )
+    config.save()
+    return config_path
+
+
+def test_daemon_runs_requests_at_once_with_separate_output(
+    copier_one_template_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    first_root = GENERATED_FILES_DIR / "first"
+    second_root = GENERATED_FILES_DIR / "second"
+    first_config_path = _create_config(first_root, "echo from-first")
+    _create_config(second_root, "echo from-second")
+    # The second request finds its config in the working directory of the client
+    monkeypatch.chdir(second_root)
+
+    server = DaemonServer(SOCKET_PATH)
+    server_thread = threading.Thread(target=server.serve_until_stopped, daemon=True)
+    server_thread.start()
+    try:
+        requests = [
+            dict(config_path=first_config_path, out_root=first_root),
+            dict(config_path=None, out_root=second_root),
+        ]
+        outputs = [io.StringIO() for _ in requests]
+        with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+            futures = [
+                executor.submit(
+                    send_request,
+                    DaemonCommand.PUBLISH,
+                    SOCKET_PATH,
+                    dict(
+                        request,
+                        template_path=copier_one_template_path,
+                        no_input=True,
+                    ),
+                    output,
+                )
+                for request, output in zip(requests, outputs)
+            ]
+            results = [future.result() for future in futures]
+        assert [result["exit_code"] for result in results] == [0, 0]
+        first_output, second_output = (output.getvalue() for output in outputs)
+        assert "from-first" in first_output
+        assert "from-second" not in first_output
+        assert "from-second" in second_output
+        assert "from-first" not in second_output
+        assert (first_root / "project" / "a1.txt").read_text() == "1"
+        assert (second_root / "project" / "a1.txt").read_text() == "1"
+    finally:
+        send_request(DaemonCommand.STOP, SOCKET_PATH)
+        server_thread.join(timeout=5)
+
+
+def test_daemon_reports_failed_publish():
+    server = DaemonServer(SOCKET_PATH)
+    server_thread = threading.Thread(target=server.serve_until_stopped, daemon=True)
+    server_thread.start()
+    try:
+        result = send_request(
+            DaemonCommand.PUBLISH,
+            SOCKET_PATH,
+            dict(
+                template_path=GENERATED_FILES_DIR / "does-not-exist",
+                out_root=GENERATED_FILES_DIR,
+                config_path=GENERATED_FILES_DIR / "flexlate-dev.yaml",
+                no_input=True,
+            ),
+            out=io.StringIO(),
+        )
+        assert result["exit_code"] == 1
+        assert result["error"]
+    finally:
+        send_request(DaemonCommand.STOP, SOCKET_PATH)
+        server_thread.join(timeout=5)
+
+
+def test_request_without_daemon_raises():
+    with pytest.raises(DaemonNotRunningException):
+        send_request(DaemonCommand.STATUS, SOCKET_PATH)
@@ -1,8 +1,19 @@
 import os
 import shutil
 from pathlib import Path
+from typing import Dict, List
 
-from flexlate_dev.ignore import IgnoreSpecification
+import pytest
+from git import Repo
+from pathspec import PathSpec
+
+from flexlate_dev.ignore import (
+    GitIgnoreMatcher,
+    IgnoreSpecification,
+    TemplateIgnores,
+    walk_unignored,
+)
+from tests.config import GENERATED_FILES_DIR
 from tests.fixtures.temp_dir import inside_generated_dir
 
 
@@ -71,6 +82,116 @@ def test_empty_ignore_does_not_ignore_anything(inside_generated_dir):
     _make_file_and_check_ignore("b.txt", ignore, False)
 
 
+def test_directory_is_fully_ignored():
+    ignore = IgnoreSpecification(ignore_list=["node_modules/", "build"])
+    assert ignore.directory_is_fully_ignored(Path("node_modules"))
+    assert ignore.directory_is_fully_ignored(Path("a/node_modules"))
+    assert ignore.directory_is_fully_ignored(Path("build"))
+    assert ignore.directory_is_fully_ignored(Path(".git"))
+    assert not ignore.directory_is_fully_ignored(Path("a"))
+
+
+def test_directory_is_not_fully_ignored_when_negation_could_match_within():
+    ignore = IgnoreSpecification(ignore_list=["a/", "b/", "!a/b.txt", "!c/*.txt"])
+    assert not ignore.directory_is_fully_ignored(Path("a"))
+    assert ignore.directory_is_fully_ignored(Path("b"))
+
+    ignore = IgnoreSpecification(ignore_list=["a/", "!keep.txt"])
+    assert not ignore.directory_is_fully_ignored(Path("a"))
+
+
+MATCHER_PATTERNS = [
+    "*.pyc",
+    "node_modules/",
+    "build",
+    "/dist/",
+    "docs/**/*.md",
+    "!docs/keep/*.md",
+    "a/",
+    "!a/b.txt",
+    "# comment",
+    "",
+    "a/b.txt",
+]
+MATCHER_PATHS = [
+    "x.pyc",
+    "src/x.pyc",
+    "node_modules",
+    "src/node_modules/pkg/index.js",
+    "build",
+    "src/build/out.o",
+    "dist",
+    "src/dist",
+    "docs/a/b.md",
+    "docs/keep/c.md",
+    "a/b.txt",
+    "a/c.txt",
+    "b.txt",
+]
+
+
+# Negations of files, directories and globs, in and out of directory-only patterns
+NEGATION_MATCHER_PATTERNS = [
+    "*.log",
+    "!important.log",
+    "logs/",
+    "!logs/",
+    "tmp/**",
+    "!tmp/keep/",
+    "**/cache/",
+    "!src/cache/",
+    "out/",
+    "!out/*.txt",
+    "*.txt",
+    "!/b.txt",
+]
+NEGATION_MATCHER_PATHS = [
+    "a.log",
+    "important.log",
+    "src/important.log",
+    "logs",
+    "logs/a.txt",
+    "tmp",
+    "tmp/a",
+    "tmp/keep",
+    "tmp/keep/a.txt",
+    "cache",
+    "lib/cache",
+    "src/cache",
+    "out",
+    "out/a.txt",
+    "out/a.md",
+    "b.txt",
+    "src/b.txt",
+]
+
+
+@pytest.mark.parametrize("is_dir", [False, True])
+@pytest.mark.parametrize(
+    "patterns, path",
+    [
+        *((MATCHER_PATTERNS, path) for path in MATCHER_PATHS),
+        *((NEGATION_MATCHER_PATTERNS, path) for path in NEGATION_MATCHER_PATHS),
+    ],
+)
+def test_matcher_matches_like_pathspec(patterns: List[str], path: str, is_dir: bool):
+    matcher = GitIgnoreMatcher(patterns)
+    spec = PathSpec.from_lines("gitwildmatch", patterns)
+    expect = spec.match_file(path + "/" if is_dir else path)
+    assert matcher(path, is_dir=is_dir) == expect
+
+
+def test_matcher_with_is_dir_hint_does_not_check_file_system(monkeypatch):
+    def is_dir(self) -> bool:
+        raise AssertionError("Should not check the file system")
+
+    monkeypatch.setattr(Path, "is_dir", is_dir)
+    ignore = IgnoreSpecification(ignore_list=["a/"])
+    assert ignore.file_is_ignored("a", is_dir=True)
+    assert not ignore.file_is_ignored("a", is_dir=False)
+    assert ignore.file_is_ignored(Path("a/b.txt"), is_dir=False)
+
+
 def _make_file_and_check_ignore(
     file_path: str,
     ignore_spec: IgnoreSpecification,
@@ -91,3 +212,97 @@ def _make_file_and_check_ignore(
     assert ignore_spec.file_is_ignored(file_path) == expected_result
     # Clean up
     remove()
+
+
+def test_git_ignores_apply_nested_gitignores_and_exclude(inside_generated_dir):
+    Repo.init(GENERATED_FILES_DIR)
+    (GENERATED_FILES_DIR / ".git" / "info").mkdir(exist_ok=True)
+    (GENERATED_FILES_DIR / ".git" / "info" / "exclude").write_text("*.log\n")
+    _write_files(
+        {
+            ".gitignore": "node_modules/\n/build\n*.tmp\n",
+            "src/.gitignore": "!keep.tmp\n/local.txt\n",
+        }
+    )
+    ignores = TemplateIgnores(GENERATED_FILES_DIR)
+
+    assert ignores.directory_is_fully_ignored(Path("node_modules"))
+    assert ignores.directory_is_fully_ignored(Path("src/node_modules"))
+    assert ignores.directory_is_fully_ignored(Path("build"))
+    assert not ignores.directory_is_fully_ignored(Path("src/build"))
+    assert ignores.file_is_ignored(Path("a.log"), is_dir=False)
+    assert ignores.file_is_ignored(Path("a.tmp"), is_dir=False)
+    assert ignores.file_is_ignored(Path("src/a.tmp"), is_dir=False)
+    assert not ignores.file_is_ignored(Path("src/keep.tmp"), is_dir=False)
+    assert ignores.file_is_ignored(Path("src/local.txt"), is_dir=False)
+    assert not ignores.file_is_ignored(Path("local.txt"), is_dir=False)
+    # Nothing in an ignored directory can be re-included
+    assert ignores.file_is_ignored(Path("node_modules/keep.tmp"), is_dir=False)
+
+
+def test_template_ignores_in_subfolder_of_repo(inside_generated_dir):
+    Repo.init(GENERATED_FILES_DIR)
+    _write_files({".gitignore": "template/dist/\n", "template/a.txt": ""})
+    ignores = TemplateIgnores(GENERATED_FILES_DIR / "template")
+    assert ignores.directory_is_fully_ignored(Path("dist"))
+    assert not ignores.directory_is_fully_ignored(Path("src"))
+
+
+def test_template_ignores_in_ignored_folder_of_repo(inside_generated_dir):
+    Repo.init(GENERATED_FILES_DIR)
+    _write_files(
+        {
+            ".gitignore": "build/\n*.log\n",
+            "build/template/a.txt": "",
+            "build/template/.gitignore": "*.tmp\n",
+        }
+    )
+    ignores = TemplateIgnores(GENERATED_FILES_DIR / "build" / "template")
+    # The repository does not track anything in the template, so only the ignores
+    # that always apply are used
+    assert not ignores.file_is_ignored(Path("a.txt"), is_dir=False)
+    assert not ignores.file_is_ignored(Path("a.log"), is_dir=False)
+    assert not ignores.file_is_ignored(Path("a.tmp"), is_dir=False)
+    assert ignores.directory_is_fully_ignored(Path(".git"))
+
+
+def test_template_ignores_pick_up_gitignore_changes(inside_generated_dir):
+    Repo.init(GENERATED_FILES_DIR)
+    _write_files({".gitignore": "a.txt\n"})
+    ignores = TemplateIgnores(GENERATED_FILES_DIR)
+    assert ignores.file_is_ignored(Path("a.txt"), is_dir=False)
+    _write_files({".gitignore": "b.txt\n"})
+    ignores.clear_cache()
+    assert not ignores.file_is_ignored(Path("a.txt"), is_dir=False)
+    assert ignores.file_is_ignored(Path("b.txt"), is_dir=False)
+
+
+def test_walk_unignored_does_not_enter_ignored_directories(inside_generated_dir):
+    Repo.init(GENERATED_FILES_DIR)
+    _write_files(
+        {
+            ".gitignore": "node_modules/\n",
+            "a.txt": "",
+            "src/b.txt": "",
+            "node_modules/pkg/.gitignore": "!*\n",
+            "node_modules/pkg/index.js": "",
+        }
+    )
+    entered = []
+    ignores = TemplateIgnores(GENERATED_FILES_DIR)
+
+    def directory_is_ignored(directory: Path) -> bool:
+        entered.append(directory)
+        return ignores.directory_is_fully_ignored(directory)
+
+    paths = list(walk_unignored(GENERATED_FILES_DIR, directory_is_ignored))
+    assert paths == [Path(".gitignore"), Path("a.txt"), Path("src/b.txt")]
+    assert Path("node_modules/pkg") not in entered
+    assert list(walk_unignored(GENERATED_FILES_DIR)) == paths
+
+
+def _write_files(files: Dict[str, str]):
+    for name, content in files.items():
+        path = GENERATED_FILES_DIR / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
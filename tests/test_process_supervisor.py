@@ -0,0 +1,94 @@
+import time
+
+from flexlate_dev.process_supervisor import ProcessSupervisor
+from flexlate_dev.user_command import UserCommand
+from tests.config import GENERATED_FILES_DIR
+from tests.waitutils import wait_until_path_exists, wait_until_returns_true
+
+
+def test_starting_a_command_again_restarts_it():
+    supervisor = ProcessSupervisor()
+    command = UserCommand(run="sleep 30", name="sleeper", background=True)
+    try:
+        first_process = supervisor.start(command, GENERATED_FILES_DIR)
+        second_process = supervisor.start(command, GENERATED_FILES_DIR)
+        assert first_process.poll() is not None
+        assert second_process.poll() is None
+
+        statuses = supervisor.statuses()
+        assert len(statuses) == 1
+        status = statuses[0]
+        assert status.name == "sleeper"
+        assert status.pid == second_process.pid
+        assert status.running
+        assert status.starts == 2
+    finally:
+        supervisor.stop_all()
+    assert second_process.poll() is not None
+    assert supervisor.statuses() == []
+
+
+def test_commands_in_different_directories_run_separately():
+    supervisor = ProcessSupervisor()
+    command = UserCommand(run="sleep 30", background=True)
+    other_directory = GENERATED_FILES_DIR / "other"
+    other_directory.mkdir(parents=True)
+    try:
+        first_process = supervisor.start(command, GENERATED_FILES_DIR)
+        second_process = supervisor.start(command, other_directory)
+        assert first_process.poll() is None
+        assert second_process.poll() is None
+        assert len(supervisor.statuses()) == 2
+    finally:
+        supervisor.stop_all()
+
+
+def test_stopping_kills_the_whole_process_group():
+    supervisor = ProcessSupervisor()
+    child_finished_path = GENERATED_FILES_DIR / "child-finished.txt"
+    child_started_path = GENERATED_FILES_DIR / "child-started.txt"
+    # Shell runs the child in the background and waits on it
+    command = UserCommand(
+        run=f"(touch {child_started_path}; sleep 2; touch {child_finished_path}) & wait",
+        background=True,
+    )
+    GENERATED_FILES_DIR.mkdir(parents=True, exist_ok=True)
+    supervisor.start(command, GENERATED_FILES_DIR)
+    wait_until_path_exists(child_started_path)
+    supervisor.stop_all()
+    time.sleep(3)
+    assert not child_finished_path.exists()
+
+
+def test_command_exiting_on_its_own_is_reported(capsys):
+    supervisor = ProcessSupervisor()
+    failing_command = UserCommand(run="exit 3", name="failing", background=True)
+    restarted_command = UserCommand(run="sleep 30", name="sleeper", background=True)
+    output = ""
+
+    def output_contains(text: str) -> bool:
+        nonlocal output
+        # Joined as long lines are wrapped
+        output = " ".join([output, *capsys.readouterr().out.split()])
+        return text in output
+
+    try:
+        supervisor.start(failing_command, GENERATED_FILES_DIR)
+        supervisor.start(restarted_command, GENERATED_FILES_DIR)
+        wait_until_returns_true(
+            lambda: output_contains("Background command failing"),
+            "Exit of the failing command was not reported",
+        )
+        assert "exited with code 3" in output
+        (status,) = [
+            status for status in supervisor.statuses() if status.name == "failing"
+        ]
+        assert not status.running
+        assert status.exit_code == 3
+
+        supervisor.start(restarted_command, GENERATED_FILES_DIR)
+    finally:
+        supervisor.stop_all()
+    # Restarting and stopping are not reported
+    time.sleep(0.5)
+    assert not output_contains("Background command sleeper")
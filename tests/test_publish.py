@@ -7,8 +7,10 @@ from flexlate_dev.config import (
     FlexlateDevConfig,
     UserDataConfiguration,
 )
+from flexlate_dev.dirutils import get_state_folder
 from flexlate_dev.gitutils import stage_and_commit_all
 from flexlate_dev.publish import publish_template
+from flexlate_dev.publish_state import PUBLISH_STATE_FOLDER_NAME
 from flexlate_dev.server.main import run_server
 from flexlate_dev.user_runner import UserRootRunConfiguration, UserRunConfiguration
 from tests.config import (
@@ -393,3 +395,57 @@ def test_publish_overrides_data_and_folder_name_from_config(
     # Check that post init but not post update was run
     assert (project_path / "one.txt").exists()
     assert not (project_path / "two.txt").exists()
+
+
+def test_publish_skips_unchanged_run_configuration(copier_one_template_path: Path):
+    template_path = copier_one_template_path
+    template_file = template_path / "{{ q1 }}.txt.jinja"
+    project_path = GENERATED_FILES_DIR / "project"
+    expect_file = project_path / "a1.txt"
+    updated_file = project_path / "two.txt"
+
+    config_path = GENERATED_FILES_DIR / "flexlate-dev.yaml"
+    config = FlexlateDevConfig.load_or_create(config_path)
+    publish_run_config = UserRunConfiguration(
+        post_init=["touch one.txt"], post_update=["touch two.txt"]
+    )
+    config.run_configs["default"] = UserRootRunConfiguration(publish=publish_run_config)
+    config.save()
+
+    def publish(save: bool = False):
+        publish_template(
+            template_path,
+            GENERATED_FILES_DIR,
+            config_path=config_path,
+            no_input=True,
+            save=save,
+            skip_unchanged=True,
+        )
+
+    publish(save=True)
+    assert expect_file.read_text() == "1"
+    stage_and_commit_all(Repo(project_path), "Add one.txt")
+
+    # Nothing changed, should not update
+    publish()
+    assert not updated_file.exists()
+
+    # Template changed, should update
+    template_file.write_text("new content {{ q2 }}")
+    publish()
+    assert expect_file.read_text() == "new content 1"
+    assert updated_file.exists()
+    stage_and_commit_all(Repo(project_path), "Update project")
+
+    # Config changed, should not be considered up to date
+    state_path = (
+        get_state_folder(GENERATED_FILES_DIR)
+        / PUBLISH_STATE_FOLDER_NAME
+        / "default.json"
+    )
+    state_before_config_change = state_path.read_text()
+    config = FlexlateDevConfig.load(config_path)
+    config.run_configs["default"].publish.post_update = ["touch three.txt"]  # type: ignore
+    config.save()
+    publish()
+    assert state_path.read_text() != state_before_config_change
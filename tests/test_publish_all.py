@@ -1,4 +1,7 @@
+import pytest
+
 from flexlate_dev.config import FlexlateDevConfig, UserDataConfiguration
+from flexlate_dev.exc import PublishFailedException, UserInputException
 from flexlate_dev.publish import publish_all_templates
 from flexlate_dev.user_runner import UserRootRunConfiguration, UserRunConfiguration
 from tests.config import GENERATED_FILES_DIR
@@ -180,3 +183,49 @@ def test_publish_overrides_data_for_all_run_configurations(
         # Check that post init but not post update was run
         assert (project_path / f"{folder_name}-one.txt").exists()
         assert not (project_path / f"{folder_name}-two.txt").exists()
+
+
+def test_publish_all_in_parallel_publishes_all_and_reports_failures(
+    copier_one_template_path: Path, capfd
+):
+    template_path = copier_one_template_path
+    config_path = GENERATED_FILES_DIR / "flexlate-dev.yaml"
+    _create_config_with_default_and_two_run_configs()
+    config = FlexlateDevConfig.load(config_path)
+    # Invalid command template
+    config.run_configs["two"].publish.post_init = ["{% if %}"]  # type: ignore
+    config.save()
+
+    with pytest.raises(PublishFailedException) as exc_info:
+        publish_all_templates(
+            template_path,
+            GENERATED_FILES_DIR,
+            config_path=config_path,
+            no_input=True,
+            always_include_default=True,
+            jobs=3,
+        )
+
+    assert "two" in str(exc_info.value)
+    assert "one" not in str(exc_info.value)
+    for folder_name in ["default", "out-one"]:
+        project_path = GENERATED_FILES_DIR / folder_name
+        assert (project_path / "a1.txt").read_text() == "1"
+        assert (project_path / f"{folder_name}-one.txt").exists()
+    output = capfd.readouterr().out
+    assert "[two] Traceback" in output
+    assert "TemplateSyntaxError" in output
+    assert "Publish summary" in output
+
+
+def test_publish_all_in_parallel_requires_no_input(copier_one_template_path: Path):
+    config_path = GENERATED_FILES_DIR / "flexlate-dev.yaml"
+    _create_config_with_default_and_two_run_configs()
+
+    with pytest.raises(UserInputException):
+        publish_all_templates(
+            copier_one_template_path,
+            GENERATED_FILES_DIR,
+            config_path=config_path,
+            jobs=2,
+        )
@@ -0,0 +1,24 @@
+from jinja2 import Environment
+
+from flexlate_dev.render import create_jinja_environment
+from tests.fixtures.jinja_env import jinja_env
+
+
+def test_from_string_compiles_each_source_once(jinja_env: Environment):
+    template = jinja_env.from_string("echo {{ data.a }}")
+    assert jinja_env.from_string("echo {{ data.a }}") is template
+    assert template.render(data=dict(a=1)) == "echo 1"
+    assert jinja_env.from_string("echo {{ data.b }}") is not template
+
+
+def test_from_string_cache_is_bounded():
+    env = create_jinja_environment(from_string_cache_size=1)
+    template = env.from_string("a")
+    env.from_string("b")
+    assert env.from_string("a") is not template
+
+
+def test_from_string_with_globals_is_not_cached(jinja_env: Environment):
+    template = jinja_env.from_string("{{ a }}", globals=dict(a=1))
+    assert jinja_env.from_string("{{ a }}", globals=dict(a=2)).render() == "2"
+    assert template.render() == "1"
@@ -0,0 +1,125 @@
+import threading
+import time
+from pathlib import Path
+from typing import List, Set
+
+from flexlate_dev.cancellation import CancellationToken
+from flexlate_dev.server.scheduler import RebuildScheduler
+from tests.waitutils import wait_until_returns_true
+
+
+def test_scheduler_coalesces_a_burst_of_changes_into_one_rebuild():
+    rebuilds: List[Set[Path]] = []
+    scheduler = RebuildScheduler(
+        lambda paths, token: rebuilds.append(paths), quiet_period_seconds=0.2
+    )
+    scheduler.start()
+    try:
+        paths = {Path(f"{i}.txt") for i in range(40)}
+        for path in paths:
+            scheduler.mark_dirty(path)
+        wait_until_returns_true(lambda: len(rebuilds) == 1, "Rebuild never ran")
+        wait_until_returns_true(lambda: scheduler.is_idle, "Scheduler never idle")
+    finally:
+        scheduler.stop()
+
+    assert rebuilds == [paths]
+
+
+def test_scheduler_runs_exactly_one_more_rebuild_for_changes_during_rebuild():
+    rebuilds: List[Set[Path]] = []
+    rebuild_started = threading.Event()
+    release_rebuild = threading.Event()
+
+    def rebuild(paths: Set[Path], token: CancellationToken):
+        # Ignores cancellation, like a rebuild that is past its last cancellation point
+        rebuilds.append(paths)
+        rebuild_started.set()
+        release_rebuild.wait(5)
+
+    scheduler = RebuildScheduler(rebuild, quiet_period_seconds=0.05)
+    scheduler.start()
+    try:
+        scheduler.mark_dirty(Path("a.txt"))
+        assert rebuild_started.wait(5)
+        # Arrive while the first rebuild is still running
+        scheduler.mark_dirty(Path("b.txt"))
+        scheduler.mark_dirty(Path("c.txt"))
+        time.sleep(0.2)
+        release_rebuild.set()
+        wait_until_returns_true(lambda: len(rebuilds) == 2, "Second rebuild never ran")
+        wait_until_returns_true(lambda: scheduler.is_idle, "Scheduler never idle")
+        time.sleep(0.2)
+    finally:
+        scheduler.stop()
+
+    assert rebuilds == [{Path("a.txt")}, {Path("b.txt"), Path("c.txt")}]
+
+
+def test_scheduler_keeps_changes_made_while_stopped():
+    rebuilds: List[Set[Path]] = []
+    scheduler = RebuildScheduler(
+        lambda paths, token: rebuilds.append(paths), quiet_period_seconds=0.05
+    )
+    scheduler.mark_dirty(Path("a.txt"))
+    assert rebuilds == []
+    scheduler.start()
+    try:
+        wait_until_returns_true(lambda: len(rebuilds) == 1, "Rebuild never ran")
+    finally:
+        scheduler.stop()
+
+    assert rebuilds == [{Path("a.txt")}]
+
+
+def test_scheduler_cancels_in_flight_rebuild_and_restarts_with_all_changes():
+    started_rebuilds: List[Set[Path]] = []
+    finished_rebuilds: List[Set[Path]] = []
+
+    def rebuild(paths: Set[Path], token: CancellationToken):
+        started_rebuilds.append(paths)
+        if len(started_rebuilds) == 1:
+            # First rebuild is slow, wait until it gets cancelled
+            wait_until_returns_true(lambda: token.is_cancelled, "Never cancelled")
+        token.raise_if_cancelled()
+        finished_rebuilds.append(paths)
+
+    scheduler = RebuildScheduler(rebuild, quiet_period_seconds=0.05)
+    scheduler.start()
+    try:
+        scheduler.mark_dirty(Path("a.txt"))
+        wait_until_returns_true(lambda: len(started_rebuilds) == 1, "Never started")
+        scheduler.mark_dirty(Path("b.txt"))
+        wait_until_returns_true(lambda: len(finished_rebuilds) == 1, "Never finished")
+        wait_until_returns_true(lambda: scheduler.is_idle, "Scheduler never idle")
+    finally:
+        scheduler.stop()
+
+    assert finished_rebuilds == [{Path("a.txt"), Path("b.txt")}]
+
+
+def test_scheduler_skips_rebuild_when_filter_drops_all_paths():
+    rebuilds: List[Set[Path]] = []
+    filtered: List[Set[Path]] = []
+
+    def filter_paths(paths: Set[Path]) -> Set[Path]:
+        filtered.append(paths)
+        return {path for path in paths if path.suffix != ".unchanged"}
+
+    scheduler = RebuildScheduler(
+        lambda paths, token: rebuilds.append(paths),
+        quiet_period_seconds=0.05,
+        filter_paths=filter_paths,
+    )
+    scheduler.start()
+    try:
+        scheduler.mark_dirty(Path("a.unchanged"))
+        wait_until_returns_true(lambda: len(filtered) == 1, "Never filtered")
+        wait_until_returns_true(lambda: scheduler.is_idle, "Scheduler never idle")
+        scheduler.mark_dirty(Path("b.unchanged"))
+        scheduler.mark_dirty(Path("c.txt"))
+        wait_until_returns_true(lambda: len(rebuilds) == 1, "Rebuild never ran")
+    finally:
+        scheduler.stop()
+
+    assert rebuilds == [{Path("c.txt")}]
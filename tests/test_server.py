@@ -1,3 +1,4 @@
+import os
 import time
 from pathlib import Path
 
@@ -6,8 +7,15 @@ from git import Repo
 
 from flexlate_dev.config import FlexlateDevConfig, UserDataConfiguration
 from flexlate_dev.gitutils import stage_and_commit_all
+from flexlate_dev.incremental import (
+    INCREMENTAL_COMMIT_MESSAGE,
+    is_incremental_update_commit_message,
+)
+from flexlate_dev.process_supervisor import process_supervisor
 from flexlate_dev.server.main import run_server
-from flexlate_dev.user_runner import UserRunConfiguration
+from flexlate_dev.staging import get_staging_path
+from flexlate_dev.user_command import UserCommand
+from flexlate_dev.user_runner import UserRootRunConfiguration, UserRunConfiguration
 from tests.config import (
     BLOCKING_COMMAND_CONFIG_PATH,
     EXTEND_DEFAULT_RUN_CONFIG_PATH,
@@ -156,6 +164,29 @@ def test_server_runs_a_background_command_and_keeps_reloading(
         wait_until_file_has_content(expect_file, modified_time, "new content 1")
 
 
+def test_server_reports_background_commands_on_exit(
+    copier_one_template_path: Path, capsys
+):
+    template_path = copier_one_template_path
+    command = UserCommand(run="sleep 30", name="sleeper", background=True)
+    config = FlexlateDevConfig(
+        run_configs=dict(
+            default=UserRootRunConfiguration(
+                serve=UserRunConfiguration(post_init=[command])
+            )
+        )
+    )
+    with run_server(config, None, template_path, GENERATED_FILES_DIR, no_input=True):
+        wait_until_returns_true(
+            lambda: len(process_supervisor.statuses()) == 1,
+            "Background command was not started",
+        )
+    assert process_supervisor.statuses() == []
+    # Joined as long lines are wrapped
+    output = " ".join(capsys.readouterr().out.split())
+    assert "Stopping background command sleeper" in output
+
+
 @pytest.mark.parametrize(
     "config_path", [EXTEND_RUN_CONFIG_PATH, EXTEND_DEFAULT_RUN_CONFIG_PATH]
 )
@@ -248,6 +279,298 @@ def test_server_overrides_data_and_folder_name(copier_one_template_path: Path):
         wait_until_file_has_content(expect_file, modified_time, "new content 4")
 
 
+def test_server_incrementally_updates_non_templated_files(
+    copier_one_template_path: Path,
+):
+    template_path = copier_one_template_path
+    project_path = GENERATED_FILES_DIR / "project"
+    expect_file = project_path / "README.md"
+    template_file = template_path / "README.md"
+    config = FlexlateDevConfig()
+    with run_server(
+        config,
+        None,
+        template_path,
+        GENERATED_FILES_DIR,
+        no_input=True,
+        incremental=True,
+    ):
+        wait_until_path_exists(expect_file)
+        # Check initial load
+        assert expect_file.read_text() == "some existing content"
+        modified_time = expect_file.lstat().st_mtime
+
+        # Cause a reload
+        template_file.write_text("new content")
+
+        # Check reload
+        wait_until_file_has_content(expect_file, modified_time, "new content")
+        project_repo = Repo(project_path)
+        wait_until_returns_true(
+            lambda: is_incremental_update_commit_message(
+                project_repo.head.commit.message
+            ),
+            "Incremental update was never committed",
+        )
+
+
+def test_server_incremental_falls_back_to_full_update_for_templated_files(
+    copier_one_template_path: Path,
+):
+    template_path = copier_one_template_path
+    project_path = GENERATED_FILES_DIR / "project"
+    expect_file = project_path / "a1.txt"
+    template_file = template_path / "{{ q1 }}.txt.jinja"
+    config = FlexlateDevConfig()
+    with run_server(
+        config,
+        None,
+        template_path,
+        GENERATED_FILES_DIR,
+        no_input=True,
+        incremental=True,
+    ):
+        wait_until_path_exists(expect_file)
+        # Check initial load
+        assert expect_file.read_text() == "1"
+        modified_time = expect_file.lstat().st_mtime
+
+        # Cause a reload
+        template_file.write_text("new content {{ q2 }}")
+
+        # Check reload
+        wait_until_file_has_content(expect_file, modified_time, "new content 1")
+        project_repo = Repo(project_path)
+        assert not is_incremental_update_commit_message(
+            project_repo.head.commit.message
+        )
+
+
+def test_server_back_syncs_after_incremental_and_full_updates(
+    copier_one_template_repo: Repo,
+):
+    template_path = Path(copier_one_template_repo.working_dir)
+    project_path = GENERATED_FILES_DIR / "project"
+    expect_file = project_path / "a1.txt"
+    template_file = template_path / "{{ q1 }}.txt.jinja"
+    non_templated_template_file = template_path / "README.md"
+    non_templated_expect_file = project_path / "README.md"
+    with run_server(
+        FlexlateDevConfig(),
+        None,
+        template_path,
+        GENERATED_FILES_DIR,
+        no_input=True,
+        back_sync=True,
+        incremental=True,
+    ) as context:
+        project_repo = Repo(project_path)
+        wait_until_path_exists(expect_file)
+        templated_modified_time = expect_file.lstat().st_mtime
+
+        # Incremental update, committed onto the project branch directly
+        non_templated_template_file.write_text("incremental content")
+        wait_until_returns_true(
+            lambda: is_incremental_update_commit_message(
+                project_repo.head.commit.message
+            ),
+            "Incremental update was never committed",
+        )
+        assert non_templated_expect_file.read_text() == "incremental content"
+
+        # Full update through the flexlate branches, which must not conflict with
+        # the incremental update
+        template_file.write_text("new content {{ q2 }}")
+        wait_until_file_has_content(
+            expect_file, templated_modified_time, "new content 1"
+        )
+        assert non_templated_expect_file.read_text() == "incremental content"
+        wait_until_returns_true(
+            lambda: context.sync_manager.is_idle and not context.is_back_syncing,
+            "Server did not finish syncing",
+        )
+        # Neither update was sent back to the template
+        assert non_templated_template_file.read_text() == "incremental content"
+        non_templated_modified_time = non_templated_template_file.lstat().st_mtime
+
+        # Back sync of a user commit, even one with the same message as the
+        # incremental updates
+        non_templated_expect_file.write_text("back synced content")
+        stage_and_commit_all(project_repo, INCREMENTAL_COMMIT_MESSAGE)
+        wait_until_file_has_content(
+            non_templated_template_file,
+            non_templated_modified_time,
+            "back synced content",
+        )
+        wait_until_returns_true(
+            lambda: not context.is_back_syncing, "Back sync is still running"
+        )
+
+
+def test_server_does_not_rebuild_when_content_is_unchanged(
+    copier_one_template_path: Path,
+):
+    template_path = copier_one_template_path
+    expect_file = GENERATED_FILES_DIR / "project" / "a1.txt"
+    template_file = template_path / "{{ q1 }}.txt.jinja"
+    config = FlexlateDevConfig()
+    with run_server(
+        config,
+        None,
+        template_path,
+        GENERATED_FILES_DIR,
+        no_input=True,
+        quiet_period_seconds=0.05,
+    ) as context:
+        wait_until_path_exists(expect_file)
+        scheduler = context.sync_manager.handler.scheduler
+        rebuilt_paths = []
+        rebuild = scheduler.rebuild
+        scheduler.rebuild = lambda paths, token: (
+            rebuilt_paths.append(paths),
+            rebuild(paths, token),
+        )
+
+        # Touch and save without changes
+        os.utime(template_file)
+        template_file.write_text(template_file.read_text())
+        time.sleep(1)
+        assert rebuilt_paths == []
+
+        # Cause a reload
+        modified_time = expect_file.lstat().st_mtime
+        template_file.write_text("new content {{ q2 }}")
+        wait_until_file_has_content(expect_file, modified_time, "new content 1")
+        assert rebuilt_paths == [{Path("{{ q1 }}.txt.jinja")}]
+
+
+def test_server_reloads_config_and_rebuilds_only_when_data_changes(
+    copier_one_template_path: Path,
+):
+    template_path = copier_one_template_path
+    project_path = GENERATED_FILES_DIR / "project"
+    expect_file = project_path / "a1.txt"
+    config_path = GENERATED_FILES_DIR / "flexlate-dev.yaml"
+    config = FlexlateDevConfig.load_or_create(config_path)
+    config.data["default"] = UserDataConfiguration(data=dict(q2=50))
+    config.run_configs["default"].serve = UserRunConfiguration(data_name="default")
+    config.save()
+    with run_server(
+        config,
+        None,
+        template_path,
+        GENERATED_FILES_DIR,
+        no_input=True,
+        quiet_period_seconds=0.05,
+        config_path=config_path,
+    ) as context:
+        wait_until_path_exists(expect_file)
+        assert expect_file.read_text() == "50"
+        handler = context.sync_manager.handler
+        scheduler = handler.scheduler
+        rebuilt_paths = []
+        rebuild = scheduler.rebuild
+        scheduler.rebuild = lambda paths, token: (
+            rebuilt_paths.append(paths),
+            rebuild(paths, token),
+        )
+        # Should keep using the existing project
+        untracked_file = project_path / "untracked.txt"
+        untracked_file.write_text("keep me")
+
+        # Change only the ignores
+        config.data["default"].ignore = ["ignored.txt"]
+        config.save()
+        wait_until_returns_true(
+            lambda: handler.ignores.file_is_ignored(Path("ignored.txt"), False),
+            "Config was never reloaded",
+        )
+        wait_until_returns_true(
+            lambda: context.sync_manager.is_idle, "Server did not finish syncing"
+        )
+        assert rebuilt_paths == []
+
+        # Change the data
+        modified_time = expect_file.lstat().st_mtime
+        config.data["default"].data = dict(q2=60)
+        config.save()
+        wait_until_file_has_content(expect_file, modified_time, "60")
+        assert rebuilt_paths == [{config_path.resolve()}]
+        assert untracked_file.read_text() == "keep me"
+
+
+def test_server_serves_multiple_run_configs_from_one_watcher(
+    copier_one_template_path: Path,
+):
+    template_path = copier_one_template_path
+    template_file = template_path / "{{ q1 }}.txt.jinja"
+    config = FlexlateDevConfig()
+    for name, q2 in [("one", 1), ("two", 2)]:
+        config.data[name] = UserDataConfiguration(data=dict(q2=q2))
+        config.run_configs[name] = UserRootRunConfiguration(
+            serve=UserRunConfiguration(data_name=name)
+        )
+    # Not next to the template, which is also named one
+    out_path = GENERATED_FILES_DIR / "out"
+    expect_files = [out_path / name / "project" / "a1.txt" for name in ["one", "two"]]
+    with run_server(
+        config,
+        template_path=template_path,
+        out_path=out_path,
+        no_input=True,
+        run_config_names=["one", "two"],
+    ):
+        for expect_file in expect_files:
+            wait_until_path_exists(expect_file)
+        assert [file.read_text() for file in expect_files] == ["1", "2"]
+        modified_times = [file.lstat().st_mtime for file in expect_files]
+
+        # Cause a reload
+        template_file.write_text("new content {{ q2 }}")
+
+        # Check reload of both outputs
+        for expect_file, modified_time, q2 in zip(expect_files, modified_times, [1, 2]):
+            wait_until_file_has_content(expect_file, modified_time, f"new content {q2}")
+
+
+def test_server_stages_updates_and_applies_them_in_one_step(
+    copier_one_template_path: Path,
+):
+    template_path = copier_one_template_path
+    project_path = GENERATED_FILES_DIR / "project"
+    expect_file = project_path / "a1.txt"
+    template_file = template_path / "{{ q1 }}.txt.jinja"
+    config = FlexlateDevConfig()
+    with run_server(
+        config,
+        None,
+        template_path,
+        GENERATED_FILES_DIR,
+        no_input=True,
+        staged=True,
+    ):
+        wait_until_path_exists(expect_file)
+        assert expect_file.read_text() == "1"
+        modified_time = expect_file.lstat().st_mtime
+        head_path = project_path / ".git" / "HEAD"
+        head_modified_time = head_path.lstat().st_mtime
+        project_repo = Repo(project_path)
+        num_commits = len(list(project_repo.iter_commits()))
+
+        # Cause a reload
+        template_file.write_text("new content {{ q2 }}")
+
+        # Check reload
+        wait_until_file_has_content(expect_file, modified_time, "new content 1")
+        assert len(list(project_repo.iter_commits())) > num_commits
+        assert not project_repo.is_dirty(untracked_files=True)
+        # Flexlate switched branches in the staging clone rather than the project
+        assert head_path.lstat().st_mtime == head_modified_time
+        assert (
+            get_staging_path(project_path) / "a1.txt"
+        ).read_text() == "new content 1"
+
+
 def test_server_ignores_changes_to_ignored_files(
     copier_one_template_path: Path,
 ):
@@ -325,10 +648,9 @@ def test_server_back_syncs_changes_from_project_to_template_copier(
 
         # Check back sync
         wait_until_file_has_content(
-            # After fixing the TODO about adding new lines, set this back to "new content"
             non_templated_template_file,
             non_templated_modified_time,
-            "new content\n",
+            "new content",
         )
 
         wait_until_returns_true(
@@ -375,10 +697,9 @@ def test_server_back_syncs_changes_from_project_to_template_with_subdir_copier(
 
         # Check back sync
         wait_until_file_has_content(
-            # After fixing the TODO about adding new lines, set this back to "new content"
             non_templated_template_file,
             non_templated_modified_time,
-            "new content\n",
+            "new content",
         )
 
         wait_until_returns_true(
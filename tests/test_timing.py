@@ -0,0 +1,88 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from flexlate_dev.config import FlexlateDevConfig
+from flexlate_dev.exc import CancelledException
+from flexlate_dev.server.main import run_server
+from flexlate_dev.timing import Timeline, timeline
+from tests.config import GENERATED_FILES_DIR
+from tests.fixtures.template_path import *
+from tests.waitutils import wait_until_file_has_content, wait_until_path_exists
+
+
+def test_build_collects_phases_for_summary():
+    tl = Timeline()
+    with tl.build("Rebuild") as build:
+        with tl.phase("pre_check"):
+            pass
+        with tl.phase("flexlate update"):
+            pass
+    assert [phase.name for phase in build.phases] == ["pre_check", "flexlate update"]
+    summary = build.summary(1.5, "finished")
+    assert summary.startswith("Rebuild finished in 1.50s (pre_check ")
+    assert "flexlate update" in summary
+
+
+def test_build_outcome_is_cancelled_when_cancelled():
+    tl = Timeline()
+    tl.start_recording()
+    with pytest.raises(CancelledException):
+        with tl.build("Rebuild"):
+            raise CancelledException()
+    events = tl.to_chrome_trace()["traceEvents"]
+    build_event = [event for event in events if event["name"] == "Rebuild"][0]
+    assert build_event["args"]["outcome"] == "cancelled"
+
+
+def test_phases_are_only_kept_for_export_while_recording():
+    tl = Timeline()
+    with tl.phase("not recorded"):
+        pass
+    tl.start_recording()
+    with tl.phase("recorded", detail="something"):
+        pass
+    tl.stop_recording()
+
+    events = tl.to_chrome_trace()["traceEvents"]
+    complete_events = [event for event in events if event["ph"] == "X"]
+    assert len(complete_events) == 1
+    event = complete_events[0]
+    assert event["name"] == "recorded"
+    assert event["args"] == dict(detail="something")
+    assert event["dur"] >= 0
+    thread_name_events = [event for event in events if event["ph"] == "M"]
+    assert thread_name_events[0]["tid"] == event["tid"]
+
+
+def test_server_rebuild_phases_are_exported_as_chrome_trace(
+    copier_one_template_path: Path,
+):
+    template_path = copier_one_template_path
+    expect_file = GENERATED_FILES_DIR / "project" / "a1.txt"
+    template_file = template_path / "{{ q1 }}.txt.jinja"
+    trace_path = GENERATED_FILES_DIR / "trace.json"
+    config = FlexlateDevConfig()
+    timeline.start_recording()
+    try:
+        with run_server(
+            config, None, template_path, GENERATED_FILES_DIR, no_input=True
+        ):
+            wait_until_path_exists(expect_file)
+            modified_time = expect_file.lstat().st_mtime
+            template_file.write_text("new content {{ q2 }}")
+            wait_until_file_has_content(expect_file, modified_time, "new content 1")
+    finally:
+        timeline.stop_recording()
+    timeline.save_chrome_trace(trace_path)
+
+    trace = json.loads(trace_path.read_text())
+    names = {event["name"] for event in trace["traceEvents"]}
+    assert {
+        "Initial build",
+        "flexlate init",
+        "Rebuild",
+        "watch delay",
+        "flexlate update",
+    }.issubset(names)
@@ -1,12 +1,18 @@
+from typing import Dict, Tuple
 from unittest.mock import patch
 
 import jinja2
+import pytest
 from flexlate import branch_update
 from git import Repo
 
-from flexlate_dev.config import FlexlateDevConfig
+from flexlate_dev import project_ops
+from flexlate_dev.config import FlexlateDevConfig, FullRunConfiguration
+from flexlate_dev.exc import CancelledException
 from flexlate_dev.external_command_type import ExternalCLICommandType
+from flexlate_dev.gitutils import stage_and_commit_all
 from flexlate_dev.project_ops import initialize_project_get_folder, update_project
+from flexlate_dev.staging import get_staging_path
 from flexlate_dev.user_runner import UserRootRunConfiguration, UserRunConfiguration
 from tests.fixtures.jinja_env import jinja_env
 from tests.fixtures.template_path import *
@@ -208,3 +214,100 @@ def test_update_project_does_not_run_post_update_on_conflict_abort(
     # Check that only pre-update was run, so there is a single date in the file
     lines = extra_file.read_text().splitlines()
     assert len(lines) == 1
+
+
+def test_staged_update_removes_staging_clone_when_update_fails(
+    copier_one_template_path: Path, jinja_env: jinja2.Environment
+):
+    project_path = GENERATED_FILES_DIR / "project"
+    expect_file = project_path / "a1.txt"
+    template_file = copier_one_template_path / "{{ q1 }}.txt.jinja"
+    config, run_config = _init_project(copier_one_template_path, jinja_env)
+    staging_path = get_staging_path(project_path)
+
+    template_file.write_text("new content {{ q2 }}")
+    update_project(
+        project_path,
+        config,
+        run_config,
+        no_input=True,
+        jinja_env=jinja_env,
+        staged=True,
+    )
+    assert expect_file.read_text() == "new content 1"
+    # Kept to be reused by the next update
+    assert staging_path.exists()
+
+    template_file.write_text("second new content {{ q2 }}")
+    with patch.object(project_ops.fxt, "update", side_effect=ValueError("failed")):
+        with pytest.raises(ValueError):
+            update_project(
+                project_path,
+                config,
+                run_config,
+                no_input=True,
+                jinja_env=jinja_env,
+                staged=True,
+            )
+    assert not staging_path.exists()
+    assert expect_file.read_text() == "new content 1"
+
+
+def test_staged_update_cancelled_by_new_commits_leaves_project_branches(
+    copier_one_template_path: Path, jinja_env: jinja2.Environment
+):
+    project_path = GENERATED_FILES_DIR / "project"
+    expect_file = project_path / "a1.txt"
+    template_file = copier_one_template_path / "{{ q1 }}.txt.jinja"
+    config, run_config = _init_project(copier_one_template_path, jinja_env)
+    repo = Repo(project_path)
+    branch_name = repo.active_branch.name
+    original_update = project_ops.fxt.update
+
+    def update_then_commit_to_project(*args, **kwargs):
+        original_update(*args, **kwargs)
+        (project_path / "manual.txt").write_text("manual")
+        stage_and_commit_all(repo, "Manual change while staging")
+
+    template_file.write_text("new content {{ q2 }}")
+    branch_commits = _get_branch_commits(repo)
+    with patch.object(project_ops.fxt, "update", update_then_commit_to_project):
+        with pytest.raises(CancelledException):
+            update_project(
+                project_path,
+                config,
+                run_config,
+                no_input=True,
+                jinja_env=jinja_env,
+                staged=True,
+            )
+    assert not get_staging_path(project_path).exists()
+    assert expect_file.read_text() == "1"
+    branch_commits_after = _get_branch_commits(repo)
+    assert branch_commits_after.pop(branch_name) != branch_commits.pop(branch_name)
+    # The flexlate branches are only brought in along with the update
+    assert branch_commits_after == branch_commits
+
+
+def _init_project(
+    template_path: Path, jinja_env: jinja2.Environment
+) -> Tuple[FlexlateDevConfig, FullRunConfiguration]:
+    config = FlexlateDevConfig()
+    config.settings.custom_config_folder = GENERATED_FILES_DIR
+    config.settings.config_name = "flexlate-dev"
+    run_config = config.get_full_run_config(ExternalCLICommandType.SERVE, None)
+    initialize_project_get_folder(
+        template_path,
+        GENERATED_FILES_DIR,
+        config,
+        run_config=run_config,
+        no_input=True,
+        data=None,
+        save=True,
+        jinja_env=jinja_env,
+    )
+    return config, run_config
+
+
+def _get_branch_commits(repo: Repo) -> Dict[str, str]:
+    return {head.name: head.commit.hexsha for head in repo.heads}
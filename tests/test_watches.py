@@ -0,0 +1,138 @@
+import shutil
+from pathlib import Path
+from typing import Callable, List
+
+import pytest
+from git import Repo
+from watchdog.events import FileSystemEvent, FileSystemEventHandler
+from watchdog.observers import Observer
+
+from flexlate_dev.ignore import IgnoreSpecification, TemplateIgnores
+from flexlate_dev.server.watches import TemplateWatches, plan_watches
+from tests.config import GENERATED_FILES_DIR
+from tests.waitutils import wait_until_returns_true
+
+WATCH_ROOT = GENERATED_FILES_DIR / "watched"
+
+
+class RecordingHandler(FileSystemEventHandler):
+    def __init__(self):
+        super().__init__()
+        self.events: List[FileSystemEvent] = []
+
+    def on_any_event(self, event: FileSystemEvent):
+        self.events.append(event)
+
+    def saw_path(self, path: Path) -> bool:
+        return any(event.src_path == str(path) for event in self.events)
+
+
+@pytest.fixture
+def watch_root() -> Path:
+    for folder in ["src/nested", "docs", "node_modules/package", "src/node_modules"]:
+        (WATCH_ROOT / folder).mkdir(parents=True)
+    yield WATCH_ROOT
+    shutil.rmtree(WATCH_ROOT, ignore_errors=True)
+
+
+def _ignore_node_modules() -> Callable[[Path], bool]:
+    spec = IgnoreSpecification(ignore_list=["node_modules/"])
+    return spec.directory_is_fully_ignored
+
+
+def test_plan_watches_skips_ignored_directories(watch_root: Path):
+    watches = dict(plan_watches(watch_root, _ignore_node_modules()))
+    assert watches == {
+        watch_root: False,
+        watch_root / "src": False,
+        watch_root / "src" / "nested": True,
+        watch_root / "docs": True,
+    }
+
+
+def test_plan_watches_falls_back_to_recursive_after_max_watches(watch_root: Path):
+    watches = dict(plan_watches(watch_root, _ignore_node_modules(), max_watches=3))
+    assert watches == {
+        watch_root: False,
+        watch_root / "src": True,
+        watch_root / "docs": True,
+    }
+
+
+def test_plan_watches_applies_nested_gitignores_and_exclude(watch_root: Path):
+    Repo.init(watch_root)
+    (watch_root / ".git" / "info").mkdir(exist_ok=True)
+    (watch_root / ".git" / "info" / "exclude").write_text("docs/\n")
+    (watch_root / "src" / ".gitignore").write_text("node_modules/\n")
+    ignores = TemplateIgnores(watch_root)
+    watches = dict(plan_watches(watch_root, ignores.directory_is_fully_ignored))
+    assert watches == {
+        watch_root: False,
+        watch_root / "node_modules": True,
+        watch_root / "src": False,
+        watch_root / "src" / "nested": True,
+    }
+
+
+def test_template_watches_add_new_directories_and_skip_ignored(watch_root: Path):
+    observer = Observer()
+    handler = RecordingHandler()
+    spec = IgnoreSpecification(ignore_list=["node_modules/"])
+    watches = TemplateWatches(
+        observer, handler, watch_root, spec.directory_is_fully_ignored
+    )
+    watches.schedule()
+    observer.start()
+    try:
+        ignored_file = watch_root / "node_modules" / "package" / "index.js"
+        ignored_file.write_text("ignored")
+
+        new_folder = watch_root / "new"
+        new_folder.mkdir()
+        wait_until_returns_true(
+            lambda: new_folder in watches.watched_directories,
+            "New directory never watched",
+        )
+        new_file = new_folder / "a.txt"
+        new_file.write_text("content")
+        wait_until_returns_true(
+            lambda: handler.saw_path(new_file), "Never saw change in new directory"
+        )
+
+        shutil.rmtree(new_folder)
+        wait_until_returns_true(
+            lambda: new_folder not in watches.watched_directories,
+            "Deleted directory still watched",
+        )
+    finally:
+        observer.stop()
+        observer.join()
+
+    assert not any("node_modules" in event.src_path for event in handler.events)
+
+
+def test_template_watches_refresh_after_ignores_change(watch_root: Path):
+    observer = Observer()
+    specs = [IgnoreSpecification(ignore_list=["node_modules/"])]
+    watches = TemplateWatches(
+        observer,
+        RecordingHandler(),
+        watch_root,
+        lambda path: specs[-1].directory_is_fully_ignored(path),
+    )
+    watches.schedule()
+    assert watches.watched_directories[watch_root / "docs"]
+
+    specs.append(IgnoreSpecification(ignore_list=["docs/"]))
+    watches.refresh()
+    assert watches.watched_directories == {
+        watch_root: False,
+        watch_root / "src": True,
+        watch_root / "node_modules": True,
+    }
+
+    specs.append(IgnoreSpecification(ignore_list=["node_modules/"]))
+    watches.refresh()
+    assert watches.watched_directories == dict(
+        plan_watches(watch_root, _ignore_node_modules())
+    )
@@ -49,13 +49,14 @@ def wait_until_returns_true(
     exit_callback: Callable[[], bool],
     error_message: str,
     timeout: int = DEFAULT_TIMEOUT,
+    poll_interval: float = 0.1,
 ):
     start_time = timeit.default_timer()
     while timeit.default_timer() - start_time < timeout:
         should_exit = exit_callback()
         if should_exit:
             return
-        time.sleep(0.1)
+        time.sleep(poll_interval)
     # Timed out
     raise TestTimeoutException(f"{error_message} after {timeout}s")
 